@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+圖片解碼基準測試
+比較完整解碼（舊版 /predict 路徑）與解碼時縮小（JPEG draft）在大圖上的端對端延遲：
+解碼 → 推論 → 後處理（座標換算回原圖）
+
+使用方式：
+    python scripts/bench_decode.py --weights runs/train/exp/weights/best.pt
+    python scripts/bench_decode.py --images /path/to/photos --repeat 10
+"""
+
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "api"))
+
+from decoding import decode_image  # noqa: E402
+from postprocess import extract_arrays, scale_arrays  # noqa: E402
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg'}
+
+
+def load_images(image_dir: str, limit: int, size: Tuple[int, int]) -> List[Tuple[str, bytes]]:
+    """讀取 JPEG 檔內容，未指定目錄時產生指定尺寸的合成照片"""
+    if image_dir:
+        paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        return [(p.name, p.read_bytes()) for p in paths[:limit]]
+
+    width, height = size
+    rng = np.random.default_rng(0)
+    images = []
+    for i in range(limit):
+        # 平滑漸層加雜訊，壓縮率接近真實照片
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 4, (height, width, 3)).astype(np.float32)
+        pixels = np.clip(gradient + noise + i * 10, 0, 255).astype(np.uint8)
+
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        images.append((f"synthetic_{i}_{width}x{height}.jpg", buffer.getvalue()))
+    return images
+
+
+def time_path(run: Callable[[], object], repeat: int) -> float:
+    """重複執行並回傳中位數延遲（毫秒）"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies))
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='圖片解碼基準測試')
+    parser.add_argument('--weights', type=str, default='runs/train/exp/weights/best.pt',
+                        help='模型權重檔路徑')
+    parser.add_argument('--images', type=str, default=None,
+                        help='JPEG 圖片目錄（未指定時產生合成照片）')
+    parser.add_argument('--size', type=str, default='4000x3000',
+                        help='合成照片尺寸（寬x高，預設約 12 MP）')
+    parser.add_argument('--limit', type=int, default=5,
+                        help='最多測試幾張圖片')
+    parser.add_argument('--imgsz', type=int, default=640,
+                        help='模型輸入尺寸')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='每張圖片重複次數')
+    parser.add_argument('--conf', type=float, default=0.25,
+                        help='信心度閾值')
+    args = parser.parse_args()
+
+    if not Path(args.weights).exists():
+        print(f"[✗] 找不到模型檔: {args.weights}")
+        sys.exit(1)
+
+    from ultralytics import YOLO
+
+    model = YOLO(args.weights)
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    images = load_images(args.images, args.limit, (width, height))
+    print(f"[載入] {len(images)} 張圖片，模型輸入尺寸 {args.imgsz}")
+
+    def pipeline(image_data: bytes, target_size):
+        image, (orig_w, orig_h) = decode_image(image_data, target_size)
+        result = model([image], imgsz=args.imgsz, conf=args.conf, verbose=False)[0]
+        return scale_arrays(extract_arrays(result), orig_w / image.width, orig_h / image.height)
+
+    # 暖機
+    pipeline(images[0][1], None)
+    pipeline(images[0][1], args.imgsz)
+
+    print("=" * 86)
+    print(f"{'圖片':<28} {'解碼(完整)':>11} {'解碼(draft)':>12} {'端對端(完整)':>13} "
+          f"{'端對端(draft)':>14} {'加速':>6}")
+    print("=" * 86)
+
+    totals = np.zeros(4)
+    for name, image_data in images:
+        row = np.array([
+            time_path(lambda: decode_image(image_data, None), args.repeat),
+            time_path(lambda: decode_image(image_data, args.imgsz), args.repeat),
+            time_path(lambda: pipeline(image_data, None), args.repeat),
+            time_path(lambda: pipeline(image_data, args.imgsz), args.repeat)
+        ])
+        totals += row
+        print(f"{name[:28]:<28} {row[0]:>11.1f} {row[1]:>12.1f} {row[2]:>13.1f} "
+              f"{row[3]:>14.1f} {row[2] / row[3]:>5.1f}x")
+
+    print("=" * 86)
+    mean = totals / len(images)
+    print(f"{'平均 (ms)':<28} {mean[0]:>11.1f} {mean[1]:>12.1f} {mean[2]:>13.1f} "
+          f"{mean[3]:>14.1f} {mean[2] / mean[3]:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+偵測範圍控制基準測試
+在擁擠場景（大量偵測）比較全圖全類別推論與 classes / max_det / roi 的端對端耗時
+（推論 + NMS + 後處理 + JSON 序列化），並與「全部偵測完再於 JSON 階段過濾」比較
+
+使用方式：
+    python scripts/bench_filters.py --weights runs/train/exp/weights/best.pt --source crowd.jpg
+    python scripts/bench_filters.py --classes 0 --max-det 20 --roi 320,180,960,540 --repeat 30
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from ultralytics import YOLO
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "api"))
+
+from filters import crop_region, parse_region  # noqa: E402
+from postprocess import FORMAT_OBJECTS, build_columns, extract_arrays, render_detections  # noqa: E402
+from tiling import offset_arrays  # noqa: E402
+
+
+def load_scene(source: Optional[str], mosaic: int) -> np.ndarray:
+    """
+    讀取測試圖片（BGR），並排成 mosaic x mosaic 的拼貼模擬擁擠場景
+
+    未指定 source 時以隨機雜訊代替（只適合量測流程耗時，偵測數取決於模型）
+    """
+    if source:
+        import cv2
+        image = cv2.imread(source)
+        if image is None:
+            print(f"[✗] 無法讀取圖片: {source}")
+            sys.exit(1)
+    else:
+        image = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+
+    if mosaic > 1:
+        image = np.tile(image, (mosaic, mosaic, 1))
+    return np.ascontiguousarray(image)
+
+
+def run_request(
+    model: YOLO,
+    image: np.ndarray,
+    imgsz: int,
+    conf: float,
+    classes=None,
+    max_det: int = 300,
+    roi=None,
+    post_filter: Optional[Dict[str, Any]] = None
+) -> int:
+    """模擬一次 /predict：推論、後處理與序列化，回傳偵測數"""
+    height, width = image.shape[:2]
+    offset = (0, 0)
+    if roi is not None:
+        image, offset = crop_region(image, (width, height), roi)
+
+    result = model.predict(image, imgsz=imgsz, conf=conf, classes=classes, max_det=max_det, verbose=False)[0]
+    arrays = offset_arrays(extract_arrays(result), *offset)
+    columns = build_columns(arrays, model.names)
+    detections = render_detections(columns, response_format=FORMAT_OBJECTS)
+
+    if post_filter:
+        # 舊作法：全部偵測完、組好 dict 之後才過濾
+        wanted = post_filter.get("classes")
+        detections = [d for d in detections if wanted is None or d["class_id"] in wanted]
+        detections = sorted(detections, key=lambda d: -d["confidence"])[:post_filter.get("max_det", 300)]
+
+    json.dumps(detections)
+    return len(detections)
+
+
+def time_it(func: Callable[[], int], repeat: int):
+    """回傳 (中位數耗時毫秒, 偵測數)"""
+    count = func()  # 暖機
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples)), count
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='偵測範圍控制基準測試')
+    parser.add_argument('--weights', type=str, default='runs/train/exp/weights/best.pt',
+                        help='模型權重路徑')
+    parser.add_argument('--source', type=str, default=None,
+                        help='擁擠場景圖片（預設隨機雜訊）')
+    parser.add_argument('--mosaic', type=int, default=1,
+                        help='把圖片拼成 N x N 以增加偵測數')
+    parser.add_argument('--imgsz', type=int, default=640,
+                        help='模型輸入尺寸')
+    parser.add_argument('--conf', type=float, default=0.25,
+                        help='信心度閾值')
+    parser.add_argument('--classes', type=int, nargs='+', default=[0],
+                        help='類別過濾情境使用的類別 ID')
+    parser.add_argument('--max-det', type=int, default=20,
+                        help='數量上限情境的 max_det')
+    parser.add_argument('--roi', type=str, default=None,
+                        help='感興趣區域 x0,y0,x1,y1（預設為圖片中央 1/4 面積）')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='每種情境重複次數')
+    args = parser.parse_args()
+
+    model = YOLO(args.weights)
+    image = load_scene(args.source, args.mosaic)
+    height, width = image.shape[:2]
+    roi = parse_region(args.roi) if args.roi else (width // 4, height // 4, width * 3 // 4, height * 3 // 4)
+
+    def request(**kwargs):
+        return lambda: run_request(model, image, args.imgsz, args.conf, **kwargs)
+
+    scenarios = [
+        ("全圖全類別", request()),
+        ("classes（JSON 後過濾）", request(post_filter={"classes": set(args.classes)})),
+        ("classes（NMS 內過濾）", request(classes=args.classes)),
+        ("max_det（JSON 後截斷）", request(post_filter={"max_det": args.max_det})),
+        ("max_det（NMS 內截斷）", request(max_det=args.max_det)),
+        ("roi（推論前裁切）", request(roi=roi)),
+        ("classes + max_det + roi", request(classes=args.classes, max_det=args.max_det, roi=roi)),
+    ]
+
+    print(f"圖片: {width}x{height}，模型: {args.weights}，imgsz={args.imgsz}，conf={args.conf}")
+    print(f"classes={args.classes}，max_det={args.max_det}，roi={roi}")
+    print("=" * 72)
+    print(f"{'情境':<28} {'偵測數':>8} {'中位數 (ms)':>14} {'相對全圖':>12}")
+    print("=" * 72)
+
+    baseline_ms = None
+    for name, func in scenarios:
+        elapsed_ms, count = time_it(func, args.repeat)
+        baseline_ms = baseline_ms or elapsed_ms
+        print(f"{name:<28} {count:>8} {elapsed_ms:>14.2f} {baseline_ms / elapsed_ms:>11.2f}x")
+
+    print("=" * 72)
+    print("[✓] 基準測試完成")
+
+
+if __name__ == "__main__":
+    main()
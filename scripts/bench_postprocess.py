@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+偵測結果後處理微基準測試
+比較逐框切片（舊版 /predict 迴圈）與向量化後處理在不同偵測數量下的耗時
+
+使用方式：
+    python scripts/bench_postprocess.py
+    python scripts/bench_postprocess.py --counts 10 100 1000 --repeat 200
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "api"))
+
+from postprocess import FORMAT_COLUMNAR, FORMAT_OBJECTS, format_detections  # noqa: E402
+
+CLASS_NAMES = {i: str(i) for i in range(10)}
+
+
+def make_result(num_boxes: int, width: int = 1280, height: int = 720, seed: int = 0) -> Results:
+    """建立含 num_boxes 個隨機偵測框的 Results"""
+    rng = np.random.default_rng(seed)
+    x1 = rng.uniform(0, width - 50, num_boxes)
+    y1 = rng.uniform(0, height - 50, num_boxes)
+    w = rng.uniform(5, 50, num_boxes)
+    h = rng.uniform(5, 50, num_boxes)
+    conf = rng.uniform(0.25, 1.0, num_boxes)
+    cls = rng.integers(0, len(CLASS_NAMES), num_boxes)
+
+    data = np.stack([x1, y1, x1 + w, y1 + h, conf, cls], axis=1).astype(np.float32)
+    orig_img = np.zeros((height, width, 3), dtype=np.uint8)
+
+    return Results(orig_img, path="bench.jpg", names=CLASS_NAMES, boxes=torch.from_numpy(data))
+
+
+def legacy_format(result) -> List[Dict[str, Any]]:
+    """舊版 /predict 的逐框後處理（作為比較基準）"""
+    detections = []
+    boxes = result.boxes
+
+    for i in range(len(boxes)):
+        box = boxes[i]
+
+        class_id = int(box.cls[0])
+        confidence = float(box.conf[0])
+        bbox_xyxy = box.xyxy[0].tolist()
+        bbox_xywh = box.xywh[0].tolist()
+
+        detections.append({
+            "class_id": class_id,
+            "class_name": CLASS_NAMES.get(class_id, f"class_{class_id}"),
+            "confidence": round(confidence, 4),
+            "bbox": {
+                "x1": round(bbox_xyxy[0], 2),
+                "y1": round(bbox_xyxy[1], 2),
+                "x2": round(bbox_xyxy[2], 2),
+                "y2": round(bbox_xyxy[3], 2),
+                "center_x": round(bbox_xywh[0], 2),
+                "center_y": round(bbox_xywh[1], 2),
+                "width": round(bbox_xywh[2], 2),
+                "height": round(bbox_xywh[3], 2)
+            }
+        })
+
+    return detections
+
+
+def time_it(func, repeat: int) -> float:
+    """回傳單次呼叫的中位數耗時（毫秒）"""
+    func()  # 暖機
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='偵測結果後處理微基準測試')
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000],
+                        help='每張圖片的偵測數量')
+    parser.add_argument('--repeat', type=int, default=100,
+                        help='每種情境重複次數')
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print(f"{'偵測數':>8} {'逐框 (ms)':>12} {'向量化 (ms)':>14} {'columnar (ms)':>15} {'加速':>8}")
+    print("=" * 72)
+
+    for count in args.counts:
+        result = make_result(count)
+
+        # 確認向量化輸出與舊版完全一致
+        if format_detections(result, CLASS_NAMES, response_format=FORMAT_OBJECTS) != legacy_format(result):
+            print(f"[✗] {count} 個偵測時輸出與舊版不一致")
+            sys.exit(1)
+
+        legacy_ms = time_it(lambda: legacy_format(result), args.repeat)
+        vector_ms = time_it(
+            lambda: format_detections(result, CLASS_NAMES, response_format=FORMAT_OBJECTS),
+            args.repeat
+        )
+        columnar_ms = time_it(
+            lambda: format_detections(result, CLASS_NAMES, response_format=FORMAT_COLUMNAR),
+            args.repeat
+        )
+
+        print(f"{count:>8} {legacy_ms:>12.3f} {vector_ms:>14.3f} {columnar_ms:>15.3f} "
+              f"{legacy_ms / vector_ms:>7.1f}x")
+
+    print("=" * 72)
+    print("[✓] 向量化輸出與逐框輸出一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+推論後端一致性檢查
+以 PyTorch 後端為基準，比對 ONNX Runtime / OpenVINO 的偵測框是否在容許誤差內
+
+使用方式：
+    python scripts/check_backend_parity.py --weights runs/train/exp/weights/best.pt \\
+        --images dataset/MBB_Dataset/images/val
+
+任一後端超出容許誤差時以非零狀態碼結束，可直接放進 CI。
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "api"))
+
+from backends import BACKEND_TORCH, available_backends, load_backend  # noqa: E402
+from postprocess import extract_arrays  # noqa: E402
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def load_images(image_dir: str, limit: int) -> List[Tuple[str, Image.Image]]:
+    """讀取比對用圖片，未指定目錄時產生隨機圖片"""
+    if image_dir:
+        paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        return [(p.name, Image.open(p).convert('RGB')) for p in paths[:limit]]
+
+    rng = np.random.default_rng(0)
+    return [
+        (f"random_{i}", Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)))
+        for i in range(limit)
+    ]
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """單一框與多個框的 IoU（xyxy）"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def compare(reference: Dict[str, np.ndarray], candidate: Dict[str, np.ndarray]) -> Dict[str, float]:
+    """
+    以貪婪 IoU 配對比較兩組偵測結果
+
+    Returns:
+        {'missing': 未配對數, 'max_box_diff': 最大座標差（像素）, 'max_conf_diff': 最大信心度差}
+    """
+    unmatched = list(range(len(candidate['cls'])))
+    max_box_diff = 0.0
+    max_conf_diff = 0.0
+    missing = 0
+
+    for i in np.argsort(-reference['conf']):
+        same_class = [j for j in unmatched if candidate['cls'][j] == reference['cls'][i]]
+        if not same_class:
+            missing += 1
+            continue
+
+        ious = box_iou(reference['xyxy'][i], candidate['xyxy'][same_class])
+        j = same_class[int(np.argmax(ious))]
+        unmatched.remove(j)
+
+        max_box_diff = max(max_box_diff, float(np.abs(reference['xyxy'][i] - candidate['xyxy'][j]).max()))
+        max_conf_diff = max(max_conf_diff, float(abs(reference['conf'][i] - candidate['conf'][j])))
+
+    return {
+        'missing': missing + len(unmatched),
+        'max_box_diff': max_box_diff,
+        'max_conf_diff': max_conf_diff
+    }
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='推論後端一致性檢查')
+    parser.add_argument('--weights', type=str, default='runs/train/exp/weights/best.pt',
+                        help='.pt 權重檔路徑')
+    parser.add_argument('--images', type=str, default=None,
+                        help='比對用圖片目錄（未指定時使用隨機圖片）')
+    parser.add_argument('--limit', type=int, default=20,
+                        help='最多比對幾張圖片')
+    parser.add_argument('--backends', type=str, nargs='+', default=None,
+                        help='要比對的後端（預設為所有已安裝的後端）')
+    parser.add_argument('--conf', type=float, default=0.25,
+                        help='信心度閾值')
+    parser.add_argument('--iou', type=float, default=0.45,
+                        help='NMS IOU 閾值')
+    parser.add_argument('--box-tolerance', type=float, default=2.0,
+                        help='座標容許誤差（像素）')
+    parser.add_argument('--conf-tolerance', type=float, default=0.02,
+                        help='信心度容許誤差')
+    args = parser.parse_args()
+
+    if not Path(args.weights).exists():
+        print(f"[✗] 找不到模型檔: {args.weights}")
+        sys.exit(1)
+
+    backends = [b for b in (args.backends or available_backends()) if b != BACKEND_TORCH]
+    if not backends:
+        print("[⚠] 沒有可比對的非 PyTorch 後端（請安裝 onnxruntime 或 openvino）")
+        sys.exit(0)
+
+    images = load_images(args.images, args.limit)
+    print(f"[載入] {len(images)} 張圖片，比對後端: {', '.join(backends)}")
+
+    def run(model) -> List[Dict[str, np.ndarray]]:
+        return [
+            extract_arrays(model([image], conf=args.conf, iou=args.iou, verbose=False)[0])
+            for _, image in images
+        ]
+
+    reference = run(load_backend(args.weights, BACKEND_TORCH))
+    failed = False
+
+    print("=" * 72)
+    print(f"{'後端':<14} {'偵測數':>8} {'未配對':>8} {'最大座標差(px)':>16} {'最大信心度差':>14}")
+    print("=" * 72)
+
+    for backend in backends:
+        outputs = run(load_backend(args.weights, backend))
+        stats = [compare(ref, out) for ref, out in zip(reference, outputs)]
+
+        missing = sum(s['missing'] for s in stats)
+        box_diff = max((s['max_box_diff'] for s in stats), default=0.0)
+        conf_diff = max((s['max_conf_diff'] for s in stats), default=0.0)
+        total = sum(len(o['cls']) for o in outputs)
+
+        ok = missing == 0 and box_diff <= args.box_tolerance and conf_diff <= args.conf_tolerance
+        failed = failed or not ok
+
+        print(f"{backend:<14} {total:>8} {missing:>8} {box_diff:>16.3f} {conf_diff:>14.4f}  "
+              f"{'✓' if ok else '✗'}")
+
+    print("=" * 72)
+
+    if failed:
+        print("[✗] 有後端的偵測結果超出容許誤差")
+        sys.exit(1)
+
+    print("[✓] 所有後端的偵測結果一致")
+
+
+if __name__ == "__main__":
+    main()
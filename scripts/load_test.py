@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+偵測 API 負載測試
+對本機伺服器以固定並行數持續送出 /predict 與 /predict/batch 請求，
+回報各情境的 p50/p95/p99 延遲、RPS 與錯誤率，並寫出 JSON 供不同 commit 之間比較
+
+使用方式：
+    python scripts/load_test.py --concurrency 8 --duration 30
+    python scripts/load_test.py --mix "predict:640x480=3,predict:4000x3000=1,batch:640x480=1" \\
+        --output runs/load/after.json --compare runs/load/before.json
+
+情境格式為 endpoint:寬x高[=權重]，endpoint 為 predict 或 batch。
+圖片以固定亂數種子合成，同樣參數在不同 commit 上送出的請求內容一致。
+"""
+
+import argparse
+import io
+import json
+import random
+import struct
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import requests
+from PIL import Image
+
+ENDPOINTS = {"predict": "/predict", "batch": "/predict/batch"}
+
+# 比較時視為退步的指標與方向（1 表示數值越大越差）
+COMPARE_METRICS = {"p50_ms": 1, "p95_ms": 1, "p99_ms": 1, "rps": -1}
+
+
+@dataclass
+class Scenario:
+    """一種請求：端點、圖片尺寸與抽樣權重"""
+    endpoint: str
+    width: int
+    height: int
+    weight: float = 1.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.endpoint}:{self.width}x{self.height}"
+
+
+@dataclass
+class Sample:
+    """單一請求的量測結果"""
+    scenario: str
+    latency_ms: float
+    images: int
+    ok: bool
+    rejected: bool
+
+
+def parse_mix(spec: str) -> List[Scenario]:
+    """解析 --mix，例如 "predict:640x480=3,batch:1920x1080=1" """
+    scenarios = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        weight = 1.0
+        if "=" in part:
+            part, weight_text = part.split("=", 1)
+            weight = float(weight_text)
+        endpoint, size = part.split(":", 1)
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"未知的端點: {endpoint}（可用: {', '.join(ENDPOINTS)}）")
+        width, height = (int(v) for v in size.lower().split("x"))
+        scenarios.append(Scenario(endpoint, width, height, weight))
+
+    if not scenarios:
+        raise ValueError("--mix 至少需要一個情境")
+    return scenarios
+
+
+def synthesize_jpeg(width: int, height: int, seed: int) -> bytes:
+    """產生固定內容的合成照片（平滑漸層加雜訊，壓縮率接近真實照片）"""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 4, (height, width, 3)).astype(np.float32)
+    pixels = np.clip(gradient + noise + seed % 64, 0, 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_unique(jpeg: bytes, counter: int) -> bytes:
+    """
+    在 SOI 之後插入 COM 區段，讓每次上傳的位元組不同（避開伺服器的結果快取），
+    解碼後的像素不變
+    """
+    comment = f"load-test {counter}".encode()
+    segment = b"\xff\xfe" + struct.pack(">H", len(comment) + 2) + comment
+    return jpeg[:2] + segment + jpeg[2:]
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    """彙整一組量測結果（延遲只計入成功的請求）"""
+    latencies = [s.latency_ms for s in samples if s.ok]
+    errors = sum(1 for s in samples if not s.ok and not s.rejected)
+    rejected = sum(1 for s in samples if s.rejected)
+    total = len(samples)
+
+    return {
+        "requests": total,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "rejected": rejected,
+        "error_rate": round((errors + rejected) / total, 4) if total else 0.0,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "images_per_sec": round(sum(s.images for s in samples if s.ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(float(np.mean(latencies)), 2) if latencies else 0.0,
+        "max_ms": round(max(latencies), 2) if latencies else 0.0
+    }
+
+
+class LoadTest:
+    """以固定並行數的執行緒持續送出請求，直到時間結束"""
+
+    def __init__(self, args: argparse.Namespace, scenarios: List[Scenario]):
+        self.args = args
+        self.scenarios = scenarios
+        self.weights = [s.weight for s in scenarios]
+        self.images = {
+            (s.width, s.height): synthesize_jpeg(s.width, s.height, args.seed)
+            for s in scenarios
+        }
+        self.samples: List[Sample] = []
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def _payload(self, scenario: Scenario) -> bytes:
+        jpeg = self.images[(scenario.width, scenario.height)]
+        if self.args.allow_cache:
+            return jpeg
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        return make_unique(jpeg, counter)
+
+    def _request(self, session: requests.Session, scenario: Scenario) -> Sample:
+        params = {"conf_threshold": self.args.conf}
+        if self.args.imgsz:
+            params["imgsz"] = self.args.imgsz
+
+        if scenario.endpoint == "batch":
+            images = self.args.batch_files
+            files = [
+                ("files", (f"img{i}.jpg", self._payload(scenario), "image/jpeg"))
+                for i in range(images)
+            ]
+        else:
+            images = 1
+            files = {"file": ("img.jpg", self._payload(scenario), "image/jpeg")}
+
+        url = self.args.url.rstrip("/") + ENDPOINTS[scenario.endpoint]
+        start = time.perf_counter()
+        try:
+            response = session.post(url, files=files, params=params, timeout=self.args.timeout)
+            ok = response.status_code == 200
+            if ok and scenario.endpoint == "batch":
+                # NDJSON 串流：讀完整個回應才算完成，任一張失敗即視為錯誤
+                lines = [json.loads(line) for line in response.text.splitlines() if line]
+                ok = len(lines) == images and all(line.get("success") for line in lines)
+            rejected = response.status_code == 503
+        except requests.RequestException:
+            ok, rejected = False, False
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        return Sample(scenario.name, latency_ms, images, ok, rejected)
+
+    def _worker(self, worker_id: int, warmup_end: float, end: float):
+        rng = random.Random(self.args.seed * 1000 + worker_id)
+        session = requests.Session()
+        try:
+            while time.perf_counter() < end:
+                scenario = rng.choices(self.scenarios, weights=self.weights)[0]
+                sample = self._request(session, scenario)
+                if time.perf_counter() - sample.latency_ms / 1000 >= warmup_end:
+                    with self._lock:
+                        self.samples.append(sample)
+        finally:
+            session.close()
+
+    def run(self) -> float:
+        """執行負載測試，回傳量測期間長度（秒，不含暖機）"""
+        start = time.perf_counter()
+        warmup_end = start + self.args.warmup
+        end = warmup_end + self.args.duration
+
+        threads = [
+            threading.Thread(target=self._worker, args=(i, warmup_end, end), daemon=True)
+            for i in range(self.args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 最後一批請求可能在截止時間後才完成，以實際結束時間計算
+        return time.perf_counter() - warmup_end
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, timeout=5,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(report: Dict[str, Any]):
+    print("=" * 100)
+    print(f"{'情境':<24} {'請求':>7} {'錯誤率':>8} {'RPS':>8} {'img/s':>8} "
+          f"{'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9}")
+    print("=" * 100)
+    rows = [*report["scenarios"].items(), ("全部", report["overall"])]
+    for name, stats in rows:
+        if name == "全部":
+            print("-" * 100)
+        print(f"{name:<24} {stats['requests']:>7} {stats['error_rate']:>7.1%} {stats['rps']:>8.2f} "
+              f"{stats['images_per_sec']:>8.2f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    print("=" * 100)
+
+    overall = report["overall"]
+    if overall["errors"] or overall["rejected"]:
+        print(f"[!] 錯誤 {overall['errors']} 次，過載拒絕 (503) {overall['rejected']} 次")
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    與基準結果比較，回傳退步項目
+
+    延遲增加或 RPS 下降超過 tolerance（比例），或錯誤率增加超過 1 個百分點，視為退步。
+    """
+    print(f"\n與基準比較（基準 commit: {baseline.get('git_revision') or '未知'}，容許 {tolerance:.0%}）")
+    print("=" * 72)
+    print(f"{'情境':<24} {'指標':<8} {'基準':>10} {'目前':>10} {'變化':>9}")
+    print("=" * 72)
+
+    regressions = []
+    pairs = [
+        (name, stats, baseline["scenarios"][name])
+        for name, stats in current["scenarios"].items()
+        if name in baseline.get("scenarios", {})
+    ]
+    pairs.append(("全部", current["overall"], baseline["overall"]))
+
+    for name, stats, base in pairs:
+        for metric, direction in COMPARE_METRICS.items():
+            before, after = base[metric], stats[metric]
+            change = (after - before) / before if before else 0.0
+            worse = change * direction > tolerance
+            marker = " [✗]" if worse else ""
+            print(f"{name:<24} {metric:<8} {before:>10.2f} {after:>10.2f} {change:>+8.1%}{marker}")
+            if worse:
+                regressions.append(f"{name} {metric} {before:.2f} → {after:.2f} ({change:+.1%})")
+
+        if stats["error_rate"] - base["error_rate"] > 0.01:
+            regressions.append(
+                f"{name} error_rate {base['error_rate']:.2%} → {stats['error_rate']:.2%}"
+            )
+
+    print("=" * 72)
+    return regressions
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='偵測 API 負載測試')
+    parser.add_argument('--url', type=str, default='http://localhost:8000',
+                        help='API 位址')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='同時送出請求的客戶端數')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='量測時間（秒）')
+    parser.add_argument('--warmup', type=float, default=5,
+                        help='暖機時間（秒，不列入統計）')
+    parser.add_argument('--mix', type=str, default='predict:640x480=3,predict:1920x1080=1,batch:640x480=1',
+                        help='請求組合，格式 endpoint:寬x高[=權重]，以逗號分隔')
+    parser.add_argument('--batch-files', type=int, default=4,
+                        help='每個 /predict/batch 請求上傳的圖片數')
+    parser.add_argument('--imgsz', type=int, default=None,
+                        help='模型輸入尺寸（未指定時使用伺服器預設）')
+    parser.add_argument('--conf', type=float, default=0.25,
+                        help='信心度閾值')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='單一請求逾時（秒）')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='亂數種子（決定合成圖片與請求順序）')
+    parser.add_argument('--allow-cache', action='store_true',
+                        help='重複送出相同位元組（量測結果快取命中路徑）')
+    parser.add_argument('--output', type=str, default=None,
+                        help='結果 JSON 輸出路徑')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='基準結果 JSON，退步時以非零狀態碼結束')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='比較時容許的退步比例（預設 10%%）')
+    args = parser.parse_args()
+
+    try:
+        scenarios = parse_mix(args.mix)
+    except ValueError as e:
+        print(f"[✗] {e}")
+        sys.exit(2)
+
+    try:
+        info = requests.get(args.url.rstrip("/") + "/model/info", timeout=5)
+    except requests.RequestException:
+        print(f"[✗] 無法連接到 API 伺服器: {args.url}")
+        sys.exit(1)
+    if info.status_code != 200:
+        print("[✗] 模型尚未載入")
+        sys.exit(1)
+    info = info.json()
+
+    print(f"[設定] 並行 {args.concurrency}，暖機 {args.warmup:g} 秒，量測 {args.duration:g} 秒")
+    print(f"[情境] {', '.join(f'{s.name} (x{s.weight:g})' for s in scenarios)}")
+
+    test = LoadTest(args, scenarios)
+    elapsed = test.run()
+
+    by_scenario: Dict[str, List[Sample]] = {s.name: [] for s in scenarios}
+    for sample in test.samples:
+        by_scenario[sample.scenario].append(sample)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "server": {
+            "model_path": info.get("model_path"),
+            "backend": info.get("backend"),
+            "default_image_size": info.get("default_image_size")
+        },
+        "config": {
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "mix": args.mix,
+            "batch_files": args.batch_files,
+            "imgsz": args.imgsz,
+            "conf": args.conf,
+            "seed": args.seed,
+            "allow_cache": args.allow_cache
+        },
+        "elapsed_seconds": round(elapsed, 2),
+        "overall": summarize(test.samples, elapsed),
+        "scenarios": {name: summarize(samples, elapsed) for name, samples in by_scenario.items()}
+    }
+
+    print_report(report)
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"[✓] 結果已寫入 {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline.get("config", {}).get("mix") != args.mix:
+            print("[!] 基準的請求組合與本次不同，僅比較共同情境")
+        regressions = compare_reports(report, baseline, args.tolerance)
+        if regressions:
+            print(f"[✗] 偵測到 {len(regressions)} 項效能退步:")
+            for item in regressions:
+                print(f"    - {item}")
+            sys.exit(1)
+        print("[✓] 未偵測到效能退步")
+
+
+if __name__ == "__main__":
+    main()
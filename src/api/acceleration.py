@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+CPU 推論加速 (Mixed Precision / Compiled Graph)
+在支援的 CPU 上以 bfloat16 推論，並可改用 TorchScript 追蹤圖或 torch.compile 編譯圖；
+執行圖只為固定的輸入形狀（正方形 imgsz × 補齊後的批次大小）建立，追蹤圖依模型雜湊與輸入形狀
+快取在磁碟，重啟後不必重新追蹤。暖機時與 FP32 eager 比對輸出，差異超過容許值時自動退回 FP32 eager
+"""
+
+import copy
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+PRECISION_FP32 = "fp32"
+PRECISION_BF16 = "bf16"
+PRECISIONS = (PRECISION_FP32, PRECISION_BF16)
+
+GRAPH_EAGER = "eager"
+GRAPH_TRACE = "trace"
+GRAPH_COMPILE = "compile"
+GRAPHS = (GRAPH_EAGER, GRAPH_TRACE, GRAPH_COMPILE)
+
+
+def bf16_supported() -> bool:
+    """CPU 是否有 bfloat16 指令（AVX512-BF16 或 AMX），沒有時 bf16 反而比 FP32 慢"""
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def _to_float(value: Any) -> Any:
+    """把輸出（可能是巢狀的 tuple / list / dict）中的張量轉回 float32，後續 NMS 才能照常運作"""
+    if isinstance(value, torch.Tensor):
+        return value.float() if value.is_floating_point() else value
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_float(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _to_float(v) for k, v in value.items()}
+    return value
+
+
+def _first_tensor(value: Any) -> torch.Tensor:
+    """取出偵測頭的主要輸出 (B, 4 + 類別數, anchors)"""
+    while isinstance(value, (list, tuple)):
+        value = value[0]
+    if isinstance(value, dict):
+        value = next(iter(value.values()))
+    return value
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """兩組 xyxy 框的 IoU 矩陣 (N, M)"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def compare_detections(
+    reference: Dict[str, np.ndarray],
+    candidate: Dict[str, np.ndarray],
+    conf: float,
+    score_tolerance: float,
+    match_iou: float = 0.3
+) -> Dict[str, Any]:
+    """
+    比對同一張圖片的兩組偵測結果（{'cls', 'conf', 'xyxy'}）
+
+    同類別的框依 IoU 由大到小貪婪配對（IoU >= match_iou 才算同一個物體），類別不同的框不會配對。
+    未配對的框若信心度低於 conf + score_tolerance，視為門檻附近的正常浮動
+    （另一邊的分數稍低於 conf 而被濾掉），不算不一致。
+
+    Returns:
+        {'matched': 配對數, 'unmatched': 不一致的框數, 'min_iou': 配對框的最小 IoU,
+         'max_score_diff': 配對框的最大信心度差}
+    """
+    iou = box_iou(reference['xyxy'], candidate['xyxy'])
+    iou[reference['cls'][:, None] != candidate['cls'][None, :]] = 0.0
+
+    pairs = []
+    while iou.size and iou.max() >= match_iou:
+        i, j = np.unravel_index(int(iou.argmax()), iou.shape)
+        pairs.append((i, j, float(iou[i, j])))
+        iou[i, :] = -1.0
+        iou[:, j] = -1.0
+
+    matched_ref = {i for i, _, _ in pairs}
+    matched_cand = {j for _, j, _ in pairs}
+    borderline = conf + score_tolerance
+    unmatched = sum(
+        1 for i, score in enumerate(reference['conf']) if i not in matched_ref and score >= borderline
+    ) + sum(
+        1 for j, score in enumerate(candidate['conf']) if j not in matched_cand and score >= borderline
+    )
+
+    return {
+        'matched': len(pairs),
+        'unmatched': unmatched,
+        'min_iou': min((v for _, _, v in pairs), default=1.0),
+        'max_score_diff': max((abs(float(reference['conf'][i] - candidate['conf'][j])) for i, j, _ in pairs),
+                              default=0.0)
+    }
+
+
+class _PrimaryOutput(torch.nn.Module):
+    """只輸出偵測頭主要張量的包裝（追蹤圖不支援巢狀 dict 輸出；NMS 也只使用這個張量）"""
+
+    def __init__(self, module: torch.nn.Module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return _first_tensor(self.module(x))
+
+
+class AcceleratedForward:
+    """
+    取代 YOLO 內部 nn.Module 的 forward
+
+    掛在模型物件上，ultralytics 的前處理、NMS 與座標換算都不受影響；
+    同一版本的所有輸入尺寸共用。enabled 為 False 時（比對失敗）直接走原本的 FP32 eager。
+
+    trace / compile 模式的執行圖依輸入形狀各一份，因此輸入形狀固定：推論時以正方形 letterbox
+    縮放到 imgsz（predict_options 的 rect=False），批次補零到 batch_sizes 中不小於它的最小值。
+    其他形狀（例如未允許的 imgsz）改走 FP32 eager，執行圖數量與暖機時比對過的形狀一致。
+    """
+
+    def __init__(
+        self,
+        module: torch.nn.Module,
+        precision: str,
+        graph: str,
+        model_hash: str,
+        cache_dir: Optional[str] = None,
+        image_sizes: Sequence[int] = (640,),
+        batch_sizes: Sequence[int] = (1,),
+        cache_max_bytes: int = 0
+    ):
+        """
+        Args:
+            module: 已載入的 YOLO nn.Module（如 DetectionModel）
+            precision: fp32 或 bf16
+            graph: eager、trace 或 compile
+            model_hash: 權重檔內容雜湊，作為磁碟快取鍵
+            cache_dir: 追蹤圖與編譯快取目錄（None 表示不寫入磁碟）
+            image_sizes: 允許的模型輸入尺寸（trace / compile 模式只為這些尺寸建立執行圖）
+            batch_sizes: 批次補齊的大小（trace / compile 模式）
+            cache_max_bytes: 磁碟上追蹤圖的總大小上限，超過時刪除最久未使用者（0 表示不限制）
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"不支援的精度: {precision}，可用: {', '.join(PRECISIONS)}")
+        if graph not in GRAPHS:
+            raise ValueError(f"不支援的圖模式: {graph}，可用: {', '.join(GRAPHS)}")
+
+        self.precision = precision
+        self.graph = graph
+        self.model_hash = model_hash
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.cache_max_bytes = cache_max_bytes
+        self.dtype = torch.bfloat16 if precision == PRECISION_BF16 else torch.float32
+        self.enabled = True
+        self.parity: Optional[Dict[str, Any]] = None
+
+        # ultralytics 建立推論器時會融合 Conv + BN；先融合再複製，加速路徑才是融合後的圖
+        if hasattr(module, "fuse"):
+            module.fuse(verbose=False)
+        module.eval()
+        self.reference = module.forward
+        self.fast = copy.deepcopy(module).to(self.dtype).eval()
+
+        # 固定形狀：與 ultralytics check_imgsz 相同，尺寸取 stride 的倍數
+        self.fixed_shapes = graph != GRAPH_EAGER
+        self.batch_sizes = sorted(set(batch_sizes))
+        stride = int(max(module.stride)) if hasattr(module, "stride") else 32
+        channels = module.yaml.get("channels", 3) if isinstance(getattr(module, "yaml", None), dict) else 3
+        self.input_shapes = [
+            (batch, channels, size, size)
+            for size in sorted({math.ceil(s / stride) * stride for s in image_sizes})
+            for batch in self.batch_sizes
+        ]
+
+        self._graphs: Dict[Tuple[int, ...], Any] = {}
+        self._seen: Dict[Tuple[int, ...], None] = {}
+        self._compiled = None
+        self._force_reference = False
+        self._lock = threading.Lock()
+
+        # 統計資訊
+        self.stats = {
+            'accelerated_calls': 0,
+            'graphs_built': 0,
+            'graphs_loaded': 0,
+            'padded_images': 0,
+            'fallback_calls': 0,
+            'unsupported_shape_calls': 0
+        }
+
+        module.forward = self
+
+    def __deepcopy__(self, memo):
+        # 新版 ultralytics 建立推論器時會深複製模型；各複本共用同一個加速路徑與追蹤圖快取
+        return self
+
+    def __call__(self, x: torch.Tensor, *args, **kwargs) -> Any:
+        if self._force_reference:
+            # verify 取得 FP32 基準結果，不計入統計
+            return self.reference(x, *args, **kwargs)
+
+        if not self.enabled or kwargs.get("augment") or kwargs.get("visualize") or kwargs.get("embed"):
+            self.stats['fallback_calls'] += 1
+            return self.reference(x, *args, **kwargs)
+
+        count = x.shape[0]
+        if self.fixed_shapes:
+            batch = next((b for b in self.batch_sizes if b >= count), None)
+            if batch is None or (batch, *x.shape[1:]) not in self.input_shapes:
+                # 沒有比對過的形狀不建立新的執行圖
+                self.stats['unsupported_shape_calls'] += 1
+                return self.reference(x, *args, **kwargs)
+            if batch > count:
+                x = torch.cat([x, x.new_zeros((batch - count, *x.shape[1:]))])
+                self.stats['padded_images'] += batch - count
+
+        self._seen.setdefault(tuple(x.shape))
+        try:
+            graph = self._graph_for(x)
+            with torch.no_grad():
+                output = _to_float(graph(x.to(self.dtype)))
+            self.stats['accelerated_calls'] += 1
+            return output[:count] if self.fixed_shapes else output
+        except Exception as e:
+            # 追蹤或編譯失敗（不支援的運算子等）不應讓請求失敗
+            self.enabled = False
+            logger.error(f"{self.precision}/{self.graph} 推論失敗: {str(e)}，退回 FP32 eager")
+            self.stats['fallback_calls'] += 1
+            return self.reference(x, *args, **kwargs)
+
+    @property
+    def predict_options(self) -> Dict[str, Any]:
+        """推論時傳給 ultralytics 的參數：固定形狀模式以正方形 letterbox 縮放，不依長寬比裁切"""
+        return {"rect": False} if self.fixed_shapes else {}
+
+    def prepare(self):
+        """建立（或從磁碟讀取）所有固定輸入形狀的執行圖，於暖機時呼叫，請求路徑上不再追蹤或編譯"""
+        if not self.fixed_shapes or not self.enabled:
+            return
+        for shape in self.input_shapes:
+            try:
+                graph = self._graph_for(torch.zeros(shape))
+                if self.graph == GRAPH_COMPILE:
+                    # torch.compile 在第一次呼叫時才依形狀編譯
+                    with torch.no_grad():
+                        graph(torch.zeros(shape, dtype=self.dtype))
+            except Exception as e:
+                self.enabled = False
+                logger.error(f"{self.precision}/{self.graph} 執行圖建立失敗: {str(e)}，退回 FP32 eager")
+                return
+
+    def _graph_for(self, x: torch.Tensor):
+        """取得此輸入形狀的執行圖（追蹤圖依形狀各一份，編譯圖由 torch.compile 依形狀各編譯一次）"""
+        if self.graph == GRAPH_EAGER:
+            return self.fast
+
+        if self.graph == GRAPH_COMPILE:
+            with self._lock:
+                if self._compiled is None:
+                    if self.cache_dir is not None:
+                        # inductor 的 FX 圖快取以圖結構與輸入形狀為鍵，重啟後直接讀取編譯結果
+                        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(self.cache_dir / "inductor"))
+                    # 輸入形狀固定，不需要動態形狀的編譯圖
+                    self._compiled = torch.compile(_PrimaryOutput(self.fast).eval(), dynamic=False)
+                    self.stats['graphs_built'] += 1
+            return self._compiled
+
+        shape = tuple(x.shape)
+        graph = self._graphs.get(shape)
+        if graph is None:
+            with self._lock:
+                graph = self._graphs.get(shape)
+                if graph is None:
+                    graph = self._load_or_trace(shape)
+                    self._graphs[shape] = graph
+        return graph
+
+    def _cache_path(self, shape: Tuple[int, ...]) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        name = (
+            f"{self.model_hash[:16]}_{self.precision}_{'x'.join(map(str, shape))}"
+            f"_torch{torch.__version__.split('+')[0]}.ts"
+        )
+        return self.cache_dir / name
+
+    def _load_or_trace(self, shape: Tuple[int, ...]):
+        """從磁碟讀取此形狀的追蹤圖，沒有時追蹤並寫入"""
+        path = self._cache_path(shape)
+        if path is not None and path.exists():
+            try:
+                graph = torch.jit.load(str(path), map_location="cpu").eval()
+            except Exception as e:
+                logger.warning(f"追蹤圖快取損毀，重新追蹤: {path} ({str(e)})")
+            else:
+                try:
+                    # 更新修改時間，磁碟快取超過上限時依此淘汰最久未使用者
+                    os.utime(path)
+                except OSError:
+                    pass
+                self.stats['graphs_loaded'] += 1
+                return graph
+
+        logger.info(f"追蹤 {self.precision} 推論圖，輸入形狀 {shape}")
+        example = torch.zeros(shape, dtype=self.dtype)
+        with torch.inference_mode(False), torch.no_grad():
+            traced = torch.jit.trace(_PrimaryOutput(self.fast).eval(), example, check_trace=False)
+            graph = torch.jit.freeze(traced)
+        self.stats['graphs_built'] += 1
+
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+                torch.jit.save(graph, str(tmp_path))
+                os.replace(tmp_path, path)
+                self._prune_cache(keep=path)
+            except OSError as e:
+                logger.warning(f"無法寫入追蹤圖快取: {str(e)}")
+        return graph
+
+    def _prune_cache(self, keep: Path):
+        """磁碟上的追蹤圖超過 cache_max_bytes 時，刪除最久未使用者（剛寫入的 keep 保留）"""
+        if not self.cache_max_bytes:
+            return
+        files = sorted(self.cache_dir.glob("*.ts"), key=lambda p: p.stat().st_mtime, reverse=True)
+        total = 0
+        for path in files:
+            total += path.stat().st_size
+            if total > self.cache_max_bytes and path != keep:
+                path.unlink(missing_ok=True)
+                logger.info(f"追蹤圖快取超過上限，刪除 {path.name}")
+
+    @property
+    def shapes(self) -> List[Tuple[int, ...]]:
+        """需要比對的輸入形狀：固定形狀模式為所有允許的形狀，否則為加速路徑執行過的形狀"""
+        return list(self.input_shapes) if self.fixed_shapes else list(self._seen)
+
+    def verify(
+        self,
+        shapes: List[Tuple[int, ...]],
+        box_tolerance: float,
+        score_tolerance: float,
+        detect: Optional[Callable[[Any], Dict[str, np.ndarray]]] = None,
+        images: Sequence[Any] = (),
+        min_iou: float = 0.9,
+        conf: float = 0.25,
+        min_score: float = 0.25,
+        top_k: int = 100
+    ) -> Dict[str, Any]:
+        """
+        比對 FP32 eager 與加速路徑，任一項超過容許值時停用加速
+
+        1. 偵測頭輸出：以隨機輸入比對 FP32 輸出中分數 >= min_score 的候選框（沒有時取分數最高的
+           top_k 個）的框座標（輸入影像像素）與類別分數最大絕對差。隨機輸入的分數多半接近 0，
+           只能抓出明顯錯誤的執行圖
+        2. 最終偵測結果：以 detect（完整推論含 NMS，信心度門檻 conf）對真實圖片各推論一次，
+           逐框配對比對類別、IoU（>= min_iou）與信心度差；同時確認推論器實際走加速路徑
+           （ultralytics 的推論器使用的是深複製後的模型）
+
+        Returns:
+            比對報告（passed 為 False 時已退回 FP32 eager）
+        """
+        report: Dict[str, Any] = {"shapes": [list(s) for s in shapes]}
+        if not self.enabled:
+            # 暖機時加速路徑已執行失敗
+            self.parity = {**report, "passed": False, "error": "accelerated forward failed"}
+            return self.parity
+
+        worst_box, worst_score = self._head_parity(shapes, min_score, top_k)
+        passed = worst_box <= box_tolerance and worst_score <= score_tolerance
+        report.update({
+            "max_box_diff_px": round(worst_box, 4),
+            "max_score_diff": round(worst_score, 5),
+            "box_tolerance_px": box_tolerance,
+            "score_tolerance": score_tolerance,
+            "detections": None
+        })
+
+        if detect is not None and images:
+            detections = self._detection_parity(detect, images, conf, score_tolerance)
+            detections["min_iou_required"] = min_iou
+            report["detections"] = detections
+            passed = passed and "error" not in detections and detections["unmatched"] == 0 \
+                and detections["min_iou"] >= min_iou and detections["max_score_diff"] <= score_tolerance
+
+        self.parity = {"passed": passed, **report}
+        if not passed:
+            self.enabled = False
+            logger.warning(f"{self.precision}/{self.graph} 輸出與 FP32 差異超過容許值，退回 FP32 eager: {self.parity}")
+        return self.parity
+
+    def _head_parity(self, shapes: List[Tuple[int, ...]], min_score: float, top_k: int) -> Tuple[float, float]:
+        """偵測頭輸出的 (框座標最大差, 類別分數最大差)"""
+        generator = torch.Generator().manual_seed(0)
+        worst_box = 0.0
+        worst_score = 0.0
+
+        for shape in shapes:
+            x = torch.rand(shape, generator=generator)
+            with torch.no_grad():
+                reference = _first_tensor(self.reference(x)).float()
+                candidate = _first_tensor(self(x)).float()
+
+            if reference.shape != candidate.shape:
+                return float("inf"), float("inf")
+
+            scores = reference[:, 4:].amax(dim=1).flatten()
+            mask = scores >= min_score
+            if not bool(mask.any()):
+                mask = torch.zeros_like(scores, dtype=torch.bool)
+                mask[scores.topk(min(top_k, scores.numel())).indices] = True
+
+            # (B, C, A) → (B * A, C)
+            ref_rows = reference.permute(0, 2, 1).reshape(-1, reference.shape[1])[mask]
+            cand_rows = candidate.permute(0, 2, 1).reshape(-1, candidate.shape[1])[mask]
+            worst_box = max(worst_box, float((ref_rows[:, :4] - cand_rows[:, :4]).abs().max()))
+            worst_score = max(worst_score, float((ref_rows[:, 4:] - cand_rows[:, 4:]).abs().max()))
+
+        return worst_box, worst_score
+
+    def _detection_parity(
+        self,
+        detect: Callable[[Any], Dict[str, np.ndarray]],
+        images: Sequence[Any],
+        conf: float,
+        score_tolerance: float
+    ) -> Dict[str, Any]:
+        """以真實圖片的最終偵測結果比對加速路徑與 FP32 eager"""
+        calls = self.stats['accelerated_calls']
+        candidates = [detect(image) for image in images]
+        if self.stats['accelerated_calls'] == calls:
+            # 例如推論器在掛上加速路徑之前就已建立
+            return {"images": len(images), "error": "predictor does not use the accelerated forward"}
+
+        self._force_reference = True
+        try:
+            references = [detect(image) for image in images]
+        finally:
+            self._force_reference = False
+
+        summary = {"images": len(images), "reference_boxes": 0, "matched": 0, "unmatched": 0,
+                   "min_iou": 1.0, "max_score_diff": 0.0}
+        for reference, candidate in zip(references, candidates):
+            result = compare_detections(reference, candidate, conf, score_tolerance)
+            summary["reference_boxes"] += len(reference["conf"])
+            summary["matched"] += result["matched"]
+            summary["unmatched"] += result["unmatched"]
+            summary["min_iou"] = min(summary["min_iou"], result["min_iou"])
+            summary["max_score_diff"] = max(summary["max_score_diff"], result["max_score_diff"])
+
+        summary["min_iou"] = round(summary["min_iou"], 4)
+        summary["max_score_diff"] = round(summary["max_score_diff"], 5)
+        return summary
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "precision": self.precision,
+            "graph": self.graph,
+            "active": self.enabled,
+            "parity": self.parity,
+            "shapes": [list(s) for s in self.shapes],
+            "batch_sizes": self.batch_sizes if self.fixed_shapes else None,
+            **self.stats
+        }
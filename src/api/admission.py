@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+推論請求准入控制 (Admission Control)
+限制同時處理中的圖片數量，佇列已滿時立即拒絕，避免過載時請求無限排隊；
+離線工作以低優先權共用同一組名額，並保留部分名額給即時請求
+"""
+
+import threading
+
+
+class AdmissionController:
+    """
+    有上限的准入佇列
+
+    每張待處理圖片佔用一個名額，處理完畢後釋放。名額用完時 try_acquire 回傳 False，
+    由呼叫端回應 503 與 Retry-After，讓延遲在過載時維持可預期。
+    """
+
+    def __init__(self, max_pending: int, retry_after_seconds: int = 1):
+        """
+        初始化准入控制
+
+        Args:
+            max_pending: 同時處理中（含排隊）的圖片數上限
+            retry_after_seconds: 拒絕時建議客戶端重試的秒數
+        """
+        if max_pending < 1:
+            raise ValueError("max_pending 必須 >= 1")
+
+        self.max_pending = max_pending
+        self.retry_after_seconds = retry_after_seconds
+        self._in_flight = 0
+        self._background = 0
+        self._lock = threading.Lock()
+
+        # 統計資訊
+        self.stats = {
+            'admitted': 0,
+            'rejected': 0,
+            'background_admitted': 0
+        }
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def foreground_in_flight(self) -> int:
+        """即時請求佔用的名額數（不含離線工作）"""
+        return self._in_flight - self._background
+
+    def try_acquire(self, count: int = 1) -> bool:
+        """嘗試取得 count 個名額，不足時不等待直接回傳 False"""
+        with self._lock:
+            if self._in_flight + count > self.max_pending:
+                self.stats['rejected'] += 1
+                return False
+            self._in_flight += count
+            self.stats['admitted'] += count
+            return True
+
+    def release(self, count: int = 1):
+        """釋放 count 個名額"""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - count)
+
+    def try_acquire_background(self, count: int = 1, reserve: int = 0) -> bool:
+        """
+        低優先權（離線工作）取得名額：至少保留 reserve 個名額給即時請求
+
+        名額不足時回傳 False，由呼叫端稍後重試；不計入拒絕數
+        """
+        with self._lock:
+            if self._in_flight + count > self.max_pending - reserve:
+                return False
+            self._in_flight += count
+            self._background += count
+            self.stats['background_admitted'] += count
+            return True
+
+    def release_background(self, count: int = 1):
+        """釋放 try_acquire_background 取得的名額"""
+        with self._lock:
+            self._background = max(0, self._background - count)
+            self._in_flight = max(0, self._in_flight - count)
+
+    def snapshot(self) -> dict:
+        """目前的佇列狀態"""
+        return {
+            'in_flight': self._in_flight,
+            'background_in_flight': self._background,
+            'max_pending': self.max_pending,
+            **self.stats
+        }
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+推論後端 (Inference Backends)
+支援 PyTorch、ONNX Runtime 與 OpenVINO；非 PyTorch 後端第一次使用時會從 .pt 匯出，
+並把轉換後的檔案快取在權重檔旁邊，之後啟動直接載入
+"""
+
+import importlib.util
+import logging
+from pathlib import Path
+from typing import Dict
+
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+BACKEND_TORCH = "torch"
+BACKEND_ONNXRUNTIME = "onnxruntime"
+BACKEND_OPENVINO = "openvino"
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNXRUNTIME, BACKEND_OPENVINO)
+
+# 後端對應的 ultralytics 匯出格式與執行時套件
+EXPORT_FORMATS: Dict[str, str] = {
+    BACKEND_ONNXRUNTIME: "onnx",
+    BACKEND_OPENVINO: "openvino"
+}
+RUNTIME_MODULES: Dict[str, str] = {
+    BACKEND_TORCH: "torch",
+    BACKEND_ONNXRUNTIME: "onnxruntime",
+    BACKEND_OPENVINO: "openvino"
+}
+
+
+def backend_available(backend: str) -> bool:
+    """檢查後端所需的執行時套件是否已安裝"""
+    module = RUNTIME_MODULES.get(backend)
+    return module is not None and importlib.util.find_spec(module) is not None
+
+
+def available_backends():
+    """目前環境可用的後端列表"""
+    return [backend for backend in BACKENDS if backend_available(backend)]
+
+
+def artifact_path(weights_path: str, backend: str) -> Path:
+    """
+    後端使用的模型檔路徑
+
+    與 ultralytics 匯出的命名一致：best.pt → best.onnx / best_openvino_model/
+    """
+    weights = Path(weights_path)
+
+    if backend == BACKEND_TORCH:
+        return weights
+    if backend == BACKEND_ONNXRUNTIME:
+        return weights.with_suffix(".onnx")
+    if backend == BACKEND_OPENVINO:
+        return weights.parent / f"{weights.stem}_openvino_model"
+
+    raise ValueError(f"不支援的推論後端: {backend}，可用: {', '.join(BACKENDS)}")
+
+
+def _artifact_is_fresh(artifact: Path, weights: Path) -> bool:
+    """轉換後的檔案存在且不比 .pt 舊"""
+    if not artifact.exists():
+        return False
+    if not weights.exists():
+        return True
+    return artifact.stat().st_mtime >= weights.stat().st_mtime
+
+
+def export_artifact(weights_path: str, backend: str, imgsz: int = 640) -> Path:
+    """
+    將 .pt 匯出為後端格式（已有較新的匯出檔時直接沿用）
+
+    匯出使用動態輸入尺寸，讓微批次的 batch size 與不同圖片尺寸都能共用同一份檔案。
+
+    Args:
+        weights_path: .pt 權重檔路徑
+        backend: 目標後端
+        imgsz: 匯出時的參考輸入尺寸
+
+    Returns:
+        轉換後的模型檔路徑
+    """
+    artifact = artifact_path(weights_path, backend)
+
+    if backend == BACKEND_TORCH or _artifact_is_fresh(artifact, Path(weights_path)):
+        return artifact
+
+    logger.info(f"匯出 {backend} 模型: {weights_path} → {artifact}")
+    exported = YOLO(weights_path).export(
+        format=EXPORT_FORMATS[backend],
+        imgsz=imgsz,
+        dynamic=True,
+        verbose=False
+    )
+    logger.info(f"✓ 匯出完成: {exported}")
+
+    return Path(exported)
+
+
+def load_backend(weights_path: str, backend: str = BACKEND_TORCH, imgsz: int = 640) -> YOLO:
+    """
+    以指定後端載入模型
+
+    所有後端都透過 ultralytics.YOLO 推論，前處理、NMS 與 Results 格式一致，
+    因此 API 回傳的偵測 JSON 與後端無關。
+
+    Args:
+        weights_path: .pt 權重檔路徑
+        backend: torch / onnxruntime / openvino
+        imgsz: 匯出時的參考輸入尺寸
+
+    Returns:
+        可直接呼叫推論的 YOLO 模型
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"不支援的推論後端: {backend}，可用: {', '.join(BACKENDS)}")
+
+    if not backend_available(backend):
+        raise RuntimeError(
+            f"推論後端 {backend} 需要安裝 {RUNTIME_MODULES[backend]} 套件"
+        )
+
+    if backend == BACKEND_TORCH:
+        return YOLO(weights_path)
+
+    artifact = export_artifact(weights_path, backend, imgsz=imgsz)
+    return YOLO(str(artifact), task="detect")
+
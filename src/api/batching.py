@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+動態微批次排程器 (Dynamic Micro-Batching)
+將同時到達的推論請求合併成一次批次前向運算，再把各張圖片的結果分送回對應請求
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 批次推論函式：輸入圖片列表與推論參數，回傳與輸入等長的結果列表
+PredictFn = Callable[..., Sequence[Any]]
+
+
+class _PendingItem:
+    """排隊中的單張推論請求"""
+
+    __slots__ = ("image", "options", "key", "future", "timer", "enqueued_at")
+
+    def __init__(self, image: Any, options: Dict[str, Any], future: asyncio.Future, timer=None):
+        self.image = image
+        self.options = options
+        self.key = _options_key(options)
+        self.future = future
+        self.timer = timer
+        self.enqueued_at = time.perf_counter()
+
+
+def _options_key(options: Dict[str, Any]) -> Tuple:
+    """推論參數相同的請求才能放進同一個批次"""
+    return tuple(sorted((k, repr(v)) for k, v in options.items()))
+
+
+class MicroBatcher:
+    """
+    微批次排程器
+
+    收到第一個請求後最多等待 max_wait_ms 毫秒，或湊滿 max_batch_size 張圖片，
+    即把同一批請求送進模型執行一次前向運算。同一時間只會有一個批次在執行，
+    因此模型不會被多個執行緒同時呼叫。
+    """
+
+    def __init__(
+        self,
+        predict_fn: PredictFn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        executor: Optional[Any] = None,
+        on_batch: Optional[Callable[[int, float], None]] = None
+    ):
+        """
+        初始化排程器
+
+        Args:
+            predict_fn: 批次推論函式（同步），會在 executor 中執行
+            max_batch_size: 單一批次最多圖片數
+            max_wait_ms: 收到第一張圖片後最多等待的毫秒數
+            executor: 執行推論的 executor（None 表示使用事件迴圈預設的 executor）
+            on_batch: 每個批次完成後呼叫 on_batch(批次大小, 推論秒數)，供效能指標使用
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size 必須 >= 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms 必須 >= 0")
+
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+        self.on_batch = on_batch
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # 統計資訊
+        self.stats = {
+            'requests': 0,
+            'batches': 0,
+            'images': 0,
+            'max_batch_seen': 0,
+            'errors': 0,
+            'skipped': 0
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        """排隊中尚未進入批次的請求數"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """啟動背景排程工作"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"微批次排程器已啟動 (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait_ms})"
+        )
+
+    async def stop(self):
+        """停止排程工作，尚未執行的請求會收到錯誤"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        while self._queue is not None and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if not item.future.done():
+                item.future.set_exception(RuntimeError("推論排程器已停止"))
+
+    async def submit(self, image: Any, timer=None, **options) -> Any:
+        """
+        提交單張圖片並等待其推論結果
+
+        Args:
+            image: 模型可接受的圖片（PIL Image / numpy array）
+            timer: 選用的 StageTimer，記錄排隊（queue）與推論（inference）耗時
+            **options: 傳給模型的推論參數（如 conf、iou）
+
+        Returns:
+            該張圖片的推論結果
+        """
+        if not self.running:
+            raise RuntimeError("推論排程器尚未啟動")
+
+        future = asyncio.get_running_loop().create_future()
+        self.stats['requests'] += 1
+        await self._queue.put(_PendingItem(image, options, future, timer))
+        return await future
+
+    async def _collect(self) -> List[_PendingItem]:
+        """收集一個批次：等到第一個請求，再於等待時間內盡量湊滿批次"""
+        first = await self._queue.get()
+        batch = [first]
+
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        """背景排程迴圈"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._collect()
+
+            # 依推論參數分組，參數不同的請求無法共用一次前向運算
+            groups: Dict[Tuple, List[_PendingItem]] = {}
+            for item in batch:
+                groups.setdefault(item.key, []).append(item)
+
+            for items in groups.values():
+                await self._execute(loop, items)
+
+    async def _execute(self, loop: asyncio.AbstractEventLoop, items: List[_PendingItem]):
+        """執行一個批次並把結果分送給各請求"""
+        # 等待中的請求已被取消（例如客戶端斷線或請求期限已過），不送進模型；
+        # 前一組批次執行期間才取消的請求也在這裡略過
+        live = [item for item in items if not item.future.done()]
+        self.stats['skipped'] += len(items) - len(live)
+        items = live
+        if not items:
+            return
+
+        images = [item.image for item in items]
+        options = items[0].options
+        start = time.perf_counter()
+
+        try:
+            results = await loop.run_in_executor(
+                self.executor,
+                lambda: self.predict_fn(images, **options)
+            )
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"批次結果數量不符: 輸入 {len(items)} 張，輸出 {len(results)} 筆"
+                )
+        except Exception as e:
+            logger.error(f"批次推論錯誤: {str(e)}")
+            self.stats['errors'] += 1
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        elapsed = time.perf_counter() - start
+        self.stats['batches'] += 1
+        self.stats['images'] += len(items)
+        self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(items))
+        if self.on_batch is not None:
+            self.on_batch(len(items), elapsed)
+
+        for item, result in zip(items, results):
+            if item.timer is not None:
+                item.timer.add("queue", (start - item.enqueued_at) * 1000)
+                item.timer.add("inference", elapsed * 1000)
+            if not item.future.done():
+                item.future.set_result(result)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+信心度閘控的兩階段推論 (Confidence-Gated Cascade)
+大多數圖片很簡單，小模型就能以高信心度答對；先以小模型推論，只有沒有偵測結果、
+或任一偵測的信心度落在不確定區間時才升級到大模型，降低每張圖片的平均運算成本
+"""
+
+import threading
+from typing import Optional, Sequence
+
+
+class CascadeGate:
+    """
+    決定第一階段（小模型）的結果是否需要升級到大模型
+
+    信心度 >= uncertain_high 的偵測視為確定；[uncertain_low, uncertain_high) 之間視為不確定。
+    低於 uncertain_low 的偵測不影響判斷（通常已被 conf_threshold 濾掉）。
+    """
+
+    def __init__(self, uncertain_low: float, uncertain_high: float, escalate_empty: bool = True):
+        """
+        Args:
+            uncertain_low: 不確定區間下限
+            uncertain_high: 不確定區間上限（不含）
+            escalate_empty: 沒有偵測結果時是否升級
+        """
+        if not 0 <= uncertain_low <= uncertain_high <= 1:
+            raise ValueError("不確定區間必須滿足 0 <= uncertain_low <= uncertain_high <= 1")
+
+        self.uncertain_low = uncertain_low
+        self.uncertain_high = uncertain_high
+        self.escalate_empty = escalate_empty
+        self._lock = threading.Lock()
+
+        # 統計資訊
+        self.stats = {
+            'requests': 0,
+            'accepted': 0,
+            'escalated_empty': 0,
+            'escalated_uncertain': 0
+        }
+
+    def escalation_reason(self, confidences: Sequence[float]) -> Optional[str]:
+        """
+        判斷是否升級
+
+        Returns:
+            "no_detections" 或 "uncertain"；第一階段結果可直接採用時為 None
+        """
+        if not confidences:
+            return "no_detections" if self.escalate_empty else None
+        if any(self.uncertain_low <= c < self.uncertain_high for c in confidences):
+            return "uncertain"
+        return None
+
+    def record(self, reason: Optional[str]):
+        """記錄一次判斷結果"""
+        key = {
+            None: 'accepted',
+            "no_detections": 'escalated_empty',
+            "uncertain": 'escalated_uncertain'
+        }[reason]
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats[key] += 1
+
+    @property
+    def escalation_rate(self) -> Optional[float]:
+        requests = self.stats['requests']
+        if requests == 0:
+            return None
+        escalated = self.stats['escalated_empty'] + self.stats['escalated_uncertain']
+        return round(escalated / requests, 4)
+
+    def snapshot(self) -> dict:
+        """不確定區間、升級率與統計"""
+        return {
+            'uncertain_band': [self.uncertain_low, self.uncertain_high],
+            'escalate_empty': self.escalate_empty,
+            'escalation_rate': self.escalation_rate,
+            **self.stats
+        }
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+進行中請求合併 (In-flight Request Coalescing)
+相同圖片與參數的請求同時到達時只執行一次推論，所有等待者共用同一份結果
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class InflightCoalescer:
+    """
+    以鍵合併進行中的工作
+
+    第一個請求（leader）實際執行工作，之後相同鍵的請求直接等待同一個 Future。
+    工作以 asyncio.shield 保護，個別等待者取消（例如客戶端斷線）不會中斷其他人的結果；
+    最後一個等待者也取消時才取消工作本身，不再替沒有人等待的請求推論。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, int] = {}
+
+        # 統計資訊
+        self.stats = {
+            'leaders': 0,
+            'coalesced': 0,
+            'abandoned': 0
+        }
+
+    async def run(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        執行（或加入進行中的）工作
+
+        Args:
+            key: 工作識別鍵，相同鍵視為相同工作
+            work: 產生工作的 coroutine function，只有 leader 會呼叫
+
+        Returns:
+            工作結果
+        """
+        future = self._inflight.get(key)
+
+        if future is not None:
+            self.stats['coalesced'] += 1
+        else:
+            self.stats['leaders'] += 1
+            future = asyncio.ensure_future(work())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._waiters.get(key) == 1 and not future.done():
+                # 所有等待者都已離開
+                self._forget(key, future)
+                future.cancel()
+                self.stats['abandoned'] += 1
+            raise
+        finally:
+            remaining = self._waiters.get(key, 0) - 1
+            if remaining > 0:
+                self._waiters[key] = remaining
+            else:
+                self._waiters.pop(key, None)
+
+    def _forget(self, key: str, future: asyncio.Future):
+        """移除進行中的工作（同一個鍵可能已換成新的工作）"""
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """合併狀態與統計"""
+        total = self.stats['leaders'] + self.stats['coalesced']
+        return {
+            'in_flight': len(self._inflight),
+            'coalesce_rate': round(self.stats['coalesced'] / total, 4) if total else 0.0,
+            **self.stats
+        }
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+請求期限 (Request Deadlines)
+過載時客戶端可能早已逾時離開，仍替它們做完整推論只會浪費最稀缺的運算資源。
+期限已過或客戶端斷線的請求在推論前就放棄，進行中的工作則被取消，
+排隊中的圖片（含切片推論尚未執行的圖塊）不會進入批次
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+
+class DeadlineExceeded(Exception):
+    """請求期限已過"""
+
+
+class ClientDisconnected(Exception):
+    """客戶端已斷線"""
+
+
+class Deadline:
+    """以 time.monotonic() 計算的絕對期限；timeout 為 None 表示沒有期限"""
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, timeout_seconds: Optional[float], start: Optional[float] = None):
+        if timeout_seconds is None:
+            self.expires_at = None
+        else:
+            self.expires_at = (start if start is not None else time.monotonic()) + timeout_seconds
+
+    def remaining(self) -> Optional[float]:
+        """剩餘秒數（沒有期限時為 None，已過期時為 0）"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+
+def parse_timeout_ms(value: Optional[str]) -> Optional[float]:
+    """
+    解析客戶端指定的逾時（毫秒）
+
+    Returns:
+        逾時毫秒數；未指定時為 None
+
+    Raises:
+        ValueError: 不是正數
+    """
+    if value is None or value == "":
+        return None
+    timeout_ms = float(value)
+    if not timeout_ms > 0:
+        raise ValueError("逾時必須是正數（毫秒）")
+    return timeout_ms
+
+
+async def run_until(
+    work: Awaitable[Any],
+    deadline: Deadline,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    poll_interval: float = 0.1
+) -> Any:
+    """
+    在期限內執行工作，期限到或客戶端斷線時取消
+
+    取消會沿著 await 鏈往下傳遞：排隊中的批次請求 Future 被取消後，
+    排程器組批時會直接略過，不佔用推論。
+
+    Args:
+        work: 要執行的 coroutine
+        deadline: 請求期限
+        is_disconnected: 檢查客戶端是否已斷線（如 Request.is_disconnected）
+        poll_interval: 檢查斷線的間隔（秒）
+
+    Raises:
+        DeadlineExceeded: 期限已過
+        ClientDisconnected: 客戶端已斷線
+    """
+    if deadline.expired:
+        if asyncio.iscoroutine(work):
+            work.close()
+        raise DeadlineExceeded()
+
+    task = asyncio.ensure_future(work)
+
+    try:
+        while True:
+            remaining = deadline.remaining()
+            timeout = poll_interval if remaining is None else min(poll_interval, remaining)
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if done:
+                return task.result()
+            if deadline.expired:
+                raise DeadlineExceeded()
+            if await is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
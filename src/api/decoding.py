@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+圖片解碼 (Image Decoding)
+JPEG 在解碼時直接以 DCT 縮放（PIL draft）降到接近模型輸入尺寸，
+其他格式解碼後以整數倍 reduce 縮小，避免完整解碼大圖後再由模型縮放；
+原始像素上傳（raw_frames）則直接包裝成陣列
+"""
+
+import io
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from metrics import StageTimer
+from raw_frames import CHANNEL_ORDER_RGB, decode_frame
+
+EXIF_ORIENTATION = 0x0112
+
+
+def _draft_size(size: Tuple[int, int], target_size: int) -> Tuple[int, int]:
+    """長邊縮到 target_size 時的寬高（draft 只會縮到不小於此尺寸）"""
+    width, height = size
+    ratio = target_size / max(width, height)
+    return max(1, int(width * ratio + 0.999)), max(1, int(height * ratio + 0.999))
+
+
+def decode_image(
+    image_data: bytes,
+    target_size: Optional[int] = None,
+    timer: Optional[StageTimer] = None
+) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    解碼上傳的圖片並確保為 RGB 格式
+
+    Args:
+        image_data: 圖片檔內容
+        target_size: 模型輸入尺寸（長邊），指定時在解碼階段縮小到不小於此尺寸；
+                     None 表示完整解碼
+        timer: 選用的 StageTimer，記錄 decode / convert 耗時
+
+    Returns:
+        (解碼後的圖片, 原始尺寸 (寬, 高))；皆已依 EXIF 方向轉正，與模型看到的方向一致
+    """
+    timer = timer or StageTimer()
+
+    with timer.stage("decode"):
+        image = Image.open(io.BytesIO(image_data))
+        original_size = image.size
+
+        if target_size and image.format == 'JPEG' and max(original_size) > target_size:
+            # DCT 域縮放（1/2、1/4、1/8），直接解碼成 RGB 並省下大部分解碼時間
+            image.draft('RGB', _draft_size(original_size, target_size))
+
+        # Image.open 是延遲解碼，在此強制解碼以免推論執行緒代為解碼
+        image.load()
+
+    if image.mode != 'RGB':
+        with timer.stage("convert"):
+            image = image.convert('RGB')
+
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    if orientation != 1:
+        # 手機照片常以 EXIF 標記旋轉；在此轉正，座標才能正確換算回原圖
+        with timer.stage("convert"):
+            if orientation in (5, 6, 7, 8):
+                original_size = original_size[::-1]
+            image = ImageOps.exif_transpose(image)
+
+    if target_size:
+        factor = max(image.size) // target_size
+        if factor >= 2:
+            # 非 JPEG 或 draft 後仍大於兩倍時，以整數倍區塊平均縮小
+            with timer.stage("decode"):
+                image = image.reduce(factor)
+
+    return image, original_size
+
+
+def probe_size(image_data: bytes) -> Tuple[int, int]:
+    """只讀取標頭取得圖片尺寸（已依 EXIF 方向轉正），不解碼像素"""
+    image = Image.open(io.BytesIO(image_data))
+    if image.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+        return image.height, image.width
+    return image.size
+
+
+def decode_raw(
+    data: bytes,
+    timer: Optional[StageTimer] = None
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    解析原始像素上傳（raw_frames 格式），回傳模型可直接使用的 BGR 陣列
+
+    BGR 影格以 np.frombuffer 直接包裝，不經 PIL 解碼與色彩轉換；
+    RGB 影格只做一次通道反轉。
+
+    Returns:
+        (HxWx3 BGR 陣列, 尺寸 (寬, 高))
+    """
+    timer = timer or StageTimer()
+
+    with timer.stage("decode"):
+        frame, channel_order = decode_frame(data)
+
+    if channel_order == CHANNEL_ORDER_RGB:
+        with timer.stage("convert"):
+            frame = np.ascontiguousarray(frame[..., ::-1])
+
+    height, width = frame.shape[:2]
+    return frame, (width, height)
+
+
+def input_size(image: Union[Image.Image, np.ndarray]) -> Tuple[int, int]:
+    """送進模型的圖片尺寸 (寬, 高)"""
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+    return image.size
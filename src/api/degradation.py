@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+負載自適應降級 (Load-Adaptive Degradation)
+流量尖峰時寧可以輕量模型快速回應稍低精度的結果，也不要讓請求逾時：
+排隊深度或近期 p95 延遲超過門檻時改用輕量模型，負載降到門檻的一定比例以下
+並維持最短停留時間後才切回主要模型（遲滯，避免在門檻附近來回切換）
+"""
+
+import logging
+import math
+import time
+from collections import deque
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LoadDegrader:
+    """
+    以排隊深度與 p95 延遲決定是否降級
+
+    只在事件迴圈中呼叫，不需要鎖。門檻設為 0 表示不使用該訊號。
+    """
+
+    def __init__(
+        self,
+        queue_depth: Callable[[], int],
+        queue_depth_threshold: int = 0,
+        p95_threshold_ms: float = 0,
+        recover_ratio: float = 0.5,
+        min_hold_seconds: float = 10.0,
+        window_seconds: float = 10.0,
+        min_samples: int = 20,
+        max_samples: int = 2048
+    ):
+        """
+        Args:
+            queue_depth: 回傳目前排隊深度的函式
+            queue_depth_threshold: 排隊深度達到此值時降級
+            p95_threshold_ms: 近期 p95 延遲達到此值時降級
+            recover_ratio: 兩個訊號都低於門檻 × 此比例時才恢復
+            min_hold_seconds: 降級後至少維持的秒數
+            window_seconds: 計算 p95 的延遲樣本時間窗
+            min_samples: 樣本數不足時不以 p95 判斷
+            max_samples: 時間窗內最多保留的樣本數
+        """
+        if not 0 < recover_ratio <= 1:
+            raise ValueError("recover_ratio 必須介於 0 與 1 之間")
+
+        self.queue_depth = queue_depth
+        self.queue_depth_threshold = queue_depth_threshold
+        self.p95_threshold_ms = p95_threshold_ms
+        self.recover_ratio = recover_ratio
+        self.min_hold_seconds = min_hold_seconds
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+
+        self._samples = deque(maxlen=max_samples)
+        self._degraded = False
+        self._changed_at = time.monotonic()
+        self._reason: Optional[str] = None
+
+        # 統計資訊
+        self.stats = {
+            'degrade_events': 0,
+            'recover_events': 0,
+            'degraded_requests': 0,
+            'primary_requests': 0
+        }
+
+    @property
+    def degraded(self) -> bool:
+        return self._degraded
+
+    def observe(self, latency_ms: float):
+        """記錄一張圖片的處理延遲"""
+        self._samples.append((time.monotonic(), latency_ms))
+
+    def p95(self) -> Optional[float]:
+        """時間窗內的 p95 延遲（毫秒），樣本不足時為 None"""
+        cutoff = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+        if len(self._samples) < self.min_samples:
+            return None
+        values = sorted(ms for _, ms in self._samples)
+        return values[min(len(values) - 1, math.ceil(0.95 * len(values)) - 1)]
+
+    def _overloaded(self, depth: int, p95: Optional[float], scale: float) -> Optional[str]:
+        """負載超過門檻 × scale 時回傳原因"""
+        if self.queue_depth_threshold > 0 and depth >= self.queue_depth_threshold * scale:
+            return "queue_depth"
+        if self.p95_threshold_ms > 0 and p95 is not None and p95 >= self.p95_threshold_ms * scale:
+            return "p95_latency"
+        return None
+
+    def route(self) -> bool:
+        """依目前負載更新狀態並回傳這個請求是否應降級"""
+        depth = self.queue_depth()
+        p95 = self.p95()
+        now = time.monotonic()
+
+        if not self._degraded:
+            reason = self._overloaded(depth, p95, 1.0)
+            if reason is not None:
+                self._degraded = True
+                self._changed_at = now
+                self._reason = reason
+                self.stats['degrade_events'] += 1
+                logger.warning(f"負載過高（{reason}: 排隊 {depth}，p95 {p95} ms），改用輕量模型")
+
+        elif now - self._changed_at >= self.min_hold_seconds \
+                and self._overloaded(depth, p95, self.recover_ratio) is None:
+            self._degraded = False
+            self._changed_at = now
+            self._reason = None
+            self.stats['recover_events'] += 1
+            logger.info(f"負載已恢復（排隊 {depth}，p95 {p95} ms），切回主要模型")
+
+        self.stats['degraded_requests' if self._degraded else 'primary_requests'] += 1
+        return self._degraded
+
+    def snapshot(self) -> dict:
+        """目前的降級狀態與統計"""
+        p95 = self.p95()
+        return {
+            'degraded': self._degraded,
+            'reason': self._reason,
+            'since_seconds': round(time.monotonic() - self._changed_at, 1),
+            'queue_depth': self.queue_depth(),
+            'p95_ms': round(p95, 2) if p95 is not None else None,
+            'queue_depth_threshold': self.queue_depth_threshold,
+            'p95_threshold_ms': self.p95_threshold_ms,
+            **self.stats
+        }
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+偵測範圍控制 (Detection Filters)
+呼叫端只關心少數類別、部分區域或前幾個偵測時，讓伺服器少做事：
+類別與數量上限交給模型的 NMS 處理（不是組完 JSON 才過濾），
+感興趣區域（ROI）在推論前裁切，偵測框再換回全圖座標
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+# 感興趣區域 (x0, y0, x1, y1)，原圖像素座標
+Region = Tuple[int, int, int, int]
+
+
+class RegionOutsideImage(ValueError):
+    """感興趣區域與圖片沒有交集"""
+
+
+def parse_classes(value: str, class_names: Dict[int, str]) -> List[int]:
+    """
+    解析類別清單，例如 "0,3" 或以類別名稱 "person,car"
+
+    Raises:
+        ValueError: 未知的類別或清單為空
+    """
+    ids_by_name = {name: class_id for class_id, name in class_names.items()}
+    classes = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        if item in ids_by_name:
+            class_id = ids_by_name[item]
+        elif item.isdigit() and int(item) in class_names:
+            class_id = int(item)
+        else:
+            raise ValueError(f"未知的類別: {item}")
+        if class_id not in classes:
+            classes.append(class_id)
+
+    if not classes:
+        raise ValueError("類別清單不可為空")
+    return sorted(classes)
+
+
+def parse_region(value: str) -> Region:
+    """
+    解析感興趣區域 "x0,y0,x1,y1"（原圖像素座標）
+
+    Raises:
+        ValueError: 格式錯誤或寬高不為正
+    """
+    parts = [part.strip() for part in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError("ROI 格式應為 x0,y0,x1,y1")
+    try:
+        values = [float(p) for p in parts]
+    except ValueError:
+        raise ValueError("ROI 座標須為數字")
+    # inf 轉 int 會拋出 OverflowError、nan 則無法比較，一律視為格式錯誤
+    if not all(math.isfinite(v) for v in values):
+        raise ValueError("ROI 座標須為有限數值")
+    x0, y0, x1, y1 = (int(v) for v in values)
+    if x0 < 0 or y0 < 0 or x1 <= x0 or y1 <= y0:
+        raise ValueError("ROI 座標須滿足 0 <= x0 < x1 且 0 <= y0 < y1")
+    return x0, y0, x1, y1
+
+
+def clip_region(region: Region, width: int, height: int) -> Region:
+    """
+    把感興趣區域裁到圖片範圍內
+
+    Raises:
+        RegionOutsideImage: 與圖片沒有交集
+    """
+    x0, y0, x1, y1 = region
+    clipped = (min(x0, width), min(y0, height), min(x1, width), min(y1, height))
+    if clipped[2] <= clipped[0] or clipped[3] <= clipped[1]:
+        raise RegionOutsideImage(f"ROI {region} 超出圖片範圍 ({width}x{height})")
+    return clipped
+
+
+def region_decode_target(target_size: int, image_size: Tuple[int, int], region: Region) -> int:
+    """
+    只推論 ROI 時的解碼目標長邊
+
+    快速解碼是以整張圖的長邊縮到 target_size，只取 ROI 時要放大目標，
+    讓 ROI 本身仍不小於 target_size，避免裁出來的區域解析度不足
+    """
+    x0, y0, x1, y1 = clip_region(region, *image_size)
+    scale = max(image_size) / max(x1 - x0, y1 - y0)
+    return int(target_size * scale + 0.999)
+
+
+def crop_region(
+    image: Union[Image.Image, np.ndarray],
+    original_size: Tuple[int, int],
+    region: Region
+) -> Tuple[Union[Image.Image, np.ndarray], Tuple[float, float]]:
+    """
+    在推論前裁出感興趣區域
+
+    解碼時圖片可能已縮小，region 以原圖座標表示，依實際圖片尺寸換算後裁切。
+    NumPy 陣列只取切片（不複製）。裁切結果上的座標先依整張圖的縮放比例換回原圖尺度，
+    再加上回傳的位移即為全圖座標。
+
+    Returns:
+        (裁切後的圖片, 裁切左上角的原圖座標 (x, y))
+    """
+    width, height = original_size
+    x0, y0, x1, y1 = clip_region(region, width, height)
+
+    if isinstance(image, np.ndarray):
+        image_width, image_height = image.shape[1], image.shape[0]
+    else:
+        image_width, image_height = image.size
+    sx, sy = image_width / width, image_height / height
+
+    left, top = int(x0 * sx), int(y0 * sy)
+    right = min(image_width, max(left + 1, round(x1 * sx)))
+    bottom = min(image_height, max(top + 1, round(y1 * sy)))
+
+    if isinstance(image, np.ndarray):
+        crop = image[top:bottom, left:right]
+    else:
+        crop = image.crop((left, top, right, bottom))
+    return crop, (left / sx, top / sy)
+
+
+def limit_detections(arrays: Dict[str, np.ndarray], max_det: Optional[int]) -> Dict[str, np.ndarray]:
+    """只保留信心度最高的 max_det 個偵測（切片推論合併後使用）"""
+    if max_det is None or len(arrays['conf']) <= max_det:
+        return arrays
+    keep = np.argsort(-arrays['conf'], kind='stable')[:max_det]
+    return {key: value[keep] for key, value in arrays.items()}
+
+
+def model_options(filters: Optional[Dict[str, Any]], default_max_det: int) -> Dict[str, Any]:
+    """
+    傳給模型的 NMS 參數
+
+    一律明確傳入：舊版 ultralytics 的推論器會沿用上一次呼叫的參數，
+    省略時可能套用到其他請求的類別過濾
+    """
+    filters = filters or {}
+    return {
+        "classes": filters.get("classes"),
+        "max_det": filters.get("max_det") or default_max_det
+    }
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+離線批次工作 (Asynchronous Jobs)
+大量圖片（壓縮檔上傳或伺服器端目錄）以背景工作處理：圖片逐張讀取並交給與 /predict 相同的
+批次推論路徑，結果逐行寫入磁碟上的 JSONL，記憶體用量與工作大小無關
+
+磁碟配置（每個工作一個目錄）：
+    <spool_dir>/<job_id>/job.json       工作狀態與進度
+    <spool_dir>/<job_id>/results.jsonl  偵測結果（依完成順序，以 index 對應來源順序）
+    <spool_dir>/<job_id>/input          上傳的壓縮檔（zip / tar，工作結束後刪除）
+    <spool_dir>/<job_id>/cancel         取消標記（任何 worker 行程都能取消工作）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+
+# 工作狀態
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+# 單張圖片的處理函式：(圖片內容, 工作參數) -> 結果 dict
+ProcessFn = Callable[[bytes, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def _is_image(name: str) -> bool:
+    return Path(name).suffix.lower() in IMAGE_EXTENSIONS
+
+
+class DirectorySource:
+    """伺服器端目錄（遞迴尋找圖片）"""
+
+    def __init__(self, root: Path, max_image_bytes: int = 0):
+        self.root = root
+        self.max_image_bytes = max_image_bytes
+        self.sizes = {
+            str(p.relative_to(root)): p.stat().st_size
+            for p in root.rglob("*") if p.is_file() and _is_image(p.name)
+        }
+        self.names = sorted(self.sizes)
+
+    def read(self, name: str) -> bytes:
+        _check_size(name, self.sizes[name], self.max_image_bytes)
+        return (self.root / name).read_bytes()
+
+    def close(self):
+        pass
+
+
+class ArchiveSource:
+    """
+    zip / tar 壓縮檔，讀取時加鎖（tarfile 不支援多執行緒同時讀取）
+
+    解壓後大小取自成員標頭（ZipInfo.file_size / TarInfo.size），超過 max_image_bytes 的成員
+    不解壓、直接記為失敗；zipfile 與 tarfile 讀取時也不會超出標頭宣告的大小。
+    """
+
+    def __init__(self, path: Path, max_image_bytes: int = 0):
+        self._lock = threading.Lock()
+        self.max_image_bytes = max_image_bytes
+
+        if zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            self._tar = None
+            self.sizes = {
+                i.filename: i.file_size for i in self._zip.infolist() if not i.is_dir() and _is_image(i.filename)
+            }
+        elif tarfile.is_tarfile(path):
+            self._zip = None
+            self._tar = tarfile.open(path)
+            self.sizes = {m.name: m.size for m in self._tar.getmembers() if m.isfile() and _is_image(m.name)}
+        else:
+            raise ValueError("不支援的壓縮檔格式（僅支援 zip 與 tar）")
+        self.names = list(self.sizes)
+
+    def read(self, name: str) -> bytes:
+        _check_size(name, self.sizes[name], self.max_image_bytes)
+        with self._lock:
+            if self._zip is not None:
+                return self._zip.read(name)
+            return self._tar.extractfile(name).read()
+
+    def close(self):
+        (self._zip or self._tar).close()
+
+
+def _check_size(name: str, size: int, max_bytes: int):
+    """單張圖片超過大小上限時拋出 ValueError（max_bytes 為 0 表示不限制）"""
+    if max_bytes and size > max_bytes:
+        raise ValueError(f"{name} 大小 {size} bytes 超過單張上限 {max_bytes} bytes")
+
+
+class JobManager:
+    """
+    背景工作管理
+
+    工作排入佇列後由 workers 個背景 task 依序執行；每個工作同時處理最多 concurrency 張圖片，
+    使同一工作的圖片能在微批次排程器中湊成批次。進度定期寫入 job.json，
+    多 worker 部署時任何行程都能從共用的 spool 目錄查詢進度與下載結果。
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        process_fn: ProcessFn,
+        workers: int = 1,
+        concurrency: int = 16,
+        max_images: int = 100000,
+        max_image_bytes: int = 0,
+        max_total_bytes: int = 0,
+        executor: Optional[Any] = None
+    ):
+        """
+        初始化工作管理
+
+        Args:
+            spool_dir: 工作目錄的根目錄
+            process_fn: 處理單張圖片的 async 函式
+            workers: 同時執行的工作數
+            concurrency: 每個工作同時處理的圖片數
+            max_images: 單一工作的圖片數上限
+            max_image_bytes: 單張圖片（壓縮檔成員解壓後）的大小上限，0 表示不限制
+            max_total_bytes: 單一工作所有圖片的總大小上限，0 表示不限制
+            executor: 讀取圖片等阻塞 I/O 使用的 executor
+        """
+        self.spool_dir = Path(spool_dir)
+        self.process_fn = process_fn
+        self.workers = workers
+        self.concurrency = concurrency
+        self.max_images = max_images
+        self.max_image_bytes = max_image_bytes
+        self.max_total_bytes = max_total_bytes
+        self.executor = executor
+
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # ---------- 生命週期 ----------
+
+    async def start(self):
+        """啟動背景 worker"""
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"工作佇列已啟動 (workers={self.workers}, spool={self.spool_dir})")
+
+    async def stop(self):
+        """停止背景 worker，執行中的工作標記為失敗"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    # ---------- 提交與查詢 ----------
+
+    def create(self, params: Dict[str, Any], source: Dict[str, str]) -> Dict[str, Any]:
+        """建立工作目錄與狀態（尚未排入佇列）"""
+        job_id = uuid.uuid4().hex
+        job_dir = self.spool_dir / job_id
+        job_dir.mkdir(parents=True)
+
+        job = {
+            "job_id": job_id,
+            "status": STATUS_QUEUED,
+            "source": source,
+            "params": params,
+            "total": None,
+            "processed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "pid": os.getpid()
+        }
+        self._jobs[job_id] = job
+        self._save(job)
+        return job
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.spool_dir / job_id
+
+    def input_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / "input"
+
+    def results_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / "results.jsonl"
+
+    async def submit(self, job: Dict[str, Any]):
+        """把已建立的工作排入佇列"""
+        await self._queue.put(job["job_id"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查詢工作狀態（本行程的工作直接回傳，其他行程的工作從 job.json 讀取）"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        return self._load(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """列出 spool 目錄中的所有工作（新到舊）"""
+        if not self.spool_dir.is_dir():
+            return []
+        jobs = [self.get(p.name) for p in self.spool_dir.iterdir() if p.is_dir()]
+        return sorted((j for j in jobs if j is not None), key=lambda j: j["created_at"], reverse=True)
+
+    def cancel(self, job_id: str) -> bool:
+        """要求取消工作（建立取消標記，執行中的工作會在下一張圖片前停止）"""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job["status"] in ACTIVE_STATUSES:
+            (self.job_dir(job_id) / "cancel").touch()
+        return True
+
+    def delete(self, job_id: str) -> bool:
+        """刪除已結束工作的所有檔案"""
+        job = self.get(job_id)
+        if job is None or job["status"] in ACTIVE_STATUSES:
+            return False
+        self.discard(job_id)
+        return True
+
+    def discard(self, job_id: str):
+        """移除尚未排入佇列的工作（例如上傳的壓縮檔無效）"""
+        self._jobs.pop(job_id, None)
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """本行程的工作統計"""
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": counts
+        }
+
+    # ---------- 持久化 ----------
+
+    def _save(self, job: Dict[str, Any]):
+        """原子寫入 job.json"""
+        path = self.job_dir(job["job_id"]) / "job.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(job, ensure_ascii=False))
+        os.replace(tmp, path)
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id.isalnum():
+            return None
+        try:
+            job = json.loads((self.job_dir(job_id) / "job.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+        if job["status"] in ACTIVE_STATUSES and not _pid_alive(job.get("pid")):
+            job["status"] = STATUS_FAILED
+            job["error"] = "執行工作的行程已結束，工作中斷"
+        return job
+
+    # ---------- 執行 ----------
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                job["status"] = STATUS_FAILED
+                job["error"] = "服務關閉，工作中斷"
+                job["finished_at"] = time.time()
+                self._save(job)
+                raise
+            except Exception as e:
+                logger.error(f"工作 {job_id} 失敗: {str(e)}")
+                job["status"] = STATUS_FAILED
+                job["error"] = str(e)
+                job["finished_at"] = time.time()
+                self._save(job)
+
+    async def _run(self, job: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        job_id = job["job_id"]
+        cancel_flag = self.job_dir(job_id) / "cancel"
+
+        source = await loop.run_in_executor(self.executor, self._open_source, job)
+        try:
+            job["total"] = len(source.names)
+            if job["total"] > self.max_images:
+                raise ValueError(f"圖片數 {job['total']} 超過上限 {self.max_images}")
+            total_bytes = sum(source.sizes.values())
+            if self.max_total_bytes and total_bytes > self.max_total_bytes:
+                raise ValueError(f"圖片總大小 {total_bytes} bytes 超過上限 {self.max_total_bytes} bytes")
+
+            job["status"] = STATUS_RUNNING
+            job["started_at"] = time.time()
+            self._save(job)
+            logger.info(f"工作 {job_id} 開始，共 {job['total']} 張圖片")
+
+            async def process(index: int, name: str) -> Dict[str, Any]:
+                try:
+                    data = await loop.run_in_executor(self.executor, source.read, name)
+                    result = await self.process_fn(data, job["params"])
+                    return {"index": index, "name": name, "success": True, **result}
+                except Exception as e:
+                    return {"index": index, "name": name, "success": False, "error": str(e)}
+
+            last_saved = time.monotonic()
+            pending = set()
+
+            with open(self.results_path(job_id), "w", encoding="utf-8") as out:
+
+                def write(done):
+                    for task in done:
+                        item = task.result()
+                        out.write(json.dumps(item, ensure_ascii=False) + "\n")
+                        job["processed"] += 1
+                        job["succeeded" if item["success"] else "failed"] += 1
+
+                # 同時只保留 concurrency 個進行中的圖片，記憶體不隨工作大小成長
+                for index, name in enumerate(source.names):
+                    if cancel_flag.exists():
+                        break
+                    if len(pending) >= self.concurrency:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        write(done)
+                    pending.add(asyncio.create_task(process(index, name)))
+
+                    if time.monotonic() - last_saved >= 1.0:
+                        out.flush()
+                        self._save(job)
+                        last_saved = time.monotonic()
+
+                if pending:
+                    done, _ = await asyncio.wait(pending)
+                    write(done)
+
+        finally:
+            source.close()
+            self.input_path(job_id).unlink(missing_ok=True)
+
+        job["status"] = STATUS_CANCELLED if cancel_flag.exists() else STATUS_COMPLETED
+        job["finished_at"] = time.time()
+        self._save(job)
+        logger.info(
+            f"工作 {job_id} {job['status']}: 成功 {job['succeeded']} 張，失敗 {job['failed']} 張，"
+            f"耗時 {job['finished_at'] - job['started_at']:.1f} 秒"
+        )
+
+    def _open_source(self, job: Dict[str, Any]):
+        source = job["source"]
+        if source["type"] == "directory":
+            return DirectorySource(Path(source["path"]), self.max_image_bytes)
+        return ArchiveSource(self.input_path(job["job_id"]), self.max_image_bytes)
+
+
+def is_archive(path: Path) -> bool:
+    """檔案是否為支援的壓縮檔（zip / tar）"""
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
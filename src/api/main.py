@@ -4,16 +4,53 @@ FastAPI Backend for YOLO Object Detection
 提供圖片上傳和即時物件偵測 API
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
+from starlette.routing import Match
 from ultralytics import YOLO
-from PIL import Image
-import io
+from ultralytics.utils import ASSETS
 import numpy as np
-from typing import List, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import json
 import logging
+import os
+import shutil
+import sys
+import time
+
+# 讓同目錄模組在 `uvicorn src.api.main:app` 與 `python src/api/main.py` 兩種啟動方式下都能匯入
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from acceleration import GRAPH_EAGER, PRECISION_BF16, PRECISION_FP32, AcceleratedForward, bf16_supported
+from admission import AdmissionController
+from backends import BACKEND_TORCH, available_backends, load_backend
+from batching import MicroBatcher
+from cascade import CascadeGate
+from coalescing import InflightCoalescer
+from degradation import LoadDegrader
+from deadlines import ClientDisconnected, Deadline, DeadlineExceeded, parse_timeout_ms, run_until
+from decoding import decode_image, decode_raw, input_size, probe_size
+from metrics import MetricsRegistry, StageTimer
+from filters import (
+    RegionOutsideImage, crop_region, limit_detections, model_options, parse_classes, parse_region,
+    region_decode_target
+)
+from jobs import ACTIVE_STATUSES, JobManager, is_archive
+from postprocess import (
+    RESPONSE_FORMATS, build_columns, detection_count, extract_arrays, render_detections,
+    scale_arrays
+)
+from raw_frames import decode_frame
+from registry import ModelRegistry, ModelVersion, estimate_memory, parse_model_sources
+from result_cache import ResultCache, file_fingerprint
+from tiling import concat_arrays, merge_detections, offset_arrays, tile_grid
+from warmup import parse_image_sizes, parse_int_list, run_warmup
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
@@ -36,18 +73,413 @@ app.add_middleware(
 )
 
 # 全域變數
-model = None
-MODEL_PATH = "runs/train/exp/weights/best.pt"
+registry = None
+batcher = None
+job_manager = None
+ready = False
+warmup_report = None
+warmup_task = None
+watch_task = None
+MODEL_PATH = os.getenv("MODEL_PATH", "runs/train/exp/weights/best.pt")
 CLASS_NAMES = {
     0: '0', 1: '1', 2: '2', 3: '3', 4: '4',
     5: '5', 6: '6', 7: '7', 8: '8', 9: '9'
 }
 
+# 推論後端：torch / onnxruntime / openvino（非 torch 後端會把轉換後的模型快取在 .pt 旁）
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", BACKEND_TORCH)
+
+# CPU 推論加速（僅 torch 後端）：INFERENCE_PRECISION 為 fp32 / bf16（CPU 不支援 bf16 時維持 fp32），
+# INFERENCE_GRAPH 為 eager / trace / compile。trace / compile 的輸入形狀固定為正方形 IMGSZ_ALLOWED ×
+# GRAPH_BATCH_SIZES（批次補齊），暖機時全部建立並比對；追蹤圖依權重雜湊與輸入形狀快取在 COMPILED_CACHE_DIR，
+# 總大小上限 COMPILED_CACHE_MAX_MB（0 表示不限制）。
+# 暖機後與 FP32 eager 比對偵測頭輸出，並以 PARITY_IMAGES（檔案或目錄，以 os.pathsep 分隔；
+# 預設為 ultralytics 附帶的範例圖片）比對最終偵測結果，超過容許值時自動退回 FP32 eager
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", PRECISION_FP32)
+INFERENCE_GRAPH = os.getenv("INFERENCE_GRAPH", GRAPH_EAGER)
+COMPILED_CACHE_DIR = os.getenv("COMPILED_CACHE_DIR", "runs/compiled")
+COMPILED_CACHE_MAX_MB = float(os.getenv("COMPILED_CACHE_MAX_MB", "1024"))
+PARITY_BOX_TOLERANCE_PX = float(os.getenv("PARITY_BOX_TOLERANCE_PX", "4.0"))
+PARITY_SCORE_TOLERANCE = float(os.getenv("PARITY_SCORE_TOLERANCE", "0.05"))
+PARITY_MIN_IOU = float(os.getenv("PARITY_MIN_IOU", "0.9"))          # 配對框的最小 IoU
+PARITY_IMAGES = [p for p in os.getenv("PARITY_IMAGES", str(ASSETS)).split(os.pathsep) if p]
+PARITY_MAX_IMAGES = 8
+PARITY_CONF_THRESHOLD = 0.25    # 與 /predict 預設相同
+PARITY_IOU_THRESHOLD = 0.45
+
+# 模型註冊表：MODEL_PATH 為預設模型（名稱 default，常駐不淘汰）；MODELS 以 "名稱=權重檔,..." 設定
+# 其他可用模型，請求以 model 參數選擇，第一次使用時載入。常駐模型超過 MODEL_MEMORY_BUDGET_MB 時
+# 淘汰最久未使用者（0 表示不限制）。新版本在背景載入並暖機後才替換，進行中的請求在舊版本上完成
+DEFAULT_MODEL_NAME = "default"
+MODEL_SOURCES = parse_model_sources(os.getenv("MODELS", ""))
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "0"))   # 權重檔變更時自動熱更新（0 表示停用）
+# /models/{name}/reload 可指定的權重檔目錄（以 os.pathsep 分隔，預設為已設定權重檔所在目錄）
+MODEL_ALLOWED_DIRS = [
+    Path(p).resolve()
+    for p in (os.getenv("MODEL_ALLOWED_DIRS", "").split(os.pathsep) if os.getenv("MODEL_ALLOWED_DIRS")
+              else {str(Path(w).parent) for w in [MODEL_PATH, *MODEL_SOURCES.values()]})
+    if p
+]
+
+# 微批次設定：同時到達的請求會合併為一次批次推論
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+# trace / compile 模式的批次補齊大小（預設為 2 的次方直到 BATCH_MAX_SIZE），每個大小各一份執行圖
+GRAPH_BATCH_SIZES = parse_int_list(os.getenv(
+    "GRAPH_BATCH_SIZES",
+    ",".join(str(min(2 ** i, BATCH_MAX_SIZE)) for i in range(BATCH_MAX_SIZE.bit_length() + 1))
+))
+if max(GRAPH_BATCH_SIZES) < BATCH_MAX_SIZE:
+    GRAPH_BATCH_SIZES.append(BATCH_MAX_SIZE)
+
+# 輸入尺寸：請求可用 imgsz 參數從允許清單中選擇，各尺寸共用同一個推論器，啟動時逐一暖機
+IMGSZ_ALLOWED = parse_int_list(os.getenv("IMGSZ_ALLOWED", "640"))
+IMGSZ_DEFAULT = int(os.getenv("IMGSZ_DEFAULT", "640"))
+if IMGSZ_DEFAULT not in IMGSZ_ALLOWED:
+    IMGSZ_ALLOWED.append(IMGSZ_DEFAULT)
+
+# 快速解碼：大圖在解碼階段（JPEG DCT 縮放）直接縮到不小於模型輸入尺寸，座標再換算回原圖；
+# 實際目標長邊為 max(DECODE_TARGET_SIZE, imgsz)，設為 0 表示完整解碼原圖
+DECODE_TARGET_SIZE = int(os.getenv("DECODE_TARGET_SIZE", "640"))
+
+# 暖機設定：啟動後在每個圖片尺寸與批次大小組合執行 N 次假推論，完成後 /health/ready 才回應 200
+WARMUP_ITERATIONS = int(os.getenv("WARMUP_ITERATIONS", "2"))
+WARMUP_IMAGE_SIZES = parse_image_sizes(os.getenv("WARMUP_IMAGE_SIZES", "640"))
+WARMUP_BATCH_SIZES = parse_int_list(os.getenv("WARMUP_BATCH_SIZES", f"1,{BATCH_MAX_SIZE}"))
+
+# 執行緒池設定：解碼與後處理在 preprocess 池執行，模型推論固定在單一 inference 執行緒，
+# 事件迴圈只負責 I/O，慢圖片不會卡住 /health 等其他請求
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+preprocess_executor = ThreadPoolExecutor(PREPROCESS_WORKERS, thread_name_prefix="preprocess")
+inference_executor = ThreadPoolExecutor(1, thread_name_prefix="inference")
+# 熱更新與按需載入的模型在獨立執行緒載入並暖機，不佔用 inference 執行緒
+model_loader_executor = ThreadPoolExecutor(1, thread_name_prefix="model-loader")
+
+# 准入控制：同時處理中的圖片超過上限時回應 503 + Retry-After
+MAX_PENDING_REQUESTS = int(os.getenv("MAX_PENDING_REQUESTS", "64"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "1"))
+admission = AdmissionController(MAX_PENDING_REQUESTS, RETRY_AFTER_SECONDS)
+
+# 負載自適應降級：DEGRADE_MODEL 為 MODELS 中的輕量模型名稱（啟動時載入並暖機，常駐不淘汰）。
+# 排隊深度（佔用准入名額的圖片數）或近期 p95 延遲達到門檻時，未指定 model 的請求改用輕量模型；
+# 兩者都降到門檻 × DEGRADE_RECOVER_RATIO 以下且已降級 DEGRADE_MIN_HOLD_SECONDS 秒後才切回。未設定表示停用
+DEGRADE_MODEL = os.getenv("DEGRADE_MODEL", "")
+DEGRADE_QUEUE_DEPTH = int(os.getenv("DEGRADE_QUEUE_DEPTH", str(MAX_PENDING_REQUESTS // 2)))   # 0 表示不看排隊深度
+DEGRADE_P95_MS = float(os.getenv("DEGRADE_P95_MS", "0"))                                      # 0 表示不看延遲
+DEGRADE_RECOVER_RATIO = float(os.getenv("DEGRADE_RECOVER_RATIO", "0.5"))
+DEGRADE_MIN_HOLD_SECONDS = float(os.getenv("DEGRADE_MIN_HOLD_SECONDS", "10"))
+DEGRADE_WINDOW_SECONDS = float(os.getenv("DEGRADE_WINDOW_SECONDS", "10"))             # p95 的樣本時間窗
+degrader = None
+if DEGRADE_MODEL:
+    if DEGRADE_MODEL not in MODEL_SOURCES:
+        raise ValueError(f"DEGRADE_MODEL={DEGRADE_MODEL} 未在 MODELS 中設定")
+    degrader = LoadDegrader(
+        # 含解碼、排隊與推論中的即時請求圖片，比批次佇列更早反映積壓（離線工作優先權較低，不計入）
+        lambda: admission.foreground_in_flight,
+        queue_depth_threshold=DEGRADE_QUEUE_DEPTH,
+        p95_threshold_ms=DEGRADE_P95_MS,
+        recover_ratio=DEGRADE_RECOVER_RATIO,
+        min_hold_seconds=DEGRADE_MIN_HOLD_SECONDS,
+        window_seconds=DEGRADE_WINDOW_SECONDS
+    )
+
+# 兩階段推論：/predict?cascade=true 時先以 CASCADE_MODEL（MODELS 中的小模型，常駐不淘汰）推論，
+# 沒有偵測結果或任一偵測的信心度落在 [CASCADE_UNCERTAIN_LOW, CASCADE_UNCERTAIN_HIGH) 時
+# 才以請求的模型（大模型）重新推論。未設定 CASCADE_MODEL 表示停用
+CASCADE_MODEL = os.getenv("CASCADE_MODEL", "")
+CASCADE_UNCERTAIN_LOW = float(os.getenv("CASCADE_UNCERTAIN_LOW", "0.25"))
+CASCADE_UNCERTAIN_HIGH = float(os.getenv("CASCADE_UNCERTAIN_HIGH", "0.6"))
+CASCADE_ESCALATE_EMPTY = os.getenv("CASCADE_ESCALATE_EMPTY", "true").lower() in ("1", "true", "yes")
+cascade_gate = None
+if CASCADE_MODEL:
+    if CASCADE_MODEL not in MODEL_SOURCES:
+        raise ValueError(f"CASCADE_MODEL={CASCADE_MODEL} 未在 MODELS 中設定")
+    cascade_gate = CascadeGate(CASCADE_UNCERTAIN_LOW, CASCADE_UNCERTAIN_HIGH, CASCADE_ESCALATE_EMPTY)
+
+# 啟動時與預設模型一起載入並暖機、常駐不淘汰的模型
+RESIDENT_MODELS = [DEFAULT_MODEL_NAME] + sorted({name for name in (DEGRADE_MODEL, CASCADE_MODEL) if name})
+
+# 請求期限：客戶端以 X-Request-Timeout-Ms 標頭或 timeout_ms 參數指定（毫秒，自請求到達起算），
+# 未指定時使用 REQUEST_TIMEOUT_MS（0 表示沒有期限）。期限已過的請求在推論前放棄並回應 504，
+# 客戶端斷線的請求回應 499；排隊中的推論會一併取消
+REQUEST_TIMEOUT_MS = float(os.getenv("REQUEST_TIMEOUT_MS", "30000"))
+DISCONNECT_POLL_MS = float(os.getenv("DISCONNECT_POLL_MS", "100"))   # 檢查客戶端斷線的間隔
+REQUEST_TIMEOUT_HEADER = "x-request-timeout-ms"
+
+# /predict/batch 設定：單次上傳張數上限與同時處理的圖片數（並行視窗）
+BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "200"))
+BATCH_STREAM_WINDOW = int(os.getenv("BATCH_STREAM_WINDOW", str(BATCH_MAX_SIZE * 2)))
+
+# 切片推論：/predict?tiled=true 時以原始解析度切成重疊圖塊推論，再以全域 NMS 合併；
+# 每個圖塊佔一個准入名額，因此 max_tiles 上限預設與 MAX_PENDING_REQUESTS 相同
+TILE_MAX_TILES = int(os.getenv("TILE_MAX_TILES", str(MAX_PENDING_REQUESTS)))
+TILE_MERGE_THRESHOLD = float(os.getenv("TILE_MERGE_THRESHOLD", "0.6"))   # 接縫重複框的 IoS 閾值
+
+# 偵測範圍控制：classes（類別清單）與 max_det（數量上限）在模型的 NMS 中處理，
+# roi（感興趣區域）在推論前裁切；未指定 max_det 時使用 MAX_DET_DEFAULT（ultralytics 預設 300）
+MAX_DET_DEFAULT = int(os.getenv("MAX_DET_DEFAULT", "300"))
+MAX_DET_LIMIT = int(os.getenv("MAX_DET_LIMIT", str(MAX_DET_DEFAULT)))
+
+# 離線批次工作：壓縮檔上傳或伺服器端目錄，結果逐行寫入 JOB_SPOOL_DIR/<job_id>/results.jsonl
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", "runs/jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))                                      # 同時執行的工作數
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", str(BATCH_MAX_SIZE * 2)))           # 每個工作同時處理的圖片數
+JOB_MAX_IMAGES = int(os.getenv("JOB_MAX_IMAGES", "100000"))
+# 大小以壓縮檔成員標頭的解壓後大小計算，避免壓縮炸彈在讀取時佔滿記憶體；0 表示不限制
+JOB_MAX_IMAGE_MB = float(os.getenv("JOB_MAX_IMAGE_MB", "32"))                         # 單張圖片上限
+JOB_MAX_TOTAL_MB = float(os.getenv("JOB_MAX_TOTAL_MB", "0"))                          # 單一工作總大小上限
+# 離線工作與即時請求共用准入名額但優先權較低：至少保留 JOB_RESERVED_SLOTS 個名額給即時請求，
+# 名額不足時工作圖片等待（不拒絕、不設期限），不會佔滿推論執行緒而讓 /predict 被拒
+JOB_RESERVED_SLOTS = int(os.getenv("JOB_RESERVED_SLOTS", str(MAX_PENDING_REQUESTS // 2)))
+JOB_ADMISSION_POLL_SECONDS = 0.05
+# 允許以 directory 提交的伺服器端根目錄（以 os.pathsep 分隔），未設定時只接受壓縮檔上傳
+JOB_ALLOWED_DIRS = [
+    Path(p).resolve() for p in os.getenv("JOB_ALLOWED_DIRS", "").split(os.pathsep) if p
+]
+
+# 推論結果快取：以圖片內容雜湊 + 推論參數 + 模型識別碼為鍵（RESULT_CACHE_MAX_MB=0 表示停用）
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "64"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR") or None
+result_cache = None
+if RESULT_CACHE_MAX_MB > 0:
+    result_cache = ResultCache(
+        max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+        ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+        disk_dir=RESULT_CACHE_DIR
+    )
+
+# 進行中請求合併：相同圖片與參數的同時請求只推論一次
+coalescer = InflightCoalescer()
+
+# 效能指標（Prometheus 文字格式，/metrics）
+# 請求帶有 X-Stage-Timings: 1 標頭時，回應會附上 Server-Timing 標頭列出各階段耗時
+STAGE_TIMINGS_HEADER = "x-stage-timings"
+# 偵測回應都附上 X-Model 標頭（名稱@版本），標示實際服務的模型
+MODEL_HEADER = "x-model"
+metrics = MetricsRegistry()
+REQUESTS_TOTAL = metrics.counter(
+    "yolo_api_requests_total", "HTTP 請求數", ("endpoint", "method", "status")
+)
+REQUEST_SECONDS = metrics.histogram(
+    "yolo_api_request_duration_seconds", "HTTP 請求處理時間（至回應開始）", ("endpoint",)
+)
+REQUESTS_IN_PROGRESS = metrics.gauge(
+    "yolo_api_requests_in_progress", "處理中的 HTTP 請求數", ("endpoint",)
+)
+IMAGES_TOTAL = metrics.counter(
+    "yolo_api_images_total", "處理的圖片數", ("endpoint", "model", "backend", "cached")
+)
+STAGE_SECONDS = metrics.histogram(
+    "yolo_api_stage_duration_seconds", "單張圖片各處理階段耗時", ("stage", "backend")
+)
+REQUESTS_SHED = metrics.counter(
+    "yolo_api_requests_shed_total",
+    "因期限已過（expired: 推論前、timeout: 處理中）或客戶端斷線（disconnected）而放棄的請求",
+    ("endpoint", "reason")
+)
+CASCADE_TOTAL = metrics.counter(
+    "yolo_api_cascade_total",
+    "兩階段推論的判斷結果（accepted: 採用小模型結果、no_detections / uncertain: 升級到大模型）",
+    ("outcome",)
+)
+BATCH_SIZE = metrics.histogram(
+    "yolo_api_batch_size", "微批次大小", ("backend",), buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+BATCH_SECONDS = metrics.histogram(
+    "yolo_api_batch_inference_seconds", "每個微批次的前向運算時間", ("backend",)
+)
+metrics.gauge(
+    "yolo_api_queue_depth", "排隊中尚未進入批次的圖片數",
+    callback=lambda: {(): batcher.queue_depth if batcher is not None else 0}
+)
+metrics.gauge(
+    "yolo_api_admission_in_flight", "佔用准入名額的圖片數（含排隊與處理中）",
+    callback=lambda: {(): admission.in_flight}
+)
+metrics.gauge(
+    "yolo_api_model_info", "常駐的模型版本（值固定為 1）", ("model", "version", "model_path", "backend"),
+    callback=lambda: {
+        (name, v.version, str(v.weights_path), v.backend): 1
+        for name, v in ((name, registry.active(name)) for name in registry.names)
+        if v is not None
+    } if registry is not None else {}
+)
+metrics.gauge(
+    "yolo_api_degraded", "負載過高、未指定模型的請求改用輕量模型時為 1",
+    callback=lambda: {(): 1 if degrader is not None and degrader.degraded else 0}
+)
+metrics.gauge(
+    "yolo_api_ready", "暖機完成且可接收流量時為 1",
+    callback=lambda: {(): 1 if ready else 0}
+)
+
+
+def component_stats() -> Dict[tuple, float]:
+    """把各元件的統計 dict 攤平成 (元件, 項目) 標籤"""
+    components = {
+        "batching": batcher.stats if batcher is not None else {},
+        "admission": admission.stats,
+        "coalescing": coalescer.stats,
+        "result_cache": result_cache.stats if result_cache is not None else {},
+        "registry": registry.stats if registry is not None else {},
+        "degradation": degrader.stats if degrader is not None else {},
+        "cascade": cascade_gate.stats if cascade_gate is not None else {},
+        "jobs": job_manager.snapshot()["jobs"] if job_manager is not None else {}
+    }
+    return {
+        (component, name): value
+        for component, stats in components.items()
+        for name, value in stats.items()
+    }
+
+
+metrics.gauge(
+    "yolo_api_component_stat", "批次、准入、請求合併與結果快取的累計統計", ("component", "stat"),
+    callback=component_stats
+)
+
+
+def default_version() -> Optional[ModelVersion]:
+    """預設模型目前服務中的版本"""
+    return registry.active(DEFAULT_MODEL_NAME) if registry is not None else None
+
+
+async def resolve_model(name: Optional[str]) -> ModelVersion:
+    """
+    取得請求指定的模型版本，尚未載入的模型會在此載入
+
+    未指定時為預設模型（負載降級由即時推論端點以 route_model 處理）。
+
+    Raises:
+        HTTPException: 預設模型尚未載入（503）、未知的模型名稱（404）或載入失敗（503）
+    """
+    if default_version() is None:
+        raise HTTPException(status_code=503, detail="模型尚未載入")
+
+    try:
+        return await registry.get(name or DEFAULT_MODEL_NAME)
+    except KeyError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"未知的模型: {name}，可用模型: {', '.join(registry.names)}"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"模型 {name} 載入失敗: {str(e)}")
+
+
+def route_model(name: Optional[str]) -> Optional[str]:
+    """
+    即時推論端點的模型路由：未指定模型且負載過高（見 DEGRADE_MODEL）時改用輕量模型
+
+    只在 /predict、/predict/raw、/predict/batch 呼叫；/model/info 與 /jobs 不受一時的負載影響，
+    也不計入降級統計
+    """
+    if name is None and degrader is not None and degrader.route():
+        return DEGRADE_MODEL
+    return name
+
+
+def record_batch(batch_size: int, seconds: float):
+    """微批次完成時記錄批次大小與前向運算時間"""
+    version = default_version()
+    backend = version.backend if version is not None else ""
+    BATCH_SIZE.observe(batch_size, backend=backend)
+    BATCH_SECONDS.observe(seconds, backend=backend)
+
+
+def record_stages(timer: StageTimer, backend: str):
+    """把單張圖片的階段耗時寫入直方圖"""
+    for stage, elapsed_ms in timer.stages.items():
+        STAGE_SECONDS.observe(elapsed_ms / 1000, stage=stage, backend=backend)
+
+
+def observe_latency(timer: StageTimer, output: dict):
+    """
+    把單張圖片的處理延遲提供給負載自適應降級判斷
+
+    只採計實際執行推論的請求；命中結果快取或合併等待的結果不代表推論負載，
+    計入會讓 p95 在熱門圖片多時被低估。
+    """
+    if degrader is None or output["cached"] or "inference" not in timer.stages:
+        return
+    degrader.observe(sum(timer.stages.values()))
+
+
+def wants_stage_timings(request: Request) -> bool:
+    """請求是否要求在回應中附上各階段耗時"""
+    return request.headers.get(STAGE_TIMINGS_HEADER, "").lower() in ("1", "true", "yes")
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """記錄每個端點的請求數、處理時間與處理中請求數"""
+    endpoint = "other"
+    for route in app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            endpoint = route.path
+            break
+
+    REQUESTS_IN_PROGRESS.inc(endpoint=endpoint)
+    # 請求期限自此起算（上傳內容在端點函式執行前就已讀取）
+    request.state.received_at = time.monotonic()
+    # 端點收到的 receive 被 call_next 包裝過，無法立即回報斷線；斷線檢查改用這裡的原始 receive
+    request.state.is_disconnected = request.is_disconnected
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_PROGRESS.dec(endpoint=endpoint)
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        REQUESTS_TOTAL.inc(endpoint=endpoint, method=request.method, status=str(status))
+
 
 @app.on_event("startup")
 async def load_model():
-    """啟動時載入 YOLO 模型"""
-    global model
+    """
+    啟動時載入 YOLO 模型
+
+    多 worker 模式（serve.py）下模型已由父行程預先載入並透過 fork 共用，此時跳過載入，
+    只在各 worker 內啟動微批次排程器與暖機。
+    """
+    global watch_task
+
+    if registry is None:
+        preload_model()
+
+    if result_cache is not None:
+        removed = result_cache.prune_disk()
+        if removed:
+            logger.info(f"已清除 {removed} 筆過期的磁碟快取")
+
+    await start_batcher()
+    await start_jobs()
+    start_warmup()
+
+    if MODEL_WATCH_SECONDS > 0:
+        watch_task = asyncio.create_task(registry.watch(MODEL_WATCH_SECONDS))
+
+
+def preload_model():
+    """
+    建立模型註冊表並同步載入常駐模型（可在 fork worker 之前由父行程呼叫）
+
+    載入時即建立推論器（融合權重），但不執行推論；暖機在各 worker 啟動後進行
+    """
+    global registry
+
+    registry = ModelRegistry(
+        load_version,
+        warmer=warm_version,
+        memory_budget_bytes=int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024),
+        pinned=RESIDENT_MODELS,
+        executor=model_loader_executor
+    )
 
     model_path = Path(MODEL_PATH)
 
@@ -56,11 +488,662 @@ async def load_model():
         logger.info("請先訓練模型或指定正確的模型路徑")
         # 使用預訓練模型作為備用
         logger.info("使用預訓練模型 yolo11n.pt 作為備用")
-        model = YOLO("yolo11n.pt")
+        registry.configure(DEFAULT_MODEL_NAME, "yolo11n.pt")
+    else:
+        registry.configure(DEFAULT_MODEL_NAME, MODEL_PATH)
+
+    for name, weights_path in MODEL_SOURCES.items():
+        registry.configure(name, weights_path)
+
+    # 降級與兩階段推論用的小模型也須常駐，負載尖峰時不能再花時間載入
+    for name in RESIDENT_MODELS:
+        registry.load_sync(name)
+
+
+def load_version(name: str, weights_path: str) -> ModelVersion:
+    """載入權重並建立各輸入尺寸的模型實例（同步，由註冊表呼叫）"""
+    logger.info(f"載入模型: {weights_path} (後端: {INFERENCE_BACKEND})")
+    try:
+        model = load_backend(weights_path, INFERENCE_BACKEND)
+        backend = INFERENCE_BACKEND
+    except Exception as e:
+        if INFERENCE_BACKEND == BACKEND_TORCH:
+            raise
+        logger.error(f"無法以 {INFERENCE_BACKEND} 後端載入模型: {str(e)}，改用 {BACKEND_TORCH}")
+        model = YOLO(weights_path)
+        backend = BACKEND_TORCH
+    logger.info("✓ 模型載入成功")
+
+    # 模型識別碼（權重檔內容雜湊 + 後端）作為結果快取鍵的一部分，換模型後舊快取自然失效
+    fingerprint = file_fingerprint(weights_path) if Path(weights_path).is_file() else str(weights_path)
+    model_id = f"{fingerprint}:{backend}"
+
+    # 必須在建立推論器前掛上，推論器複製模型時才會共用加速路徑
+    acceleration = None
+    if backend == BACKEND_TORCH:
+        acceleration = accelerate_model(model, fingerprint)
+        if acceleration is not None and acceleration.precision != PRECISION_FP32:
+            # 精度不同結果略有差異，不與 FP32 共用結果快取
+            model_id = f"{model_id}:{acceleration.precision}"
+
+    # imgsz 不是推論器的建立參數（ultralytics 每次呼叫都依 imgsz 重新計算前處理尺寸），
+    # 所以各尺寸共用同一個推論器與同一份融合後的權重，切換尺寸不會重建
+    build_predictor(model)
+    logger.info(f"✓ 已建立 {name} 的推論器，輸入尺寸 {sorted(IMGSZ_ALLOWED)}")
+
+    return ModelVersion(
+        name,
+        weights_path,
+        backend,
+        model,
+        model_id,
+        IMGSZ_ALLOWED,
+        estimate_memory(model, weights_path, [acceleration.fast] if acceleration is not None else []),
+        acceleration
+    )
+
+
+def accelerate_model(model: YOLO, fingerprint: str) -> Optional[AcceleratedForward]:
+    """依 INFERENCE_PRECISION / INFERENCE_GRAPH 替換模型的 forward；使用預設 FP32 eager 或失敗時回傳 None"""
+    precision = INFERENCE_PRECISION
+    if precision == PRECISION_BF16 and not bf16_supported():
+        logger.warning("CPU 不支援 bfloat16 指令（AVX512-BF16 / AMX），維持 FP32")
+        precision = PRECISION_FP32
+
+    if precision == PRECISION_FP32 and INFERENCE_GRAPH == GRAPH_EAGER:
+        return None
+
+    try:
+        acceleration = AcceleratedForward(
+            model.model,
+            precision,
+            INFERENCE_GRAPH,
+            fingerprint,
+            COMPILED_CACHE_DIR,
+            image_sizes=IMGSZ_ALLOWED,
+            batch_sizes=GRAPH_BATCH_SIZES,
+            cache_max_bytes=int(COMPILED_CACHE_MAX_MB * 1024 * 1024)
+        )
+    except Exception as e:
+        logger.error(f"無法啟用 {precision}/{INFERENCE_GRAPH} 推論: {str(e)}，使用 FP32 eager")
+        return None
+
+    logger.info(f"✓ 已啟用 {precision}/{INFERENCE_GRAPH} 推論，暖機後與 FP32 比對輸出")
+    return acceleration
+
+
+def build_predictor(model: YOLO) -> Any:
+    """
+    建立模型的推論器（深複製並融合權重、建立後端 session），不執行推論
+
+    與 Model.predict 第一次呼叫時的建立方式相同，之後的呼叫只更新推論參數、沿用此推論器。
+    多 worker 模式下由父行程在 fork 前呼叫，融合後的權重才會在 worker 間共用。
+    """
+    if model.predictor is None:
+        overrides = {**model.overrides, "conf": 0.25, "batch": 1, "save": False, "mode": "predict", "rect": True}
+        predictor = model._smart_load("predictor")(overrides=overrides, _callbacks=model.callbacks)
+        predictor.setup_model(model=model.model, verbose=False)
+        model.predictor = predictor
+    return model.predictor
+
+
+def run_model(images: List[Any], imgsz: int = None, version: ModelVersion = None, **options) -> List[Any]:
+    """以一次前向運算推論多張圖片（由微批次排程器呼叫；version 為請求開始時取得的模型版本）"""
+    version = version or default_version()
+    return version.predict(images, imgsz or IMGSZ_DEFAULT, **options)
+
+
+async def start_batcher():
+    """啟動微批次排程器"""
+    global batcher
+
+    batcher = MicroBatcher(
+        run_model,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        executor=inference_executor,
+        on_batch=record_batch
+    )
+    await batcher.start()
+
+
+async def start_jobs():
+    """啟動離線批次工作佇列"""
+    global job_manager
+
+    job_manager = JobManager(
+        JOB_SPOOL_DIR,
+        process_job_image,
+        workers=JOB_WORKERS,
+        concurrency=JOB_CONCURRENCY,
+        max_images=JOB_MAX_IMAGES,
+        max_image_bytes=int(JOB_MAX_IMAGE_MB * 1024 * 1024),
+        max_total_bytes=int(JOB_MAX_TOTAL_MB * 1024 * 1024),
+        executor=preprocess_executor
+    )
+    await job_manager.start()
+
+
+def start_warmup():
+    """在背景執行暖機，期間 /health/live 正常回應，/health/ready 回應 503"""
+    global warmup_task
+
+    warmup_task = asyncio.create_task(warm_model())
+
+
+async def warm_model():
+    """以假圖片暖機常駐模型（RESIDENT_MODELS），完成後標記為 ready"""
+    global ready, warmup_report
+
+    loop = asyncio.get_running_loop()
+    versions = [registry.active(name) for name in RESIDENT_MODELS]
+
+    try:
+        for version in versions:
+            # 與微批次共用 inference 執行緒，確保不會同時呼叫模型
+            version.warmup = await loop.run_in_executor(inference_executor, warm_version, version)
+    except Exception as e:
+        logger.error(f"暖機失敗: {str(e)}")
+        warmup_report = {"completed": False, "error": str(e)}
+        return
+
+    report = versions[0].warmup
+    warmup_report = report
+    ready = True
+    logger.info(f"✓ 暖機完成，耗時 {report['total_ms']:.0f} ms，服務已就緒")
+
+
+def warm_version(version: ModelVersion) -> Dict[str, Any]:
+    """在每個允許的輸入尺寸、圖片尺寸與批次大小組合執行假推論，回傳暖機報告"""
+    logger.info(
+        f"開始暖機 {version!r}: 模型輸入尺寸 {IMGSZ_ALLOWED}，圖片尺寸 {WARMUP_IMAGE_SIZES}，"
+        f"批次 {WARMUP_BATCH_SIZES}，每組 {WARMUP_ITERATIONS} 次"
+    )
+    if version.acceleration is not None:
+        # 固定形狀的執行圖在暖機時全部建立，請求路徑上不再追蹤或編譯
+        version.acceleration.prepare()
+
+    predict = functools.partial(run_model, version=version)
+    reports = [
+        run_warmup(
+            predict,
+            WARMUP_IMAGE_SIZES,
+            WARMUP_BATCH_SIZES,
+            WARMUP_ITERATIONS,
+            imgsz=imgsz
+        )
+        for imgsz in IMGSZ_ALLOWED
+    ]
+    report = {
+        "completed": True,
+        "iterations": WARMUP_ITERATIONS,
+        "total_ms": round(sum(r["total_ms"] for r in reports), 2),
+        "runs": [
+            {"imgsz": imgsz, **run}
+            for imgsz, r in zip(IMGSZ_ALLOWED, reports)
+            for run in r["runs"]
+        ]
+    }
+
+    # 以所有固定輸入形狀（eager 模式為暖機時實際出現的形狀）與真實圖片比對加速路徑與 FP32 eager
+    if version.acceleration is not None:
+        def detect_arrays(image):
+            result = version.predict(
+                [image], IMGSZ_DEFAULT, conf=PARITY_CONF_THRESHOLD, iou=PARITY_IOU_THRESHOLD,
+                **model_options(None, MAX_DET_DEFAULT)
+            )[0]
+            return extract_arrays(result)
+
+        report["acceleration"] = version.acceleration.verify(
+            version.acceleration.shapes,
+            PARITY_BOX_TOLERANCE_PX,
+            PARITY_SCORE_TOLERANCE,
+            detect=detect_arrays,
+            images=load_parity_images(),
+            min_iou=PARITY_MIN_IOU,
+            conf=PARITY_CONF_THRESHOLD
+        )
+    return report
+
+
+def load_parity_images() -> List[Any]:
+    """讀取比對加速路徑用的真實圖片（與請求相同的解碼流程）"""
+    paths = []
+    for entry in map(Path, PARITY_IMAGES):
+        if entry.is_dir():
+            paths.extend(sorted(p for p in entry.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png")))
+        elif entry.is_file():
+            paths.append(entry)
+
+    images = []
+    for path in paths[:PARITY_MAX_IMAGES]:
+        try:
+            images.append(decode_image(path.read_bytes())[0])
+        except Exception as e:
+            logger.warning(f"無法讀取比對圖片 {path}: {str(e)}")
+
+    if not images:
+        logger.warning("沒有可用的比對圖片（PARITY_IMAGES），只比對偵測頭輸出")
+    return images
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    """關閉時停止微批次排程器與執行緒池"""
+    for task in (warmup_task, watch_task):
+        if task is not None and not task.done():
+            task.cancel()
+
+    if job_manager is not None:
+        await job_manager.stop()
+
+    if batcher is not None:
+        await batcher.stop()
+
+    preprocess_executor.shutdown(wait=False)
+    inference_executor.shutdown(wait=False)
+    model_loader_executor.shutdown(wait=False)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """在 preprocess 執行緒池執行同步函式，避免阻塞事件迴圈"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        preprocess_executor,
+        functools.partial(func, *args, **kwargs)
+    )
+
+
+def admit(count: int = 1):
+    """取得准入名額，佇列已滿時回應 503 並附上 Retry-After"""
+    if not admission.try_acquire(count):
+        logger.warning(f"請求佇列已滿 ({admission.in_flight}/{admission.max_pending})，拒絕 {count} 張圖片")
+        raise HTTPException(
+            status_code=503,
+            detail="伺服器忙碌中，請稍後再試",
+            headers={"Retry-After": str(admission.retry_after_seconds)}
+        )
+
+
+def release_once(count: int) -> Callable[[], Awaitable[None]]:
+    """
+    回傳只會釋放一次 count 個名額的函式
+
+    串流回應的名額由產生器結束與回應的背景工作兩處釋放：客戶端在第一次讀取前斷線時
+    產生器不會執行，只剩背景工作會釋放；兩者都執行時只釋放一次。
+    """
+    released = False
+
+    async def release():
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(count)
+
+    return release
+
+
+def decode_target(imgsz: int) -> Optional[int]:
+    """解碼時縮小的目標長邊（不小於模型輸入尺寸），None 表示完整解碼"""
+    return max(DECODE_TARGET_SIZE, imgsz) if DECODE_TARGET_SIZE > 0 else None
+
+
+def decode_upload(
+    image_data: bytes,
+    timer: StageTimer,
+    imgsz: int,
+    region: Optional[Tuple[int, int, int, int]] = None
+) -> Tuple[Any, Tuple[int, int]]:
+    """解碼上傳的圖片檔（大圖在解碼時即縮小；只推論 ROI 時以 ROI 不小於目標尺寸為準）"""
+    target = decode_target(imgsz)
+    if target is not None and region is not None:
+        target = region_decode_target(target, probe_size(image_data), region)
+    return decode_image(image_data, target, timer)
+
+
+def resolve_filters(
+    classes: Optional[str],
+    max_det: Optional[int],
+    roi: Optional[str],
+    tiled: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    檢查偵測範圍參數，回傳 {'classes', 'max_det', 'roi'} 中有指定的項目（都未指定時為 None）
+    """
+    filters = {}
+    try:
+        if classes:
+            filters["classes"] = parse_classes(classes, CLASS_NAMES)
+        if roi:
+            filters["roi"] = parse_region(roi)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if max_det is not None:
+        if not 1 <= max_det <= MAX_DET_LIMIT:
+            raise HTTPException(status_code=400, detail=f"max_det 必須介於 1 與 {MAX_DET_LIMIT} 之間")
+        filters["max_det"] = max_det
+
+    if tiled and "roi" in filters:
+        raise HTTPException(status_code=400, detail="roi 不能與 tiled 同時使用")
+
+    return filters or None
+
+
+def resolve_imgsz(imgsz: Optional[int]) -> int:
+    """檢查 imgsz 參數是否在允許清單中，未指定時使用預設尺寸"""
+    if imgsz is None:
+        return IMGSZ_DEFAULT
+    if imgsz not in IMGSZ_ALLOWED:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支援的 imgsz: {imgsz}，可用: {', '.join(map(str, IMGSZ_ALLOWED))}"
+        )
+    return imgsz
+
+
+async def detect(
+    image_data: bytes,
+    conf_threshold: float,
+    iou_threshold: float,
+    timer: StageTimer = None,
+    decoder: Optional[Callable[[bytes, StageTimer], Tuple[Any, Tuple[int, int]]]] = None,
+    tiling: Optional[Dict[str, int]] = None,
+    imgsz: int = None,
+    version: Optional[ModelVersion] = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    解碼、推論並產生欄位格式的偵測結果
+
+    依序查詢結果快取、合併相同的進行中請求，最後才實際推論。
+    各階段耗時記錄在 timer（合併到他人請求時只記錄等待時間）。
+    decoder 將上傳內容轉為模型輸入，回傳 (圖片, 原始尺寸)，預設為依 imgsz 縮小的圖片解碼。
+    tiling 為 {'tile_size', 'overlap'} 時改以原始解析度切片推論。
+    version 為請求開始時取得的模型版本（預設為預設模型），推論期間換版不影響這個請求。
+    filters 為 resolve_filters 的結果（類別、數量上限與感興趣區域）。
+
+    Returns:
+        {'image_size': [寬, 高], 'columns': 各欄位的 list, 'cached': 是否命中快取}
+    """
+    timer = timer or StageTimer()
+    imgsz = imgsz or IMGSZ_DEFAULT
+    decoder = decoder or functools.partial(
+        decode_upload, imgsz=imgsz, region=filters.get("roi") if filters else None
+    )
+    version = version or default_version()
+
+    start = time.perf_counter()
+    request_key = await run_blocking(
+        ResultCache.make_key,
+        image_data,
+        version.model_id,
+        conf=conf_threshold,
+        iou=iou_threshold,
+        imgsz=imgsz,
+        decode_size=decode_target(imgsz),
+        tiling=tiling,
+        **({"filters": filters} if filters else {})
+    )
+
+    if result_cache is not None:
+        cached = await run_blocking(result_cache.get, request_key)
+        if cached is not None:
+            timer.add("cache_lookup", (time.perf_counter() - start) * 1000)
+            return {**cached, "cached": True}
+    timer.add("cache_lookup", (time.perf_counter() - start) * 1000)
+
+    if tiling is None:
+        work = lambda: infer(
+            image_data, conf_threshold, iou_threshold, imgsz, request_key, timer, decoder, version,
+            filters
+        )
     else:
-        logger.info(f"載入模型: {MODEL_PATH}")
-        model = YOLO(MODEL_PATH)
-        logger.info("✓ 模型載入成功")
+        work = lambda: infer_tiled(
+            image_data, conf_threshold, iou_threshold, imgsz, request_key, timer, tiling, version,
+            filters
+        )
+
+    start = time.perf_counter()
+    payload = await coalescer.run(request_key, work)
+    if "inference" not in timer.stages:
+        # 與其他進行中的相同請求合併，只記錄等待時間
+        timer.add("coalesced_wait", (time.perf_counter() - start) * 1000)
+
+    return {**payload, "cached": False}
+
+
+async def detect_cascade(
+    image_data: bytes,
+    conf_threshold: float,
+    iou_threshold: float,
+    timer: StageTimer,
+    tiling: Optional[Dict[str, int]],
+    imgsz: int,
+    first_stage: ModelVersion,
+    version: ModelVersion,
+    filters: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[str, Any], ModelVersion]:
+    """
+    兩階段推論：先以小模型推論，沒有偵測結果或有不確定的偵測時才以大模型重新推論
+
+    Returns:
+        (偵測結果（附 cascade 欄位）, 實際採用結果的模型版本)
+    """
+    output = await detect(
+        image_data, conf_threshold, iou_threshold, timer,
+        tiling=tiling, imgsz=imgsz, version=first_stage, filters=filters
+    )
+
+    reason = cascade_gate.escalation_reason(output["columns"]["confidence"])
+    cascade_gate.record(reason)
+    CASCADE_TOTAL.inc(outcome=reason or "accepted")
+    info = {"first_stage": first_stage.name, "escalated": reason is not None, "reason": reason}
+
+    if reason is None:
+        return {**output, "cascade": info}, first_stage
+
+    output = await detect(
+        image_data, conf_threshold, iou_threshold, timer,
+        tiling=tiling, imgsz=imgsz, version=version, filters=filters
+    )
+    return {**output, "cascade": info}, version
+
+
+async def infer(
+    image_data: bytes,
+    conf_threshold: float,
+    iou_threshold: float,
+    imgsz: int,
+    cache_key: str,
+    timer: StageTimer,
+    decoder: Callable[[bytes, StageTimer], Tuple[Any, Tuple[int, int]]],
+    version: ModelVersion,
+    filters: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """實際執行解碼、推論與後處理，並寫入結果快取"""
+    # 解碼與色彩轉換在執行緒池進行
+    image, (width, height) = await run_blocking(decoder, image_data, timer)
+    input_width, input_height = input_size(image)
+
+    offset = (0, 0)
+    if filters and "roi" in filters:
+        def crop():
+            with timer.stage("crop"):
+                return crop_region(image, (width, height), filters["roi"])
+
+        image, offset = await run_blocking(crop)
+
+    # 執行推論（與其他同時到達的請求合併為一次批次）；類別與數量上限在模型的 NMS 中處理
+    result = await batcher.submit(
+        image,
+        timer=timer,
+        conf=conf_threshold,
+        iou=iou_threshold,
+        imgsz=imgsz,
+        version=version,
+        **model_options(filters, MAX_DET_DEFAULT)
+    )
+
+    def postprocess():
+        with timer.stage("postprocess"):
+            arrays = scale_arrays(extract_arrays(result), width / input_width, height / input_height)
+            return build_columns(offset_arrays(arrays, *offset), CLASS_NAMES)
+
+    columns = await run_blocking(postprocess)
+    payload = {"image_size": [width, height], "columns": columns}
+
+    if result_cache is not None:
+        await run_blocking(result_cache.put, cache_key, payload)
+
+    return payload
+
+
+async def infer_tiled(
+    image_data: bytes,
+    conf_threshold: float,
+    iou_threshold: float,
+    imgsz: int,
+    cache_key: str,
+    timer: StageTimer,
+    tiling: Dict[str, int],
+    version: ModelVersion,
+    filters: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """以原始解析度切片推論，圖塊交由微批次排程器分批執行後合併為全圖結果"""
+    image, (width, height) = await run_blocking(decode_image, image_data, None, timer)
+
+    def cut(image):
+        with timer.stage("tile"):
+            # 一次轉為模型原生的 BGR 陣列，各圖塊只是其切片（不複製）
+            pixels = np.ascontiguousarray(np.asarray(image)[..., ::-1])
+            tiles = tile_grid(width, height, tiling["tile_size"], tiling["overlap"])
+            return [pixels[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles], tiles
+
+    crops, tiles = await run_blocking(cut, image)
+    del image
+
+    # 所有圖塊同時送進排程器，湊成批次推論
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        batcher.submit(
+            crop, conf=conf_threshold, iou=iou_threshold, imgsz=imgsz, version=version,
+            **model_options(filters, MAX_DET_DEFAULT)
+        )
+        for crop in crops
+    ))
+    timer.add("inference", (time.perf_counter() - start) * 1000)
+    del crops
+
+    def merge():
+        with timer.stage("postprocess"):
+            parts = [
+                offset_arrays(extract_arrays(result), x0, y0)
+                for result, (x0, y0, _, _) in zip(results, tiles)
+            ]
+            arrays = merge_detections(concat_arrays(parts), TILE_MERGE_THRESHOLD)
+            # 各圖塊已各自套用 max_det，合併後再限制全圖的數量
+            arrays = limit_detections(arrays, (filters or {}).get("max_det"))
+            return build_columns(arrays, CLASS_NAMES)
+
+    columns = await run_blocking(merge)
+    payload = {
+        "image_size": [width, height],
+        "columns": columns,
+        "tiling": {**tiling, "tiles": len(tiles)}
+    }
+
+    if result_cache is not None:
+        await run_blocking(result_cache.put, cache_key, payload)
+
+    return payload
+
+
+def validate_tiling(tile_size: int, tile_overlap: int, max_tiles: int):
+    """檢查切片推論參數"""
+    if tile_size < 64:
+        raise HTTPException(status_code=400, detail="tile_size 必須 >= 64")
+    if not 0 <= tile_overlap < tile_size:
+        raise HTTPException(status_code=400, detail="tile_overlap 必須介於 0 與 tile_size 之間")
+    if not 1 <= max_tiles <= TILE_MAX_TILES:
+        raise HTTPException(status_code=400, detail=f"max_tiles 必須介於 1 與 {TILE_MAX_TILES} 之間")
+
+
+def count_tiles(image_data: bytes, tiling: Dict[str, int], max_tiles: int) -> int:
+    """由圖片標頭計算圖塊數，超過 max_tiles 時回應 400"""
+    try:
+        width, height = probe_size(image_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"無法讀取圖片: {str(e)}")
+
+    tiles = len(tile_grid(width, height, tiling["tile_size"], tiling["overlap"]))
+    if tiles > max_tiles:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{width}x{height} 需要 {tiles} 個圖塊，超過 max_tiles={max_tiles}，"
+                   f"請加大 tile_size 或 max_tiles"
+        )
+    return tiles
+
+
+def validate_response_format(response_format: str):
+    """檢查回應格式參數"""
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支援的回應格式: {response_format}，可用: {', '.join(RESPONSE_FORMATS)}"
+        )
+
+
+def request_deadline(request: Request, timeout_ms: Optional[float]) -> Deadline:
+    """
+    建立請求期限：timeout_ms 參數優先，其次為 X-Request-Timeout-Ms 標頭，
+    都未指定時使用 REQUEST_TIMEOUT_MS
+    """
+    try:
+        header_ms = parse_timeout_ms(request.headers.get(REQUEST_TIMEOUT_HEADER))
+        query_ms = parse_timeout_ms(None if timeout_ms is None else str(timeout_ms))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    chosen_ms = query_ms if query_ms is not None else header_ms
+    if chosen_ms is None and REQUEST_TIMEOUT_MS > 0:
+        chosen_ms = REQUEST_TIMEOUT_MS
+
+    return Deadline(
+        chosen_ms / 1000 if chosen_ms is not None else None,
+        start=getattr(request.state, "received_at", None)
+    )
+
+
+def shed_request(endpoint: str, reason: str):
+    """記錄被放棄的請求並回應對應的狀態碼"""
+    REQUESTS_SHED.inc(endpoint=endpoint, reason=reason)
+    if reason == "disconnected":
+        logger.warning(f"客戶端已斷線，放棄請求: {endpoint}")
+        # 499（Client Closed Request）只會出現在日誌與指標，客戶端已收不到
+        raise HTTPException(status_code=499, detail="客戶端已斷線")
+
+    logger.warning(f"請求期限已過 ({reason})，放棄請求: {endpoint}")
+    raise HTTPException(status_code=504, detail="請求期限已過，未完成推論")
+
+
+def check_deadline(endpoint: str, deadline: Deadline):
+    """期限已過時在取得准入名額前就放棄請求"""
+    if deadline.expired:
+        shed_request(endpoint, "expired")
+
+
+async def run_before_deadline(request: Request, endpoint: str, deadline: Deadline, work) -> Any:
+    """在請求期限內執行推論；期限已過或客戶端斷線時取消（排隊中的圖片不會進入批次）"""
+    started = not deadline.expired
+    try:
+        is_disconnected = getattr(request.state, "is_disconnected", request.is_disconnected)
+        return await run_until(work, deadline, is_disconnected, DISCONNECT_POLL_MS / 1000)
+    except DeadlineExceeded:
+        shed_request(endpoint, "timeout" if started else "expired")
+    except ClientDisconnected:
+        shed_request(endpoint, "disconnected")
 
 
 @app.get("/")
@@ -71,8 +1154,15 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "predict": "/predict",
+            "predict_raw": "/predict/raw",
             "health": "/health",
-            "model_info": "/model/info"
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
+            "model_info": "/model/info",
+            "models": "/models",
+            "cache_stats": "/cache/stats",
+            "metrics": "/metrics",
+            "jobs": "/jobs"
         }
     }
 
@@ -82,29 +1172,236 @@ async def health_check():
     """健康檢查"""
     return {
         "status": "healthy",
-        "model_loaded": model is not None
+        "model_loaded": default_version() is not None,
+        "ready": ready,
+        "batching": batcher.stats if batcher is not None else None,
+        "result_cache": result_cache.snapshot() if result_cache is not None else None,
+        "coalescing": coalescer.snapshot(),
+        "admission": admission.snapshot(),
+        "models": registry.snapshot() if registry is not None else None,
+        "degradation": degrader.snapshot() if degrader is not None else None,
+        "cascade": cascade_gate.snapshot() if cascade_gate is not None else None
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """存活檢查：行程與事件迴圈可回應即為存活"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """就緒檢查：模型已載入且暖機完成才回應 200，否則 503"""
+    if default_version() is None or not ready:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "not_ready",
+                "model_loaded": default_version() is not None,
+                "warmup_completed": ready
+            }
+        )
+
+    return {"status": "ready"}
+
+
 @app.get("/model/info")
-async def model_info():
-    """取得模型資訊"""
-    if model is None:
-        raise HTTPException(status_code=503, detail="模型尚未載入")
+async def model_info(model: Optional[str] = None):
+    """取得模型資訊（model 指定模型名稱，預設為預設模型）"""
+    version = await resolve_model(model)
 
     return {
-        "model_path": MODEL_PATH,
-        "model_type": model.task,
+        "name": version.name,
+        "version": version.version,
+        "model_path": str(version.weights_path),
+        "model_type": version.model.task,
+        "backend": version.backend,
+        "available_backends": available_backends(),
+        "image_sizes": IMGSZ_ALLOWED,
+        "default_image_size": IMGSZ_DEFAULT,
         "classes": CLASS_NAMES,
-        "num_classes": len(CLASS_NAMES)
+        "num_classes": len(CLASS_NAMES),
+        "acceleration": version.acceleration.describe() if version.acceleration is not None else None,
+        "warmup": version.warmup
     }
 
 
+@app.get("/models")
+async def list_models():
+    """列出已設定的模型、服務中的版本與記憶體用量"""
+    if registry is None:
+        raise HTTPException(status_code=503, detail="模型尚未載入")
+
+    return registry.snapshot()
+
+
+def resolve_weights_path(weights: str) -> str:
+    """檢查權重檔是否位於 MODEL_ALLOWED_DIRS 之下"""
+    path = Path(weights).resolve()
+    if not any(path == root or root in path.parents for root in MODEL_ALLOWED_DIRS):
+        raise HTTPException(status_code=403, detail=f"權重檔不在允許範圍內: {weights}")
+    if not path.exists():
+        raise HTTPException(status_code=400, detail=f"找不到權重檔: {weights}")
+    return str(path)
+
+
+@app.post("/models/{name}/reload")
+async def reload_model(name: str, weights: Optional[str] = None, wait: bool = False):
+    """
+    熱更新模型：在背景載入新版本並暖機，完成後原子替換
+
+    進行中的請求在舊版本上完成，新請求在替換後才使用新版本；載入失敗時繼續使用舊版本。
+
+    Args:
+        name: 模型名稱（新名稱需提供 weights，即新增模型）
+        weights: 新的權重檔路徑，須位於 MODEL_ALLOWED_DIRS 下（預設重新載入目前的權重檔）
+        wait: 是否等到替換完成才回應（預設 false，立即回應 202）
+    """
+    if registry is None:
+        raise HTTPException(status_code=503, detail="模型尚未載入")
+
+    weights_path = resolve_weights_path(weights) if weights is not None else None
+    if weights_path is None and registry.source(name) is None:
+        raise HTTPException(status_code=404, detail=f"未知的模型: {name}")
+
+    if wait:
+        try:
+            version = await registry.reload(name, weights_path)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"模型 {name} 載入失敗: {str(e)}")
+        return {"status": "reloaded", "model": version.describe()}
+
+    task = asyncio.create_task(registry.reload(name, weights_path))
+    # 失敗已由註冊表記錄在 /models 的 last_error，這裡只取出例外避免未處理警告
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    return JSONResponse(
+        status_code=202,
+        content={"status": "reloading", "model": name, "weights": registry.source(name)}
+    )
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 文字格式的效能指標"""
+    return PlainTextResponse(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """推論結果快取統計（命中、未命中、淘汰次數等）"""
+    if result_cache is None:
+        return {"enabled": False}
+
+    return {"enabled": True, **result_cache.snapshot()}
+
+
+@app.delete("/cache")
+async def clear_cache():
+    """清除推論結果快取"""
+    if result_cache is None:
+        return {"enabled": False}
+
+    await run_blocking(result_cache.clear)
+    return {"enabled": True, "cleared": True}
+
+
+def detection_response(
+    request: Request,
+    endpoint: str,
+    filename: Optional[str],
+    output: Dict[str, Any],
+    timer: StageTimer,
+    conf_threshold: float,
+    iou_threshold: float,
+    imgsz: int,
+    response_format: str,
+    version: ModelVersion,
+    filters: Optional[Dict[str, Any]] = None
+) -> JSONResponse:
+    """組成單張偵測的回應並記錄指標"""
+    width, height = output["image_size"]
+
+    logger.info(
+        f"處理圖片: {filename}, 尺寸: {(width, height)}"
+        + (" (快取命中)" if output["cached"] else "")
+    )
+
+    # 處理結果
+    with timer.stage("render"):
+        detections = render_detections(output["columns"], response_format=response_format)
+    count = detection_count(detections)
+
+    logger.info(f"偵測到 {count} 個物件")
+
+    # 回傳結果
+    content = {
+        "success": True,
+        "filename": filename,
+        "image_size": {
+            "width": width,
+            "height": height
+        },
+        "detections": detections,
+        "detection_count": count,
+        "model": {"name": version.name, "version": version.version},
+        "parameters": {
+            "conf_threshold": conf_threshold,
+            "iou_threshold": iou_threshold,
+            "imgsz": imgsz,
+            **(filters or {})
+        }
+    }
+
+    if "cascade" in output:
+        content["cascade"] = output["cascade"]
+
+    if "tiling" in output:
+        content["tiling"] = {
+            **output["tiling"],
+            "latency_ms": round(sum(timer.stages.values()), 2)
+        }
+
+    with timer.stage("serialize"):
+        response = JSONResponse(content)
+
+    record_stages(timer, version.backend)
+    observe_latency(timer, output)
+    IMAGES_TOTAL.inc(
+        endpoint=endpoint,
+        model=version.name,
+        backend=version.backend,
+        cached=str(output["cached"]).lower()
+    )
+    response.headers[MODEL_HEADER] = repr(version)
+    if wants_stage_timings(request):
+        response.headers["Server-Timing"] = timer.server_timing()
+
+    return response
+
+
 @app.post("/predict")
 async def predict(
+    request: Request,
     file: UploadFile = File(...),
     conf_threshold: float = 0.25,
-    iou_threshold: float = 0.45
+    iou_threshold: float = 0.45,
+    response_format: str = "objects",
+    imgsz: Optional[int] = None,
+    tiled: bool = False,
+    tile_size: int = 640,
+    tile_overlap: int = 128,
+    max_tiles: int = 64,
+    timeout_ms: Optional[float] = None,
+    model: Optional[str] = None,
+    cascade: bool = False,
+    classes: Optional[str] = None,
+    max_det: Optional[int] = None,
+    roi: Optional[str] = None
 ):
     """
     物件偵測 API
@@ -113,12 +1410,34 @@ async def predict(
         file: 上傳的圖片檔案
         conf_threshold: 信心度閾值（預設 0.25）
         iou_threshold: IOU 閾值（預設 0.45）
+        response_format: objects（每個偵測一個 dict，預設）或 columnar（平行陣列）
+        imgsz: 模型輸入尺寸，須在允許清單 IMGSZ_ALLOWED 中（預設 IMGSZ_DEFAULT）
+        tiled: 是否以原始解析度切片推論（適合超大圖片中的小物件）
+        tile_size: 圖塊邊長（像素，預設 640）
+        tile_overlap: 相鄰圖塊重疊像素數（預設 128）
+        max_tiles: 圖塊數上限，超過時回應 400（預設 64）
+        timeout_ms: 請求期限（毫秒，自請求到達起算；也可用 X-Request-Timeout-Ms 標頭，
+            預設 REQUEST_TIMEOUT_MS）。期限已過回應 504，不做推論
+        model: 模型名稱（見 /models，預設為預設模型）
+        cascade: 是否先以小模型（CASCADE_MODEL）推論，不確定時才升級到 model 指定的模型
+        classes: 只偵測這些類別（以逗號分隔的類別 ID 或名稱），在模型的 NMS 中過濾
+        max_det: 偵測數量上限（信心度最高者，1 ~ MAX_DET_LIMIT）
+        roi: 感興趣區域 "x0,y0,x1,y1"（原圖像素座標），推論前裁切，回傳座標仍為全圖座標；
+            不能與 tiled 同時使用
 
     Returns:
         偵測結果 JSON
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="模型尚未載入")
+    version = await resolve_model(route_model(model))
+
+    first_stage = None
+    if cascade:
+        if cascade_gate is None:
+            raise HTTPException(status_code=400, detail="伺服器未啟用兩階段推論（未設定 CASCADE_MODEL）")
+        first_stage = await resolve_model(CASCADE_MODEL)
+        if first_stage.name == version.name:
+            # 負載降級等情況下兩階段是同一個模型，升級沒有意義
+            first_stage = None
 
     # 驗證檔案類型
     if not file.content_type.startswith("image/"):
@@ -127,75 +1446,148 @@ async def predict(
             detail=f"不支援的檔案類型: {file.content_type}，請上傳圖片檔案"
         )
 
+    validate_response_format(response_format)
+    imgsz = resolve_imgsz(imgsz)
+
+    tiling = None
+    if tiled:
+        tiling = {"tile_size": tile_size, "overlap": tile_overlap}
+        validate_tiling(tile_size, tile_overlap, max_tiles)
+
+    filters = resolve_filters(classes, max_det, roi, tiled)
+
+    deadline = request_deadline(request, timeout_ms)
+    check_deadline("/predict", deadline)
+
+    admit()
+    extra_slots = 0
+
+    timer = StageTimer()
+
     try:
         # 讀取圖片
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
+        with timer.stage("read"):
+            image_data = await file.read()
 
-        # 確保是 RGB 格式
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        if tiling is not None:
+            # 每個圖塊都佔一個准入名額（第一個已在上方取得）
+            tiles = count_tiles(image_data, tiling, max_tiles)
+            admit(tiles - 1)
+            extra_slots = tiles - 1
 
-        logger.info(f"處理圖片: {file.filename}, 尺寸: {image.size}")
+        # 推論（或命中結果快取）；期限到或客戶端斷線時取消，尚未執行的圖塊不會進入批次
+        if first_stage is not None:
+            output, version = await run_before_deadline(
+                request, "/predict", deadline,
+                detect_cascade(
+                    image_data, conf_threshold, iou_threshold, timer,
+                    tiling=tiling, imgsz=imgsz, first_stage=first_stage, version=version,
+                    filters=filters
+                )
+            )
+        else:
+            output = await run_before_deadline(
+                request, "/predict", deadline,
+                detect(
+                    image_data, conf_threshold, iou_threshold, timer,
+                    tiling=tiling, imgsz=imgsz, version=version, filters=filters
+                )
+            )
 
-        # 執行推論
-        results = model(
-            image,
-            conf=conf_threshold,
-            iou=iou_threshold,
-            verbose=False
+        return detection_response(
+            request, "/predict", file.filename, output, timer,
+            conf_threshold, iou_threshold, imgsz, response_format, version, filters
         )
 
-        # 處理結果
-        detections = []
-
-        for r in results:
-            boxes = r.boxes
-
-            for i in range(len(boxes)):
-                box = boxes[i]
-
-                # 取得資訊
-                class_id = int(box.cls[0])
-                confidence = float(box.conf[0])
-                bbox_xyxy = box.xyxy[0].tolist()  # [x1, y1, x2, y2]
-                bbox_xywh = box.xywh[0].tolist()  # [center_x, center_y, width, height]
-
-                detection = {
-                    "class_id": class_id,
-                    "class_name": CLASS_NAMES.get(class_id, f"class_{class_id}"),
-                    "confidence": round(confidence, 4),
-                    "bbox": {
-                        "x1": round(bbox_xyxy[0], 2),
-                        "y1": round(bbox_xyxy[1], 2),
-                        "x2": round(bbox_xyxy[2], 2),
-                        "y2": round(bbox_xyxy[3], 2),
-                        "center_x": round(bbox_xywh[0], 2),
-                        "center_y": round(bbox_xywh[1], 2),
-                        "width": round(bbox_xywh[2], 2),
-                        "height": round(bbox_xywh[3], 2)
-                    }
-                }
+    except HTTPException:
+        raise
 
-                detections.append(detection)
-
-        logger.info(f"偵測到 {len(detections)} 個物件")
-
-        # 回傳結果
-        return {
-            "success": True,
-            "filename": file.filename,
-            "image_size": {
-                "width": image.size[0],
-                "height": image.size[1]
-            },
-            "detections": detections,
-            "detection_count": len(detections),
-            "parameters": {
-                "conf_threshold": conf_threshold,
-                "iou_threshold": iou_threshold
-            }
-        }
+    except RegionOutsideImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        logger.error(f"推論錯誤: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"推論失敗: {str(e)}"
+        )
+
+    finally:
+        admission.release(1 + extra_slots)
+
+
+@app.post("/predict/raw")
+async def predict_raw(
+    request: Request,
+    conf_threshold: float = 0.25,
+    iou_threshold: float = 0.45,
+    response_format: str = "objects",
+    imgsz: Optional[int] = None,
+    timeout_ms: Optional[float] = None,
+    model: Optional[str] = None,
+    classes: Optional[str] = None,
+    max_det: Optional[int] = None,
+    roi: Optional[str] = None
+):
+    """
+    原始像素偵測 API（同機呼叫端使用）
+
+    請求內容為 raw_frames 格式：16 bytes 標頭加上 HxWx3 uint8 像素，
+    伺服器以 np.frombuffer 直接包裝後送進模型，不經 PIL 解碼；
+    BGR 影格完全不做色彩轉換。Python 呼叫端請使用 raw_client.py。
+
+    Args:
+        conf_threshold: 信心度閾值（預設 0.25）
+        iou_threshold: IOU 閾值（預設 0.45）
+        response_format: objects（每個偵測一個 dict，預設）或 columnar（平行陣列）
+        imgsz: 模型輸入尺寸，須在允許清單 IMGSZ_ALLOWED 中（預設 IMGSZ_DEFAULT）
+        timeout_ms: 請求期限（毫秒，同 /predict）
+        model: 模型名稱（見 /models，預設為預設模型）
+        classes / max_det / roi: 偵測範圍控制（同 /predict）
+
+    Returns:
+        偵測結果 JSON（格式與 /predict 相同，filename 為 null）
+    """
+    version = await resolve_model(route_model(model))
+
+    validate_response_format(response_format)
+    imgsz = resolve_imgsz(imgsz)
+    filters = resolve_filters(classes, max_det, roi)
+    deadline = request_deadline(request, timeout_ms)
+
+    timer = StageTimer()
+
+    with timer.stage("read"):
+        body = await request.body()
+
+    # 只解析標頭與長度（不複製像素），格式錯誤時回應 400
+    try:
+        decode_frame(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"原始像素格式錯誤: {str(e)}")
+
+    check_deadline("/predict/raw", deadline)
+    admit()
+
+    try:
+        output = await run_before_deadline(
+            request, "/predict/raw", deadline,
+            detect(
+                body, conf_threshold, iou_threshold, timer,
+                decoder=decode_raw, imgsz=imgsz, version=version, filters=filters
+            )
+        )
+
+        return detection_response(
+            request, "/predict/raw", None, output, timer,
+            conf_threshold, iou_threshold, imgsz, response_format, version, filters
+        )
+
+    except HTTPException:
+        raise
+
+    except RegionOutsideImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     except Exception as e:
         logger.error(f"推論錯誤: {str(e)}")
@@ -204,82 +1596,339 @@ async def predict(
             detail=f"推論失敗: {str(e)}"
         )
 
+    finally:
+        admission.release()
+
 
 @app.post("/predict/batch")
-async def predict_batch(files: List[UploadFile] = File(...)):
+async def predict_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    conf_threshold: float = 0.25,
+    iou_threshold: float = 0.45,
+    response_format: str = "objects",
+    imgsz: Optional[int] = None,
+    model: Optional[str] = None,
+    classes: Optional[str] = None,
+    max_det: Optional[int] = None,
+    roi: Optional[str] = None
+):
     """
     批次物件偵測 API
 
+    圖片會並行解碼並交由微批次排程器以真正的批次推論，
+    每張圖片完成後立即以 NDJSON（每行一筆 JSON）串流回傳，
+    記憶體用量只與並行視窗大小有關，不隨上傳張數成長。
+
     Args:
         files: 多個上傳的圖片檔案
+        conf_threshold: 信心度閾值（預設 0.25）
+        iou_threshold: IOU 閾值（預設 0.45）
+        response_format: objects（每個偵測一個 dict，預設）或 columnar（平行陣列）
+        imgsz: 模型輸入尺寸，須在允許清單 IMGSZ_ALLOWED 中（預設 IMGSZ_DEFAULT）
+        model: 模型名稱（見 /models，預設為預設模型；整批使用同一個版本）
+        classes / max_det / roi: 偵測範圍控制（同 /predict，套用到每張圖片）
 
     Returns:
-        批次偵測結果
+        NDJSON 串流，每行為一張圖片的偵測結果（依完成順序，以 index 對應上傳順序）
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="模型尚未載入")
+    version = await resolve_model(route_model(model))
 
-    if len(files) > 10:
+    if len(files) > BATCH_UPLOAD_MAX_FILES:
         raise HTTPException(
             status_code=400,
-            detail="一次最多上傳 10 張圖片"
+            detail=f"一次最多上傳 {BATCH_UPLOAD_MAX_FILES} 張圖片"
         )
 
-    results = []
+    validate_response_format(response_format)
+    imgsz = resolve_imgsz(imgsz)
+    filters = resolve_filters(classes, max_det, roi)
 
-    for file in files:
-        try:
-            # 重複使用 predict 的邏輯
-            image_data = await file.read()
-            image = Image.open(io.BytesIO(image_data))
-
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            # 執行推論
-            detections = []
-            model_results = model(image, verbose=False)
-
-            for r in model_results:
-                boxes = r.boxes
-                for i in range(len(boxes)):
-                    box = boxes[i]
-                    class_id = int(box.cls[0])
-                    confidence = float(box.conf[0])
-                    bbox_xywh = box.xywh[0].tolist()
-
-                    detections.append({
-                        "class_id": class_id,
-                        "class_name": CLASS_NAMES.get(class_id, f"class_{class_id}"),
-                        "confidence": round(confidence, 4),
-                        "bbox": {
-                            "center_x": round(bbox_xywh[0], 2),
-                            "center_y": round(bbox_xywh[1], 2),
-                            "width": round(bbox_xywh[2], 2),
-                            "height": round(bbox_xywh[3], 2)
-                        }
-                    })
-
-            results.append({
-                "filename": file.filename,
-                "success": True,
-                "detections": detections,
-                "detection_count": len(detections)
-            })
+    # 同一時間只佔用並行視窗大小的名額，而不是整批張數
+    window = min(len(files), BATCH_STREAM_WINDOW)
+    admit(window)
+    release = release_once(window)
 
-        except Exception as e:
-            results.append({
-                "filename": file.filename,
-                "success": False,
-                "error": str(e)
-            })
+    return StreamingResponse(
+        stream_batch_results(
+            files,
+            window,
+            release,
+            conf_threshold,
+            iou_threshold,
+            response_format,
+            imgsz,
+            version,
+            filters,
+            include_timings=wants_stage_timings(request)
+        ),
+        media_type="application/x-ndjson",
+        headers={MODEL_HEADER: repr(version)},
+        background=BackgroundTask(release)
+    )
+
+
+async def stream_batch_results(
+    files: List[UploadFile],
+    window: int,
+    release: Callable[[], Awaitable[None]],
+    conf_threshold: float,
+    iou_threshold: float,
+    response_format: str,
+    imgsz: int,
+    version: ModelVersion,
+    filters: Optional[Dict[str, Any]] = None,
+    include_timings: bool = False
+):
+    """
+    逐張產生批次偵測結果（NDJSON），結束時以 release 釋放准入名額
+
+    include_timings 為 True 時，每行附上該張圖片的 timings_ms（各階段耗時）。
+    """
+    semaphore = asyncio.Semaphore(window)
+
+    async def process(index: int, file: UploadFile) -> Dict[str, Any]:
+        async with semaphore:
+            timer = StageTimer()
+            try:
+                with timer.stage("read"):
+                    image_data = await file.read()
+
+                # 執行推論（同批上傳的圖片會在排程器中合併為批次）
+                output = await detect(
+                    image_data, conf_threshold, iou_threshold, timer,
+                    imgsz=imgsz, version=version, filters=filters
+                )
+                del image_data
+
+                with timer.stage("render"):
+                    detections = render_detections(
+                        output["columns"],
+                        include_xyxy=False,
+                        response_format=response_format
+                    )
+
+                record_stages(timer, version.backend)
+                observe_latency(timer, output)
+                IMAGES_TOTAL.inc(
+                    endpoint="/predict/batch",
+                    model=version.name,
+                    backend=version.backend,
+                    cached=str(output["cached"]).lower()
+                )
+
+                item = {
+                    "index": index,
+                    "filename": file.filename,
+                    "success": True,
+                    "detections": detections,
+                    "detection_count": detection_count(detections)
+                }
+                if include_timings:
+                    item["timings_ms"] = {k: round(v, 2) for k, v in timer.stages.items()}
+                return item
+
+            except Exception as e:
+                return {
+                    "index": index,
+                    "filename": file.filename,
+                    "success": False,
+                    "error": str(e)
+                }
+
+    tasks = [asyncio.create_task(process(i, f)) for i, f in enumerate(files)]
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    finally:
+        for task in tasks:
+            task.cancel()
+        await release()
 
+
+async def acquire_job_slot():
+    """離線工作圖片等待准入名額（低優先權，保留 JOB_RESERVED_SLOTS 個名額給即時請求）"""
+    reserve = min(JOB_RESERVED_SLOTS, MAX_PENDING_REQUESTS - 1)
+    while not admission.try_acquire_background(reserve=reserve):
+        await asyncio.sleep(JOB_ADMISSION_POLL_SECONDS)
+
+
+async def process_job_image(image_data: bytes, params: Dict[str, Any]) -> Dict[str, Any]:
+    """離線工作的單張圖片：與 /predict 共用快取、合併與微批次推論路徑"""
+    # 每張圖片取當下的版本：長時間的工作在換版後改用新版本
+    version = await registry.get(params.get("model") or DEFAULT_MODEL_NAME)
+
+    await acquire_job_slot()
+    try:
+        output = await detect(
+            image_data,
+            params["conf_threshold"],
+            params["iou_threshold"],
+            imgsz=params["imgsz"],
+            version=version
+        )
+    finally:
+        admission.release_background()
+    detections = render_detections(output["columns"], response_format=params["response_format"])
+
+    IMAGES_TOTAL.inc(
+        endpoint="/jobs",
+        model=version.name,
+        backend=version.backend,
+        cached=str(output["cached"]).lower()
+    )
+
+    width, height = output["image_size"]
     return {
-        "success": True,
-        "total_images": len(files),
-        "results": results
+        "model": {"name": version.name, "version": version.version},
+        "image_size": {"width": width, "height": height},
+        "detections": detections,
+        "detection_count": detection_count(detections)
+    }
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """工作狀態的對外格式（加上進度與連結）"""
+    job_id = job["job_id"]
+    total = job["total"]
+    return {
+        **{k: v for k, v in job.items() if k != "pid"},
+        "progress": round(job["processed"] / total, 4) if total else None,
+        "links": {
+            "status": f"/jobs/{job_id}",
+            "results": f"/jobs/{job_id}/results"
+        }
+    }
+
+
+def resolve_job_directory(directory: str) -> Path:
+    """檢查伺服器端目錄是否位於 JOB_ALLOWED_DIRS 之下"""
+    if not JOB_ALLOWED_DIRS:
+        raise HTTPException(status_code=400, detail="伺服器未開放目錄工作（未設定 JOB_ALLOWED_DIRS）")
+
+    path = Path(directory).resolve()
+    if not any(path == root or root in path.parents for root in JOB_ALLOWED_DIRS):
+        raise HTTPException(status_code=403, detail=f"目錄不在允許範圍內: {directory}")
+    if not path.is_dir():
+        raise HTTPException(status_code=400, detail=f"找不到目錄: {directory}")
+    return path
+
+
+def save_upload(upload: UploadFile, path: Path) -> bool:
+    """把上傳檔分塊寫入磁碟（不整個讀進記憶體），回傳是否為支援的壓縮檔"""
+    with open(path, "wb") as out:
+        shutil.copyfileobj(upload.file, out, 1024 * 1024)
+    return is_archive(path)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    archive: Optional[UploadFile] = File(None),
+    directory: Optional[str] = Form(None),
+    conf_threshold: float = 0.25,
+    iou_threshold: float = 0.45,
+    response_format: str = "objects",
+    imgsz: Optional[int] = None,
+    model: Optional[str] = None
+):
+    """
+    建立離線批次工作
+
+    以 archive 上傳 zip / tar 壓縮檔，或以 directory 指定伺服器端目錄（須位於 JOB_ALLOWED_DIRS 下），
+    兩者擇一。工作在背景執行，可用回傳的 job_id 查詢進度並下載 JSONL 結果。
+
+    Args:
+        archive: 圖片壓縮檔（zip / tar）
+        directory: 伺服器端圖片目錄（遞迴尋找圖片）
+        conf_threshold: 信心度閾值（預設 0.25）
+        iou_threshold: IOU 閾值（預設 0.45）
+        response_format: objects（每個偵測一個 dict，預設）或 columnar（平行陣列）
+        imgsz: 模型輸入尺寸，須在允許清單 IMGSZ_ALLOWED 中（預設 IMGSZ_DEFAULT）
+        model: 模型名稱（見 /models，預設為預設模型）
+
+    Returns:
+        工作狀態（含 job_id 與查詢連結）
+    """
+    version = await resolve_model(model)
+
+    if (archive is None) == (directory is None):
+        raise HTTPException(status_code=400, detail="請提供 archive 或 directory 其中之一")
+
+    validate_response_format(response_format)
+    params = {
+        "conf_threshold": conf_threshold,
+        "iou_threshold": iou_threshold,
+        "response_format": response_format,
+        "imgsz": resolve_imgsz(imgsz),
+        "model": version.name
     }
 
+    if directory is not None:
+        path = resolve_job_directory(directory)
+        job = job_manager.create(params, {"type": "directory", "path": str(path)})
+    else:
+        job = job_manager.create(params, {"type": "archive", "filename": archive.filename})
+        if not await run_blocking(save_upload, archive, job_manager.input_path(job["job_id"])):
+            job_manager.discard(job["job_id"])
+            raise HTTPException(status_code=400, detail="不支援的壓縮檔格式（僅支援 zip 與 tar）")
+
+    await job_manager.submit(job)
+    logger.info(f"建立工作 {job['job_id']}: {job['source']}")
+
+    return public_job(job)
+
+
+@app.get("/jobs")
+async def list_jobs():
+    """列出所有離線批次工作（新到舊）"""
+    jobs = await run_blocking(job_manager.list_jobs)
+    return {"jobs": [public_job(job) for job in jobs]}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查詢工作狀態與進度"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"找不到工作: {job_id}")
+    return public_job(job)
+
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str):
+    """
+    下載工作結果（JSONL，每行一張圖片，依完成順序，以 index 對應來源順序）
+
+    工作執行中也可下載，內容為目前已完成的部分。
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"找不到工作: {job_id}")
+
+    path = job_manager.results_path(job_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="工作尚未產生結果")
+
+    return FileResponse(path, media_type="application/x-ndjson", filename=f"{job_id}.jsonl")
+
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """取消執行中的工作，或刪除已結束工作的結果檔"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"找不到工作: {job_id}")
+
+    if job["status"] in ACTIVE_STATUSES:
+        job_manager.cancel(job_id)
+        return {"job_id": job_id, "cancel_requested": True}
+
+    job_manager.delete(job_id)
+    return {"job_id": job_id, "deleted": True}
+
 
 if __name__ == "__main__":
     import uvicorn
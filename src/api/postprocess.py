@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+偵測結果後處理
+一次將整張圖片的 cls / conf / xyxy / xywh 轉為 NumPy，再以向量化方式組成回應，
+避免逐框切片張量與多次 .tolist() 的 Python 開銷
+"""
+
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+# 回應格式
+FORMAT_OBJECTS = "objects"    # 每個偵測一個 dict（預設，與既有格式相同）
+FORMAT_COLUMNAR = "columnar"  # 平行陣列（每個欄位一個 list）
+RESPONSE_FORMATS = (FORMAT_OBJECTS, FORMAT_COLUMNAR)
+
+XYXY_KEYS = ("x1", "y1", "x2", "y2")
+XYWH_KEYS = ("center_x", "center_y", "width", "height")
+
+
+def extract_arrays(result) -> Dict[str, np.ndarray]:
+    """
+    將單張圖片的推論結果一次轉為 NumPy 陣列
+
+    Args:
+        result: ultralytics Results
+
+    Returns:
+        {'cls': (N,) int, 'conf': (N,) float, 'xyxy': (N, 4), 'xywh': (N, 4)}
+    """
+    boxes = result.boxes
+
+    if boxes is None or len(boxes) == 0:
+        return {
+            'cls': np.zeros(0, dtype=np.int64),
+            'conf': np.zeros(0, dtype=np.float32),
+            'xyxy': np.zeros((0, 4), dtype=np.float32),
+            'xywh': np.zeros((0, 4), dtype=np.float32)
+        }
+
+    return {
+        'cls': boxes.cls.cpu().numpy().astype(np.int64),
+        'conf': boxes.conf.cpu().numpy(),
+        'xyxy': boxes.xyxy.cpu().numpy(),
+        'xywh': boxes.xywh.cpu().numpy()
+    }
+
+
+def scale_arrays(
+    arrays: Dict[str, np.ndarray],
+    scale_x: float,
+    scale_y: float
+) -> Dict[str, np.ndarray]:
+    """
+    將縮小後圖片上的座標換算回原圖座標
+
+    Args:
+        arrays: extract_arrays 的輸出
+        scale_x: 原圖寬 / 推論圖寬
+        scale_y: 原圖高 / 推論圖高
+    """
+    if scale_x == 1 and scale_y == 1:
+        return arrays
+
+    scale = np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+    return {**arrays, 'xyxy': arrays['xyxy'] * scale, 'xywh': arrays['xywh'] * scale}
+
+
+def build_columns(
+    arrays: Dict[str, np.ndarray],
+    class_names: Dict[int, str],
+    include_xyxy: bool = True
+) -> Dict[str, list]:
+    """
+    以向量化方式產生各欄位的 Python list（四捨五入後一次 .tolist()）
+
+    Args:
+        arrays: extract_arrays 的輸出
+        class_names: 類別 ID 對應名稱
+        include_xyxy: 是否包含左上/右下角座標
+    """
+    class_ids = arrays['cls'].tolist()
+
+    columns = {
+        "class_id": class_ids,
+        "class_name": [class_names.get(c, f"class_{c}") for c in class_ids],
+        "confidence": np.round(arrays['conf'].astype(np.float64), 4).tolist()
+    }
+
+    if include_xyxy:
+        xyxy = np.round(arrays['xyxy'].astype(np.float64), 2)
+        for j, key in enumerate(XYXY_KEYS):
+            columns[key] = xyxy[:, j].tolist()
+
+    xywh = np.round(arrays['xywh'].astype(np.float64), 2)
+    for j, key in enumerate(XYWH_KEYS):
+        columns[key] = xywh[:, j].tolist()
+
+    return columns
+
+
+def columns_to_objects(columns: Dict[str, list], include_xyxy: bool = True) -> List[Dict[str, Any]]:
+    """將欄位格式轉為每個偵測一個 dict 的格式"""
+    bbox_keys = (XYXY_KEYS if include_xyxy else ()) + XYWH_KEYS
+    bbox_columns = [columns[key] for key in bbox_keys]
+
+    return [
+        {
+            "class_id": class_id,
+            "class_name": class_name,
+            "confidence": confidence,
+            "bbox": dict(zip(bbox_keys, values))
+        }
+        for class_id, class_name, confidence, *values in zip(
+            columns["class_id"], columns["class_name"], columns["confidence"], *bbox_columns
+        )
+    ]
+
+
+def render_detections(
+    columns: Dict[str, list],
+    include_xyxy: bool = True,
+    response_format: str = FORMAT_OBJECTS
+) -> Union[List[Dict[str, Any]], Dict[str, list]]:
+    """
+    將欄位資料（build_columns 的輸出，需含 xyxy）轉為回應中的 detections 欄位
+
+    Args:
+        columns: 各欄位的 list
+        include_xyxy: 是否包含左上/右下角座標（/predict/batch 只回傳中心點與寬高）
+        response_format: objects（每個偵測一個 dict）或 columnar（平行陣列）
+
+    Returns:
+        objects 格式為 list；columnar 格式為 {欄位: list}
+    """
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"不支援的回應格式: {response_format}")
+
+    if response_format == FORMAT_COLUMNAR:
+        if include_xyxy:
+            return columns
+        return {key: value for key, value in columns.items() if key not in XYXY_KEYS}
+
+    return columns_to_objects(columns, include_xyxy)
+
+
+def format_detections(
+    result,
+    class_names: Dict[int, str],
+    include_xyxy: bool = True,
+    response_format: str = FORMAT_OBJECTS
+) -> Union[List[Dict[str, Any]], Dict[str, list]]:
+    """
+    將單張圖片的推論結果轉為回應中的 detections 欄位
+
+    Args:
+        result: ultralytics Results
+        class_names: 類別 ID 對應名稱
+        include_xyxy: 是否包含左上/右下角座標
+        response_format: objects（每個偵測一個 dict）或 columnar（平行陣列）
+    """
+    columns = build_columns(extract_arrays(result), class_names)
+    return render_detections(columns, include_xyxy, response_format)
+
+
+def detection_count(detections: Union[List[Dict[str, Any]], Dict[str, list]]) -> int:
+    """兩種回應格式通用的偵測數量"""
+    if isinstance(detections, dict):
+        return len(detections["class_id"])
+    return len(detections)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+原始像素上傳客戶端
+已持有解碼後影格（如 OpenCV 擷取的 BGR 陣列）的呼叫端，直接把像素送到 /predict/raw，
+不必先編碼成 JPEG/PNG
+
+使用方式：
+    from raw_client import RawFrameClient
+
+    client = RawFrameClient("http://localhost:8000")
+    result = client.predict(frame)                        # OpenCV BGR 影格
+    result = client.predict(rgb_array, channel_order="rgb")
+
+    python src/api/raw_client.py path/to/image.jpg      # 命令列測試
+"""
+
+import json
+import sys
+from typing import Any, Dict, Optional
+
+import numpy as np
+import requests
+
+from raw_frames import CONTENT_TYPE, encode_frame
+
+
+class RawFrameClient:
+    """/predict/raw 客戶端（重複使用 HTTP 連線）"""
+
+    def __init__(self, base_url: str = "http://localhost:8000", timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def predict(
+        self,
+        frame: np.ndarray,
+        channel_order: str = "bgr",
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.45,
+        response_format: str = "objects",
+        headers: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        送出一張影格並回傳偵測結果
+
+        Args:
+            frame: HxWx3 uint8 陣列
+            channel_order: "bgr"（OpenCV，伺服器零複製）或 "rgb"（PIL / 多數影像函式庫）
+            conf_threshold: 信心度閾值
+            iou_threshold: IOU 閾值
+            response_format: objects 或 columnar
+            headers: 額外的 HTTP 標頭（如 X-Stage-Timings）
+
+        Returns:
+            與 /predict 相同格式的偵測結果
+
+        Raises:
+            requests.HTTPError: 伺服器回應錯誤（503 表示過載，可依 Retry-After 重試）
+        """
+        response = self.session.post(
+            f"{self.base_url}/predict/raw",
+            data=encode_frame(frame, channel_order),
+            params={
+                "conf_threshold": conf_threshold,
+                "iou_threshold": iou_threshold,
+                "response_format": response_format
+            },
+            headers={"Content-Type": CONTENT_TYPE, **(headers or {})},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+def main():
+    """命令列測試：讀取圖片後以原始像素上傳"""
+    from PIL import Image
+
+    if len(sys.argv) < 2:
+        print("用法: python src/api/raw_client.py <圖片路徑> [API 位址]")
+        sys.exit(1)
+
+    frame = np.asarray(Image.open(sys.argv[1]).convert("RGB"))
+    client = RawFrameClient(sys.argv[2] if len(sys.argv) > 2 else "http://localhost:8000")
+
+    try:
+        result = client.predict(frame, channel_order="rgb")
+    except requests.exceptions.ConnectionError:
+        print("[✗] 無法連接到 API 伺服器")
+        sys.exit(1)
+    finally:
+        client.close()
+
+    print(f"圖片尺寸: {result['image_size']['width']} x {result['image_size']['height']}")
+    print(f"偵測數量: {result['detection_count']}")
+    print(json.dumps(result['detections'], indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+原始像素上傳格式 (Raw Frame Protocol)
+同機呼叫端已持有解碼後的 uint8 影格時，直接傳送 HxWx3 像素，省去 JPEG/PNG 編碼與伺服器端解碼
+
+格式（little-endian）：
+    偏移  長度  欄位
+    0     4     magic = b"YRAW"
+    4     1     版本 = 1
+    5     1     通道順序：0 = BGR（OpenCV，模型原生順序，零複製），1 = RGB
+    6     2     保留（0）
+    8     4     高度 H
+    12    4     寬度 W
+    16    H*W*3 像素資料（uint8，列優先）
+"""
+
+import struct
+from typing import Tuple
+
+import numpy as np
+
+MAGIC = b"YRAW"
+VERSION = 1
+CONTENT_TYPE = "application/x-yolo-raw"
+
+CHANNEL_ORDER_BGR = 0
+CHANNEL_ORDER_RGB = 1
+CHANNEL_ORDERS = {"bgr": CHANNEL_ORDER_BGR, "rgb": CHANNEL_ORDER_RGB}
+
+_HEADER = struct.Struct("<4sBBHII")
+HEADER_SIZE = _HEADER.size
+
+
+def encode_frame(frame: np.ndarray, channel_order: str = "bgr") -> bytes:
+    """
+    將 HxWx3 uint8 影格打包為上傳內容
+
+    Args:
+        frame: HxWx3 uint8 陣列
+        channel_order: 影格的通道順序（"bgr" 或 "rgb"）
+    """
+    if channel_order not in CHANNEL_ORDERS:
+        raise ValueError(f"不支援的通道順序: {channel_order}，可用: {', '.join(CHANNEL_ORDERS)}")
+    if frame.dtype != np.uint8 or frame.ndim != 3 or frame.shape[2] != 3:
+        raise ValueError(f"影格必須是 HxWx3 uint8，收到 {frame.dtype} {frame.shape}")
+
+    height, width = frame.shape[:2]
+    header = _HEADER.pack(MAGIC, VERSION, CHANNEL_ORDERS[channel_order], 0, height, width)
+    return header + np.ascontiguousarray(frame).tobytes()
+
+
+def decode_frame(data: bytes) -> Tuple[np.ndarray, int]:
+    """
+    解析上傳內容，以 np.frombuffer 直接包裝像素（不複製）
+
+    Returns:
+        (HxWx3 唯讀 uint8 陣列, 通道順序)
+
+    Raises:
+        ValueError: 標頭或資料長度不正確
+    """
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f"資料長度不足 {HEADER_SIZE} bytes 的標頭")
+
+    magic, version, channel_order, _, height, width = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("標頭 magic 不正確（應為 YRAW）")
+    if version != VERSION:
+        raise ValueError(f"不支援的格式版本: {version}")
+    if channel_order not in CHANNEL_ORDERS.values():
+        raise ValueError(f"不支援的通道順序代碼: {channel_order}")
+    if height == 0 or width == 0:
+        raise ValueError(f"影格尺寸不正確: {width}x{height}")
+
+    expected = height * width * 3
+    if len(data) - HEADER_SIZE != expected:
+        raise ValueError(
+            f"像素資料長度不符: {width}x{height}x3 需要 {expected} bytes，"
+            f"收到 {len(data) - HEADER_SIZE} bytes"
+        )
+
+    frame = np.frombuffer(data, dtype=np.uint8, count=expected, offset=HEADER_SIZE)
+    return frame.reshape(height, width, 3), channel_order
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+模型註冊表 (Model Registry)
+以名稱管理多個常駐模型：新版本在背景載入並暖機完成後才原子替換，
+進行中的請求持有舊版本的參考、在舊版本上完成；超過記憶體預算時淘汰最久未使用的模型
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+import torch
+
+from result_cache import file_signature
+
+logger = logging.getLogger(__name__)
+
+
+class ModelVersion:
+    """
+    一個已載入的模型版本
+
+    權重與推論器建立後不再修改；換版時建立新物件，因此已取得參考的請求不受換版影響。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        weights_path: str,
+        backend: str,
+        model: Any,
+        model_id: str,
+        image_sizes: Iterable[int],
+        memory_bytes: int,
+        acceleration: Optional[Any] = None
+    ):
+        """
+        Args:
+            name: 模型名稱
+            weights_path: 權重檔路徑
+            backend: 推論後端
+            model: 載入的 YOLO 模型
+            model_id: 模型識別碼（權重檔內容雜湊 + 後端），作為結果快取鍵的一部分
+            image_sizes: 已準備並暖機的輸入尺寸（共用同一個推論器）
+            memory_bytes: 估計的常駐記憶體用量
+            acceleration: CPU 推論加速（AcceleratedForward，未啟用時為 None）
+        """
+        self.name = name
+        self.weights_path = weights_path
+        self.backend = backend
+        self.model = model
+        self.model_id = model_id
+        self.image_sizes: Set[int] = set(image_sizes)
+        self.memory_bytes = memory_bytes
+        self.acceleration = acceleration
+        self.signature = file_signature(weights_path)
+        self.loaded_at = time.time()
+        self.warmup: Optional[Dict[str, Any]] = None
+
+    @property
+    def version(self) -> str:
+        """版本代號（權重檔雜湊前 12 碼）"""
+        return self.model_id.split(":")[0][:12]
+
+    def predict(self, images: List[Any], imgsz: int, **options) -> List[Any]:
+        """以指定輸入尺寸推論（由推論執行緒呼叫）"""
+        if self.acceleration is not None:
+            # 固定形狀的執行圖需要正方形 letterbox
+            options = {**self.acceleration.predict_options, **options}
+        return self.model(images, imgsz=imgsz, verbose=False, **options)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "weights": str(self.weights_path),
+            "backend": self.backend,
+            "image_sizes": sorted(self.image_sizes),
+            "memory_mb": round(self.memory_bytes / 1024 / 1024, 1),
+            "loaded_at": self.loaded_at,
+            "warmed": self.warmup is not None,
+            "acceleration": self.acceleration.describe() if self.acceleration is not None else None
+        }
+
+    def __repr__(self) -> str:
+        # 微批次排程器以 repr 分組：同名不同版本的請求不會放進同一個批次
+        return f"{self.name}@{self.version}"
+
+
+def parse_model_sources(value: str) -> Dict[str, str]:
+    """
+    解析模型設定，例如 "light=yolo11n.pt,v2=runs/train/exp2/weights/best.pt"
+
+    Raises:
+        ValueError: 格式錯誤
+    """
+    sources = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, sep, weights_path = item.partition("=")
+        if not sep or not name.strip() or not weights_path.strip():
+            raise ValueError(f"模型設定格式錯誤: {item}（應為 名稱=權重檔）")
+        sources[name.strip()] = weights_path.strip()
+    return sources
+
+
+def estimate_memory(model: Any, weights_path: str, extra_modules: Iterable[Any] = ()) -> int:
+    """
+    估計模型的常駐記憶體用量（位元組）
+
+    PyTorch 模型計算模型本身、推論器持有的融合複本（ultralytics 建立推論器時會深複製模型）
+    與 extra_modules 的參數與 buffer，共用同一塊記憶體的張量只算一次；
+    匯出格式（ONNX / OpenVINO）以檔案大小近似。
+    """
+    modules = [m for m in [getattr(model, "model", None), *_predictor_modules(model), *extra_modules]
+               if isinstance(m, torch.nn.Module)]
+    if modules:
+        storages = {}
+        for module in modules:
+            for t in list(module.parameters()) + list(module.buffers()):
+                storage = t.untyped_storage()
+                storages[storage.data_ptr()] = storage.nbytes()
+        return sum(storages.values())
+
+    path = Path(weights_path)
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+
+def _predictor_modules(model: Any) -> List[Any]:
+    """推論器中的 PyTorch 模組（AutoBackend 不把模型註冊為子模組，依 .model / .backend 屬性尋找）"""
+    found = []
+    pending = [getattr(getattr(model, "predictor", None), "model", None)]
+    for _ in range(3):
+        pending = [getattr(obj, attr, None) for obj in pending if obj is not None for attr in ("model", "backend")]
+        found.extend(obj for obj in pending if isinstance(obj, torch.nn.Module))
+        # 找到 PyTorch 模組後不再往下（子模組的張量已包含在內）
+        pending = [obj for obj in pending if not isinstance(obj, torch.nn.Module)]
+    return found
+
+
+class ModelRegistry:
+    """
+    多模型註冊表
+
+    loader(name, weights_path) 負責同步載入並回傳 ModelVersion；warmer(version) 負責暖機。
+    載入與暖機都在 executor 中執行，事件迴圈與進行中的推論不受影響。
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str, str], ModelVersion],
+        warmer: Optional[Callable[[ModelVersion], Dict[str, Any]]] = None,
+        memory_budget_bytes: int = 0,
+        pinned: Iterable[str] = (),
+        executor: Optional[Any] = None
+    ):
+        """
+        Args:
+            loader: 載入模型版本的函式
+            warmer: 暖機函式，回傳暖機報告
+            memory_budget_bytes: 常駐模型的記憶體預算，0 表示不限制
+            pinned: 不會被淘汰的模型名稱（如預設模型）
+            executor: 執行載入與暖機的 executor
+        """
+        self.loader = loader
+        self.warmer = warmer
+        self.memory_budget_bytes = memory_budget_bytes
+        self.pinned = set(pinned)
+        self.executor = executor
+
+        self._sources: Dict[str, str] = {}
+        self._active: "OrderedDict[str, ModelVersion]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._last_error: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        # 統計資訊
+        self.stats = {
+            'loads': 0,
+            'reloads': 0,
+            'evictions': 0,
+            'failures': 0
+        }
+
+    def configure(self, name: str, weights_path: str):
+        """設定模型名稱對應的權重檔（不會立即載入）"""
+        with self._lock:
+            self._sources[name] = str(weights_path)
+
+    def source(self, name: str) -> Optional[str]:
+        return self._sources.get(name)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._sources)
+
+    def active(self, name: str) -> Optional[ModelVersion]:
+        """目前服務中的版本（不更新使用順序）"""
+        return self._active.get(name)
+
+    def load_sync(self, name: str) -> ModelVersion:
+        """同步載入並啟用模型（啟動時使用，暖機另外進行）"""
+        version = self.loader(name, self._sources[name])
+        self._install(name, version)
+        self.stats['loads'] += 1
+        return version
+
+    async def get(self, name: str) -> ModelVersion:
+        """
+        取得模型目前的版本，尚未載入時在背景載入並暖機（同名的並行請求共用一次載入）
+
+        Raises:
+            KeyError: 未設定的模型名稱
+        """
+        if name not in self._sources:
+            raise KeyError(name)
+
+        with self._lock:
+            version = self._active.get(name)
+            if version is not None:
+                self._active.move_to_end(name)
+                return version
+
+        return await self._load(name, reload=False)
+
+    async def reload(self, name: str, weights_path: Optional[str] = None) -> ModelVersion:
+        """
+        在背景載入新版本並暖機，完成後原子替換；載入失敗時繼續使用舊版本
+
+        Args:
+            name: 模型名稱（未設定過的名稱需提供 weights_path）
+            weights_path: 新的權重檔路徑（預設沿用目前設定）
+        """
+        if weights_path is not None:
+            self.configure(name, weights_path)
+        elif name not in self._sources:
+            raise KeyError(name)
+
+        return await self._load(name, reload=True)
+
+    def loading(self, name: str) -> bool:
+        future = self._loading.get(name)
+        return future is not None and not future.done()
+
+    async def _load(self, name: str, reload: bool) -> ModelVersion:
+        future = self._loading.get(name)
+        if future is not None and not future.done():
+            if not reload:
+                return await asyncio.shield(future)
+            # 換版要載入最新設定的權重檔：等進行中的載入結束後再開始新的載入
+            await asyncio.wait({future})
+
+        future = self._loading.get(name)
+        if future is None or future.done():
+            future = asyncio.ensure_future(self._load_and_swap(name, reload))
+            self._loading[name] = future
+        return await asyncio.shield(future)
+
+    async def _load_and_swap(self, name: str, reload: bool) -> ModelVersion:
+        loop = asyncio.get_running_loop()
+        weights_path = self._sources[name]
+        logger.info(f"載入模型 {name}: {weights_path}")
+
+        def load_and_warm() -> ModelVersion:
+            version = self.loader(name, weights_path)
+            if self.warmer is not None:
+                version.warmup = self.warmer(version)
+            return version
+
+        try:
+            version = await loop.run_in_executor(self.executor, load_and_warm)
+        except Exception as e:
+            self.stats['failures'] += 1
+            self._last_error[name] = str(e)
+            logger.error(f"模型 {name} 載入失敗: {str(e)}")
+            raise
+
+        self._last_error.pop(name, None)
+        retired = self._install(name, version)
+        self.stats['reloads' if reload and retired is not None else 'loads'] += 1
+
+        if retired is not None:
+            logger.info(f"✓ 模型 {name} 已切換版本 {retired.version} → {version.version}")
+        else:
+            logger.info(f"✓ 模型 {name} 已載入，版本 {version.version}")
+        return version
+
+    def _install(self, name: str, version: ModelVersion) -> Optional[ModelVersion]:
+        """原子替換服務中的版本並依記憶體預算淘汰，回傳被替換的舊版本"""
+        with self._lock:
+            retired = self._active.get(name)
+            self._active[name] = version
+            self._active.move_to_end(name)
+            self._enforce_budget(keep=name)
+        return retired
+
+    def _enforce_budget(self, keep: str):
+        """超過記憶體預算時淘汰最久未使用的模型（固定的模型與剛載入的模型除外）"""
+        if self.memory_budget_bytes <= 0:
+            return
+
+        for candidate in list(self._active):
+            if self._memory_in_use() <= self.memory_budget_bytes:
+                break
+            if candidate == keep or candidate in self.pinned:
+                continue
+            evicted = self._active.pop(candidate)
+            self.stats['evictions'] += 1
+            logger.info(f"超過模型記憶體預算，淘汰 {evicted!r}")
+
+    def _memory_in_use(self) -> int:
+        return sum(v.memory_bytes for v in self._active.values())
+
+    def changed(self) -> List[str]:
+        """權重檔已變更（大小或修改時間不同）的服務中模型名稱"""
+        with self._lock:
+            return [
+                name for name, version in self._active.items()
+                if self._sources.get(name) == version.weights_path
+                and file_signature(version.weights_path) not in (None, version.signature)
+            ]
+
+    async def watch(self, interval: float):
+        """定期檢查權重檔，變更時在背景重新載入"""
+        while True:
+            await asyncio.sleep(interval)
+            for name in self.changed():
+                if self.loading(name):
+                    continue
+                logger.warning(f"偵測到模型 {name} 的權重檔變更，重新載入")
+                try:
+                    await self.reload(name)
+                except Exception:
+                    # 失敗已記錄；權重檔仍在寫入時下一輪會再試
+                    pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各模型的狀態與統計"""
+        with self._lock:
+            active = dict(self._active)
+            order = list(self._active)
+
+        return {
+            "models": {
+                name: {
+                    "weights": source,
+                    "loaded": name in active,
+                    "loading": self.loading(name),
+                    "last_error": self._last_error.get(name),
+                    **({"active": active[name].describe(), "lru_rank": order.index(name)} if name in active else {})
+                }
+                for name, source in self._sources.items()
+            },
+            "memory_budget_mb": round(self.memory_budget_bytes / 1024 / 1024, 1),
+            "memory_in_use_mb": round(sum(v.memory_bytes for v in active.values()) / 1024 / 1024, 1),
+            **self.stats
+        }
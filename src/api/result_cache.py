@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+推論結果快取 (Content-Addressed Result Cache)
+以圖片內容雜湊、推論參數與模型識別碼作為鍵，快取偵測結果，
+記憶體層為有容量上限的 LRU + TTL，可選用磁碟層讓快取在重啟後仍有效
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def file_fingerprint(path: str, chunk_size: int = 1 << 20) -> str:
+    """計算檔案內容的 SHA-256（作為模型識別碼）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """檔案的 (大小, 修改時間)，用來低成本偵測模型檔是否變更"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class ResultCache:
+    """
+    推論結果快取
+
+    值必須可序列化為 JSON。記憶體層以序列化後的位元組數計算容量，
+    超過上限時淘汰最久未使用的項目；過期項目在讀取時移除。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        disk_dir: Optional[str] = None
+    ):
+        """
+        初始化快取
+
+        Args:
+            max_bytes: 記憶體層容量上限（位元組）
+            ttl_seconds: 項目存活秒數
+            disk_dir: 磁碟層目錄（None 表示不使用磁碟層）
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+
+        # key -> (過期時間, 位元組數, 值)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # 統計資訊
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'disk_hits': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_data: bytes, model_id: str, **params) -> str:
+        """由圖片內容、模型識別碼與推論參數產生快取鍵"""
+        digest = hashlib.sha256()
+        digest.update(model_id.encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        digest.update(hashlib.sha256(image_data).digest())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """讀取快取，未命中或已過期時回傳 None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return value
+
+                del self._entries[key]
+                self._bytes -= size
+                self.stats['expirations'] += 1
+
+        value = self._disk_get(key, now)
+
+        with self._lock:
+            if value is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self.stats['disk_hits'] += 1
+
+        # 磁碟命中的項目放回記憶體層
+        self._memory_put(key, value, json.dumps(value, ensure_ascii=False), now)
+        return value
+
+    def put(self, key: str, value: Any):
+        """寫入快取（記憶體層與磁碟層）"""
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+
+        self._memory_put(key, value, payload, now)
+        self._disk_put(key, payload, now)
+
+    def clear(self):
+        """清除全部快取（含磁碟層）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.stats['invalidations'] += 1
+
+        if self.disk_dir is not None:
+            for path in self.disk_dir.glob("*/*.json"):
+                path.unlink(missing_ok=True)
+
+    def prune_disk(self) -> int:
+        """刪除磁碟層中已過期的項目，回傳刪除數量"""
+        if self.disk_dir is None:
+            return 0
+
+        now = time.time()
+        removed = 0
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    expired = json.load(f).get('expires_at', 0) <= now
+            except (OSError, ValueError):
+                expired = True
+            if expired:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def snapshot(self) -> Dict[str, Any]:
+        """快取狀態與統計"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'disk_dir': str(self.disk_dir) if self.disk_dir else None,
+                'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else 0.0,
+                **self.stats
+            }
+
+    def _memory_put(self, key: str, value: Any, payload: str, now: float):
+        """寫入記憶體層並依容量上限淘汰 LRU 項目"""
+        size = len(payload.encode())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (now + self.ttl_seconds, size, value)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.stats['evictions'] += 1
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str, now: float) -> Optional[Any]:
+        """讀取磁碟層，過期或損毀的檔案直接刪除"""
+        if self.disk_dir is None:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            path.unlink(missing_ok=True)
+            return None
+
+        if record.get('expires_at', 0) <= now:
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.stats['expirations'] += 1
+            return None
+
+        return record.get('value')
+
+    def _disk_put(self, key: str, payload: str, now: float):
+        """以原子方式寫入磁碟層（先寫暫存檔再 rename）"""
+        if self.disk_dir is None:
+            return
+
+        path = self._disk_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(f'{{"expires_at": {now + self.ttl_seconds}, "value": {payload}}}')
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"寫入磁碟快取失敗: {e}")
+            tmp_path.unlink(missing_ok=True)
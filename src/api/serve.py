@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+多 worker 推論服務 (Pre-fork Serving)
+父行程先載入模型並建立推論器，再 fork 多個 uvicorn worker 共用同一份融合權重（copy-on-write），
+每個 worker 的 PyTorch intra-op 執行緒數自動設為 CPU 核心數 / worker 數
+
+使用方式：
+    python src/api/serve.py --workers 4 --port 8000
+    python src/api/serve.py --workers 4 --memory-report 60   # 啟動 60 秒後列出各 worker 記憶體
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import torch
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import main  # noqa: E402
+
+logger = logging.getLogger("serve")
+
+
+def cpu_count() -> int:
+    """目前行程可使用的 CPU 核心數"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def memory_usage(pid: int) -> Dict[str, float]:
+    """
+    讀取行程記憶體用量（MB，需 Linux /proc/<pid>/smaps_rollup）
+
+    Returns:
+        {'rss': 常駐記憶體, 'pss': 按共用行程數分攤後的記憶體, 'shared': 共用頁面, 'private': 私有頁面}
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) / 1024
+    except OSError:
+        return {}
+
+    return {
+        'rss': fields.get('Rss', 0.0),
+        'pss': fields.get('Pss', 0.0),
+        'shared': fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0),
+        'private': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0)
+    }
+
+
+def report_memory(parent_pid: int, worker_pids: List[int]):
+    """列出父行程與各 worker 的記憶體用量"""
+    rows = [("parent", parent_pid)] + [(f"worker {i}", pid) for i, pid in enumerate(worker_pids)]
+
+    print("=" * 68)
+    print(f"{'行程':<10} {'PID':>8} {'RSS (MB)':>11} {'PSS (MB)':>11} {'共用 (MB)':>11} {'私有 (MB)':>11}")
+    print("=" * 68)
+
+    total_pss = 0.0
+    for name, pid in rows:
+        usage = memory_usage(pid)
+        if not usage:
+            print(f"{name:<10} {pid:>8}  （無法讀取 /proc/{pid}/smaps_rollup）")
+            continue
+        total_pss += usage['pss']
+        print(f"{name:<10} {pid:>8} {usage['rss']:>11.1f} {usage['pss']:>11.1f} "
+              f"{usage['shared']:>11.1f} {usage['private']:>11.1f}")
+
+    print("=" * 68)
+    print(f"總 PSS（實際佔用的實體記憶體）: {total_pss:.1f} MB")
+
+
+def create_socket(host: str, port: int) -> socket.socket:
+    """由父行程建立監聽 socket，所有 worker 共用"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, threads: int, log_level: str):
+    """worker 行程：設定執行緒數後以共用 socket 執行 uvicorn"""
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    torch.set_num_threads(threads)
+
+    config = uvicorn.Config(main.app, log_level=log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def spawn_worker(sock: socket.socket, threads: int, log_level: str) -> int:
+    """fork 一個 worker，回傳其 PID"""
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            run_worker(sock, threads, log_level)
+        except Exception as e:
+            logger.error(f"worker {os.getpid()} 異常結束: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    return pid
+
+
+def main_loop():
+    """主程式：預先載入模型、fork worker 並在 worker 異常結束時重新啟動"""
+    parser = argparse.ArgumentParser(description='YOLO Detection API 多 worker 服務')
+    parser.add_argument('--host', type=str, default='0.0.0.0', help='監聽位址')
+    parser.add_argument('--port', type=int, default=8000, help='監聽埠號')
+    parser.add_argument('--workers', type=int, default=2, help='worker 行程數')
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help='每個 worker 的 PyTorch intra-op 執行緒數（預設: CPU 核心數 / worker 數）')
+    parser.add_argument('--log-level', type=str, default='info', help='uvicorn 日誌等級')
+    parser.add_argument('--memory-report', type=float, default=None,
+                        help='啟動幾秒後列出各 worker 的記憶體用量')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if not hasattr(os, "fork"):
+        logger.error("此平台不支援 fork，請改用 uvicorn src.api.main:app 單一行程模式")
+        sys.exit(1)
+
+    cores = cpu_count()
+    threads = args.threads_per_worker or max(1, cores // args.workers)
+    logger.info(f"CPU 核心數: {cores}，worker 數: {args.workers}，每個 worker 執行緒數: {threads}")
+
+    # 父行程載入權重並建立推論器（深複製並融合後的權重即推論實際使用的那份），但不執行推論，
+    # 避免 fork 前初始化 OpenMP 執行緒池；worker 直接沿用這份融合權重，以 copy-on-write 共用
+    main.preload_model()
+    for name in main.RESIDENT_MODELS:
+        main.build_predictor(main.registry.active(name).model)
+
+    # 把目前所有物件移出 GC 追蹤，避免 worker 的 GC 寫入物件標頭而複製共用頁面
+    gc.collect()
+    gc.freeze()
+
+    sock = create_socket(args.host, args.port)
+    logger.info(f"監聽 http://{args.host}:{args.port}")
+
+    workers = [spawn_worker(sock, threads, args.log_level) for _ in range(args.workers)]
+    shutting_down = False
+
+    def handle_signal(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    report_at = time.monotonic() + args.memory_report if args.memory_report is not None else None
+
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+
+        if pid == 0:
+            if report_at is not None and time.monotonic() >= report_at:
+                report_memory(os.getpid(), workers)
+                report_at = None
+            time.sleep(0.5)
+            continue
+
+        if pid in workers:
+            workers.remove(pid)
+            if not shutting_down:
+                logger.warning(f"worker {pid} 結束 (status={status})，重新啟動")
+                workers.append(spawn_worker(sock, threads, args.log_level))
+
+    sock.close()
+    logger.info("所有 worker 已結束")
+
+
+if __name__ == "__main__":
+    main_loop()
@@ -79,6 +79,37 @@ def test_predict(image_path: str):
     print()
 
 
+def test_predict_raw(image_path: str):
+    """測試原始像素偵測（與 /predict 結果應一致）"""
+    print("=" * 60)
+    print(f"測試原始像素偵測 (/predict/raw)")
+    print("=" * 60)
+
+    img_path = Path(image_path)
+
+    if not img_path.exists():
+        print(f"[✗] 找不到圖片: {image_path}")
+        return
+
+    from PIL import Image
+    import numpy as np
+    from raw_client import RawFrameClient
+
+    frame = np.asarray(Image.open(img_path).convert('RGB'))
+    client = RawFrameClient("http://localhost:8000")
+
+    try:
+        result = client.predict(frame, channel_order='rgb', conf_threshold=0.25)
+        print(f"圖片尺寸: {result['image_size']['width']} x {result['image_size']['height']}")
+        print(f"偵測數量: {result['detection_count']}")
+    except requests.exceptions.HTTPError as e:
+        print(f"Error: {e.response.text}")
+    finally:
+        client.close()
+
+    print()
+
+
 def main():
     """主程式"""
     print("\n🚀 開始測試 YOLO Detection API\n")
@@ -96,6 +127,7 @@ def main():
 
         if test_images:
             test_predict(str(test_images[0]))
+            test_predict_raw(str(test_images[0]))
         else:
             print("[⚠] 找不到測試圖片")
 
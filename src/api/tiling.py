@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+切片推論 (Tiled Inference)
+超大圖片切成互相重疊的圖塊，以原始解析度分批推論後把偵測框換回全圖座標，
+再以全域 NMS 移除圖塊接縫處的重複偵測
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# 圖塊 (x0, y0, x1, y1)
+Tile = Tuple[int, int, int, int]
+
+
+def _positions(length: int, tile_size: int, step: int) -> List[int]:
+    """單一軸上的圖塊起點，最後一塊貼齊邊緣"""
+    if length <= tile_size:
+        return [0]
+    positions = list(range(0, length - tile_size + 1, step))
+    if positions[-1] != length - tile_size:
+        positions.append(length - tile_size)
+    return positions
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: int) -> List[Tile]:
+    """
+    計算覆蓋整張圖片的重疊圖塊
+
+    Args:
+        width: 圖片寬
+        height: 圖片高
+        tile_size: 圖塊邊長（像素）
+        overlap: 相鄰圖塊重疊的像素數
+
+    Returns:
+        [(x0, y0, x1, y1), ...]，由左到右、由上到下
+    """
+    if tile_size < 1:
+        raise ValueError("tile_size 必須 >= 1")
+    if not 0 <= overlap < tile_size:
+        raise ValueError("overlap 必須介於 0 與 tile_size 之間")
+
+    step = tile_size - overlap
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in _positions(height, tile_size, step)
+        for x in _positions(width, tile_size, step)
+    ]
+
+
+def offset_arrays(arrays: Dict[str, np.ndarray], x0: int, y0: int) -> Dict[str, np.ndarray]:
+    """將圖塊內座標平移為全圖座標"""
+    if x0 == 0 and y0 == 0:
+        return arrays
+
+    xyxy = arrays['xyxy'] + np.array([x0, y0, x0, y0], dtype=np.float32)
+    xywh = arrays['xywh'] + np.array([x0, y0, 0, 0], dtype=np.float32)
+    return {**arrays, 'xyxy': xyxy, 'xywh': xywh}
+
+
+def concat_arrays(parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """串接多個 extract_arrays 輸出"""
+    return {key: np.concatenate([p[key] for p in parts]) for key in ('cls', 'conf', 'xyxy', 'xywh')}
+
+
+def merge_detections(arrays: Dict[str, np.ndarray], threshold: float) -> Dict[str, np.ndarray]:
+    """
+    全域 NMS：同類別的框依信心度由高到低保留，移除與已保留框重疊過多者
+
+    重疊以「交集 / 較小框面積」（IoS）計算：接縫處被切斷的框只是完整框的一部分，
+    與完整框的 IoU 可能很低，但 IoS 接近 1。
+
+    Args:
+        arrays: 全圖座標的偵測結果
+        threshold: IoS 超過此值視為重複
+    """
+    xyxy = arrays['xyxy'].astype(np.float32)
+    if len(xyxy) == 0:
+        return arrays
+
+    areas = np.clip(xyxy[:, 2] - xyxy[:, 0], 0, None) * np.clip(xyxy[:, 3] - xyxy[:, 1], 0, None)
+    order = np.argsort(-arrays['conf'], kind='stable')
+    cls = arrays['cls']
+    keep = []
+
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        x1 = np.maximum(xyxy[i, 0], xyxy[rest, 0])
+        y1 = np.maximum(xyxy[i, 1], xyxy[rest, 1])
+        x2 = np.minimum(xyxy[i, 2], xyxy[rest, 2])
+        y2 = np.minimum(xyxy[i, 3], xyxy[rest, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        ios = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+
+        duplicate = (ios > threshold) & (cls[rest] == cls[i])
+        order = rest[~duplicate]
+
+    keep = np.array(keep, dtype=np.int64)
+    return {key: value[keep] for key, value in arrays.items()}
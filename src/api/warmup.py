@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+模型暖機 (Model Warmup)
+啟動後先以假圖片執行數次推論，讓延遲初始化（記憶體配置、執行圖建立等）
+在接收正式流量前完成，並記錄各情境的暖機延遲
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def parse_image_sizes(value: str) -> List[Tuple[int, int]]:
+    """
+    解析圖片尺寸設定
+
+    Args:
+        value: 逗號分隔的尺寸，"640" 表示 640x640，"1280x720" 表示寬 x 高
+
+    Returns:
+        [(寬, 高), ...]
+    """
+    sizes = []
+    for item in value.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        if "x" in item:
+            width, height = item.split("x", 1)
+            sizes.append((int(width), int(height)))
+        else:
+            sizes.append((int(item), int(item)))
+    return sizes
+
+
+def parse_int_list(value: str) -> List[int]:
+    """解析逗號分隔的整數列表（去除重複並保持順序）"""
+    numbers = []
+    for item in value.split(","):
+        item = item.strip()
+        if item and int(item) not in numbers:
+            numbers.append(int(item))
+    return numbers
+
+
+def run_warmup(
+    predict_fn: Callable[..., Sequence[Any]],
+    image_sizes: List[Tuple[int, int]],
+    batch_sizes: List[int],
+    iterations: int,
+    **options
+) -> Dict[str, Any]:
+    """
+    在每個圖片尺寸與批次大小組合下執行 iterations 次假推論
+
+    Args:
+        predict_fn: 批次推論函式（與微批次排程器使用的相同）
+        image_sizes: 假圖片尺寸 [(寬, 高), ...]
+        batch_sizes: 批次大小列表
+        iterations: 每種組合的推論次數
+        **options: 傳給模型的推論參數
+
+    Returns:
+        暖機報告（各組合的首次與穩定延遲）
+    """
+    runs = []
+    start = time.perf_counter()
+
+    if iterations < 1:
+        return {"iterations": 0, "total_ms": 0.0, "runs": runs}
+
+    for width, height in image_sizes:
+        dummy = np.zeros((height, width, 3), dtype=np.uint8)
+
+        for batch_size in batch_sizes:
+            latencies = []
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                predict_fn([dummy] * batch_size, **options)
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+            runs.append({
+                "image_size": [width, height],
+                "batch_size": batch_size,
+                "first_ms": round(latencies[0], 2),
+                "last_ms": round(latencies[-1], 2),
+                "mean_ms": round(float(np.mean(latencies)), 2)
+            })
+            logger.info(
+                f"暖機 {width}x{height} batch={batch_size}: "
+                f"首次 {latencies[0]:.1f} ms，最後 {latencies[-1]:.1f} ms"
+            )
+
+    return {
+        "iterations": iterations,
+        "total_ms": round((time.perf_counter() - start) * 1000, 2),
+        "runs": runs
+    }
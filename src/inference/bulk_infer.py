@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+離線大量推論 (Bulk Inference)
+不經 HTTP 直接以訓練好的權重推論整個目錄：多行程預先解碼與 letterbox，主行程批次推論，
+結果逐批寫入 JSONL 或 Parquet，中斷後重新執行會從上次完成處繼續
+
+使用方式：
+    python src/inference/bulk_infer.py --source /data/images --output results.jsonl
+    python src/inference/bulk_infer.py --source /data/images --output results_parquet --format parquet \\
+        --weights runs/train/exp/weights/best.pt --batch 32 --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Set
+
+import numpy as np
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+EXIF_ORIENTATION = 0x0112
+
+XYXY_KEYS = ("x1", "y1", "x2", "y2")
+
+# 預先解碼行程的全域設定（由 Pool initializer 設定）
+_letterbox = None
+_imgsz = None
+
+
+def iter_images(source: Path) -> Iterator[str]:
+    """以固定順序逐一產生來源目錄下的圖片相對路徑（不一次列出整個目錄樹）"""
+    entries = sorted(os.scandir(source), key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            for name in iter_images(Path(entry.path)):
+                yield f"{entry.name}/{name}"
+        elif Path(entry.name).suffix.lower() in IMAGE_EXTENSIONS:
+            yield entry.name
+
+
+def _init_worker(imgsz: int):
+    """
+    預先解碼行程初始化：建立 letterbox 並限制每個行程的執行緒數
+
+    固定補成 imgsz x imgsz 正方形（auto=False），同一批次的張量形狀才會一致；
+    與 ultralytics 單張推論的矩形 letterbox 相比填充較多，偵測結果可能有些微差異。
+    """
+    global _letterbox, _imgsz
+
+    import cv2
+    from ultralytics.data.augment import LetterBox
+
+    cv2.setNumThreads(1)
+    _imgsz = imgsz
+    _letterbox = LetterBox(new_shape=(imgsz, imgsz), auto=False)
+
+
+def load_image(path: str) -> Dict[str, Any]:
+    """
+    在預先解碼行程中讀取單張圖片：JPEG 以 DCT 縮放直接解碼到接近模型尺寸，
+    再 letterbox 成 imgsz x imgsz 的 BGR 陣列
+
+    Returns:
+        {'path', 'image': letterbox 後的陣列, 'shape': letterbox 前 (高, 寬), 'size': 原圖 (寬, 高)}
+        讀取失敗時為 {'path', 'error'}
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(path)
+        size = image.size
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+
+        if image.format == 'JPEG' and max(size) > _imgsz:
+            ratio = _imgsz / max(size)
+            image.draft('RGB', (int(size[0] * ratio + 0.999), int(size[1] * ratio + 0.999)))
+
+        image = ImageOps.exif_transpose(image.convert('RGB'))
+        if orientation in (5, 6, 7, 8):
+            size = size[::-1]
+
+        pixels = np.asarray(image)[..., ::-1]
+        return {
+            'path': path,
+            'image': _letterbox(image=np.ascontiguousarray(pixels)),
+            'shape': pixels.shape[:2],
+            'size': size
+        }
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+
+
+def load_batch(paths: List[str]) -> List[Dict[str, Any]]:
+    return [load_image(path) for path in paths]
+
+
+def prefetch_batches(
+    pool: Pool,
+    paths: Iterator[str],
+    batch_size: int,
+    prefetch: int
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    依序產生已解碼的批次；最多同時有 prefetch 個批次在預先解碼行程中處理，
+    推論較慢時不會無限制堆積解碼後的圖片
+    """
+    pending = deque()
+
+    def submit() -> bool:
+        batch = [path for _, path in zip(range(batch_size), paths)]
+        if batch:
+            pending.append(pool.apply_async(load_batch, (batch,)))
+        return bool(batch)
+
+    while len(pending) < prefetch and submit():
+        pass
+
+    while pending:
+        batch = pending.popleft().get()
+        submit()
+        yield batch
+
+
+class JsonlWriter:
+    """JSONL 輸出（每張圖片一行，附加寫入）"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def completed(self) -> Set[str]:
+        """已完成的圖片路徑；最後一行若因中斷而不完整，截斷後重新處理"""
+        done = set()
+        if not self.path.exists():
+            return done
+
+        valid_bytes = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['path'])
+                except (ValueError, KeyError):
+                    break
+                valid_bytes += len(line)
+
+        if valid_bytes < self.path.stat().st_size:
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        return done
+
+    def open(self, overwrite: bool):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'w' if overwrite else 'a', encoding='utf-8')
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self._file.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Parquet 輸出（目錄下每次執行一個 part 檔，每批一個 row group；需要 pyarrow）"""
+
+    def __init__(self, path: Path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("[✗] Parquet 輸出需要安裝 pyarrow: pip install pyarrow")
+            sys.exit(1)
+
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.schema = pa.schema(
+            [
+                ('path', pa.string()),
+                ('width', pa.int32()),
+                ('height', pa.int32()),
+                ('error', pa.string()),
+                ('class_id', pa.list_(pa.int32())),
+                ('class_name', pa.list_(pa.string())),
+                ('confidence', pa.list_(pa.float32()))
+            ]
+            + [(key, pa.list_(pa.float32())) for key in XYXY_KEYS]
+        )
+        self._writer = None
+
+    def _parts(self) -> List[Path]:
+        return sorted(self.path.glob('part-*.parquet')) if self.path.is_dir() else []
+
+    def completed(self) -> Set[str]:
+        """已完成的圖片路徑（無法讀取的 part 檔視為中斷時未寫完，直接刪除）"""
+        done = set()
+        for part in self._parts():
+            try:
+                done.update(self.pq.read_table(part, columns=['path']).column('path').to_pylist())
+            except Exception:
+                print(f"[⚠] 刪除不完整的輸出檔: {part}")
+                part.unlink()
+        return done
+
+    def open(self, overwrite: bool):
+        self.path.mkdir(parents=True, exist_ok=True)
+        if overwrite:
+            for part in self._parts():
+                part.unlink()
+        part = self.path / f"part-{len(self._parts()):05d}.parquet"
+        self._writer = self.pq.ParquetWriter(part, self.schema)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        columns = {name: [] for name in self.schema.names}
+        for row in rows:
+            detections = row.get('detections', [])
+            columns['path'].append(row['path'])
+            columns['width'].append(row.get('width'))
+            columns['height'].append(row.get('height'))
+            columns['error'].append(row.get('error'))
+            for key in ('class_id', 'class_name', 'confidence'):
+                columns[key].append([d[key] for d in detections])
+            for key in XYXY_KEYS:
+                columns[key].append([d['bbox'][key] for d in detections])
+        self._writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def to_rows(
+    batch: List[Dict[str, Any]],
+    results: List[Any],
+    source: Path,
+    imgsz: int,
+    class_names: Dict[int, str]
+) -> List[Dict[str, Any]]:
+    """把 letterbox 座標換算回原圖，組成輸出列"""
+    from ultralytics.utils.ops import scale_boxes
+
+    rows = []
+    for item, result in zip(batch, results):
+        height, width = item['shape']
+        orig_w, orig_h = item['size']
+
+        boxes = result.boxes
+        xyxy = scale_boxes((imgsz, imgsz), boxes.xyxy.clone(), (height, width)).cpu().numpy()
+        xyxy = np.round(xyxy * np.array([orig_w / width, orig_h / height] * 2), 2)
+        class_ids = boxes.cls.cpu().numpy().astype(int).tolist()
+        confidences = np.round(boxes.conf.cpu().numpy().astype(np.float64), 4).tolist()
+
+        rows.append({
+            'path': str(Path(item['path']).relative_to(source)),
+            'width': orig_w,
+            'height': orig_h,
+            'detections': [
+                {
+                    'class_id': class_id,
+                    'class_name': class_names.get(class_id, f"class_{class_id}"),
+                    'confidence': confidence,
+                    'bbox': dict(zip(XYXY_KEYS, box))
+                }
+                for class_id, confidence, box in zip(class_ids, confidences, xyxy.tolist())
+            ]
+        })
+    return rows
+
+
+def run(args) -> bool:
+    """執行大量推論"""
+    from ultralytics import YOLO
+
+    source = Path(args.source).resolve()
+    if not source.is_dir():
+        print(f"[✗] 找不到圖片目錄: {args.source}")
+        return False
+    if not Path(args.weights).exists():
+        print(f"[✗] 找不到模型檔: {args.weights}")
+        return False
+
+    output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'jsonl')
+    writer = (ParquetWriter if output_format == 'parquet' else JsonlWriter)(Path(args.output))
+
+    done = set() if args.overwrite else writer.completed()
+    if done:
+        print(f"[續跑] 已完成 {len(done)} 張，跳過")
+
+    print(f"[載入] 模型: {args.weights}")
+    model = YOLO(args.weights)
+    class_names = {int(k): v for k, v in model.names.items()}
+
+    paths = (str(source / name) for name in iter_images(source) if name not in done)
+
+    writer.open(args.overwrite)
+    processed = failed = detections = 0
+    start = last_report = time.perf_counter()
+
+    print(f"[開始] {source} → {args.output} ({output_format}), "
+          f"batch={args.batch}, workers={args.workers}, imgsz={args.imgsz}")
+
+    try:
+        with Pool(args.workers, initializer=_init_worker, initargs=(args.imgsz,)) as pool:
+            for batch in prefetch_batches(pool, paths, args.batch, args.prefetch):
+                ok = [item for item in batch if 'error' not in item]
+                rows = [
+                    {'path': str(Path(item['path']).relative_to(source)), 'error': item['error']}
+                    for item in batch if 'error' in item
+                ]
+
+                if ok:
+                    results = model(
+                        [item['image'] for item in ok],
+                        imgsz=args.imgsz,
+                        conf=args.conf,
+                        iou=args.iou,
+                        device=args.device,
+                        verbose=False
+                    )
+                    rows.extend(to_rows(ok, results, source, args.imgsz, class_names))
+
+                writer.write(rows)
+                processed += len(batch)
+                failed += len(batch) - len(ok)
+                detections += sum(len(row.get('detections', [])) for row in rows)
+
+                now = time.perf_counter()
+                if now - last_report >= args.report_every:
+                    print(f"[進度] {processed} 張，{processed / (now - start):.1f} images/sec，失敗 {failed} 張")
+                    last_report = now
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print("=" * 60)
+    print(f"[✓] 完成 {processed} 張（失敗 {failed} 張），偵測 {detections} 個物件")
+    print(f"    耗時 {elapsed:.1f} 秒，{processed / elapsed if elapsed > 0 else 0:.1f} images/sec")
+    print("=" * 60)
+    return True
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='YOLO 離線大量推論')
+    parser.add_argument('--source', type=str, required=True,
+                        help='圖片目錄（遞迴處理子目錄）')
+    parser.add_argument('--output', type=str, required=True,
+                        help='輸出路徑：JSONL 檔，或 Parquet 目錄')
+    parser.add_argument('--format', type=str, default=None, choices=['jsonl', 'parquet'],
+                        help='輸出格式（預設依副檔名判斷，.parquet 為 Parquet，其餘為 JSONL）')
+    parser.add_argument('--weights', type=str, default='runs/train/exp/weights/best.pt',
+                        help='模型權重檔路徑')
+    parser.add_argument('--imgsz', type=int, default=640,
+                        help='模型輸入尺寸')
+    parser.add_argument('--batch', type=int, default=16,
+                        help='每次推論的圖片數')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='預先解碼的行程數')
+    parser.add_argument('--prefetch', type=int, default=4,
+                        help='最多預先解碼的批次數')
+    parser.add_argument('--conf', type=float, default=0.25,
+                        help='信心度閾值')
+    parser.add_argument('--iou', type=float, default=0.45,
+                        help='NMS IOU 閾值')
+    parser.add_argument('--device', type=str, default=None,
+                        help='推論裝置（cpu / mps / 0，預設自動選擇）')
+    parser.add_argument('--report-every', type=float, default=10.0,
+                        help='每幾秒輸出一次進度')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='忽略既有輸出重新開始（預設從上次中斷處繼續）')
+    args = parser.parse_args()
+
+    if not run(args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,19 @@ YOLO Training Script with MPS (Apple Silicon) Support
 import torch
 from ultralytics import YOLO
 import sys
+import os
+import csv
+import json
+import time
+import shutil
+import platform
+import importlib.util
 import argparse
+from datetime import datetime
 from pathlib import Path
 
+import numpy as np
+
 
 def check_mps_availability():
     """檢查 MPS (Metal Performance Shaders) 是否可用"""
@@ -234,13 +244,18 @@ def train_model(
         return False
 
 
-def validate_model(model_path: str, data_yaml: str = 'config/data.yaml'):
+def validate_model(model_path: str, data_yaml: str = 'config/data.yaml', device: str = None, imgsz: int = None):
     """
     驗證模型效能
 
     Args:
-        model_path: 模型權重檔路徑
+        model_path: 模型權重檔路徑（.pt 或匯出的模型目錄）
         data_yaml: 資料配置檔路徑
+        device: 推論裝置（預設自動選擇 MPS / CPU）
+        imgsz: 驗證輸入尺寸（預設沿用訓練設定）
+
+    Returns:
+        成功時回傳 {'map50', 'map50_95'}，失敗時回傳 False
     """
     print("\n" + "=" * 60)
     print("模型驗證")
@@ -254,15 +269,17 @@ def validate_model(model_path: str, data_yaml: str = 'config/data.yaml'):
     try:
         # 載入模型
         print(f"\n[載入] 模型: {model_path}")
-        model = YOLO(model_path)
+        model = YOLO(model_path, task='detect')
 
         # 檢測裝置
-        device = 'mps' if torch.backends.mps.is_available() else 'cpu'
+        if device is None:
+            device = 'mps' if torch.backends.mps.is_available() else 'cpu'
         print(f"[裝置] 使用: {device}")
 
         # 執行驗證
         print(f"\n[驗證中]...\n")
-        metrics = model.val(data=data_yaml, device=device)
+        val_args = {'imgsz': imgsz} if imgsz else {}
+        metrics = model.val(data=data_yaml, device=device, **val_args)
 
         print("\n" + "=" * 60)
         print("驗證結果")
@@ -270,19 +287,316 @@ def validate_model(model_path: str, data_yaml: str = 'config/data.yaml'):
         print(f"mAP50: {metrics.box.map50:.4f}")
         print(f"mAP50-95: {metrics.box.map:.4f}")
 
-        return True
+        return {'map50': float(metrics.box.map50), 'map50_95': float(metrics.box.map)}
 
     except Exception as e:
         print(f"\n[✗] 驗證失敗: {e}")
         return False
 
 
+def parse_int_list(value: str):
+    """解析以逗號分隔的整數列表，例如 "1,4,8" """
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def default_thread_counts():
+    """預設的執行緒數掃描範圍：1、一半核心、全部核心"""
+    cpus = os.cpu_count() or 1
+    return sorted({1, max(1, cpus // 2), cpus})
+
+
+def machine_info():
+    """記錄測試機器資訊，讓不同機型的結果可以並列比較"""
+    return {
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'timestamp': datetime.now().isoformat(timespec='seconds')
+    }
+
+
+def time_inference(model, images, imgsz: int, warmup: int, repeat: int):
+    """
+    量測單一設定的暖機後延遲
+
+    Returns:
+        每次呼叫（整個批次）的延遲列表（毫秒），以及最後一次的各階段平均耗時（每張圖片）
+    """
+    for _ in range(warmup):
+        model(images, imgsz=imgsz, device='cpu', verbose=False)
+
+    latencies = []
+    speed = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = model(images, imgsz=imgsz, device='cpu', verbose=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+        speed = results[0].speed
+
+    return latencies, speed
+
+
+def benchmark_inference(
+    weights: str,
+    batch_sizes,
+    imgsz_list,
+    thread_counts,
+    backends=None,
+    warmup: int = 3,
+    repeat: int = 10,
+    output: str = None
+):
+    """
+    CPU 推論效能矩陣：掃描後端 × 輸入尺寸 × 批次大小 × 執行緒數
+
+    每個設定先暖機再重複量測，記錄延遲中位數 / p95 與吞吐量。
+    執行緒數只對 PyTorch 後端有效（torch.set_num_threads）；
+    ONNX Runtime / OpenVINO 使用各自的預設執行緒設定，只量測一次。
+
+    Args:
+        weights: .pt 權重檔路徑
+        batch_sizes: 批次大小列表
+        imgsz_list: 輸入尺寸列表
+        thread_counts: PyTorch intra-op 執行緒數列表
+        backends: 要測試的後端（預設為目前環境全部可用的後端）
+        warmup: 每個設定的暖機次數
+        repeat: 每個設定的量測次數
+        output: 結果 JSON 路徑（同時寫出同名 .csv）
+    """
+    print("\n" + "=" * 60)
+    print("推論效能基準測試 (CPU)")
+    print("=" * 60)
+
+    # 只給檔名（如 yolo11n.pt）時由 ultralytics 自動下載
+    if Path(weights).parent != Path('.') and not Path(weights).exists():
+        print(f"[✗] 找不到模型檔: {weights}")
+        return False
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'api'))
+    from backends import BACKEND_TORCH, available_backends, load_backend
+
+    backends = backends or available_backends()
+    info = machine_info()
+    print(f"\n[機器] {info['processor']}，{info['cpu_count']} 核心")
+    print(f"[模型] {weights}")
+    print(f"[掃描] 後端 {backends}，imgsz {imgsz_list}，batch {batch_sizes}，執行緒 {thread_counts}")
+    print(f"[量測] 暖機 {warmup} 次，重複 {repeat} 次\n")
+
+    rng = np.random.default_rng(0)
+    original_threads = torch.get_num_threads()
+    rows = []
+
+    try:
+        for backend in backends:
+            try:
+                model = load_backend(weights, backend, imgsz=max(imgsz_list))
+            except Exception as e:
+                print(f"[✗] 後端 {backend} 載入失敗，略過: {e}")
+                continue
+
+            threads_sweep = thread_counts if backend == BACKEND_TORCH else [None]
+
+            for imgsz in imgsz_list:
+                for batch in batch_sizes:
+                    images = [
+                        rng.integers(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)
+                        for _ in range(batch)
+                    ]
+                    for threads in threads_sweep:
+                        if threads is not None:
+                            torch.set_num_threads(threads)
+
+                        latencies, speed = time_inference(model, images, imgsz, warmup, repeat)
+                        p50 = float(np.median(latencies))
+                        row = {
+                            'backend': backend,
+                            'imgsz': imgsz,
+                            'batch': batch,
+                            'threads': threads if threads is not None else 'auto',
+                            'latency_p50_ms': round(p50, 2),
+                            'latency_p95_ms': round(float(np.percentile(latencies, 95)), 2),
+                            'latency_std_ms': round(float(np.std(latencies)), 2),
+                            'per_image_ms': round(p50 / batch, 2),
+                            'throughput_ips': round(batch * 1000 / p50, 2),
+                            'preprocess_ms': round(speed.get('preprocess', 0.0), 2),
+                            'inference_ms': round(speed.get('inference', 0.0), 2),
+                            'postprocess_ms': round(speed.get('postprocess', 0.0), 2)
+                        }
+                        rows.append(row)
+                        print(f"[✓] {backend:<12} imgsz={imgsz:<5} batch={batch:<3} threads={row['threads']:<5} "
+                              f"p50={row['latency_p50_ms']:>8.1f} ms  {row['throughput_ips']:>7.1f} img/s")
+    finally:
+        torch.set_num_threads(original_threads)
+
+    if not rows:
+        print("[✗] 沒有任何設定完成測試")
+        return False
+
+    print_benchmark_table(rows)
+
+    if output:
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({'machine': info, 'weights': weights, 'results': rows},
+                                     indent=2, ensure_ascii=False))
+        with open(output.with_suffix('.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"\n[✓] 結果已寫入 {output} 與 {output.with_suffix('.csv')}")
+
+    return True
+
+
+def print_benchmark_table(rows):
+    """印出結果表與建議的服務設定（各 imgsz 的最低延遲與最高吞吐量）"""
+    print("\n" + "=" * 92)
+    print(f"{'後端':<12} {'imgsz':>6} {'batch':>6} {'執行緒':>6} {'p50(ms)':>9} {'p95(ms)':>9} "
+          f"{'每張(ms)':>9} {'img/s':>8} {'推論(ms)':>9}")
+    print("=" * 92)
+    for row in rows:
+        print(f"{row['backend']:<12} {row['imgsz']:>6} {row['batch']:>6} {str(row['threads']):>6} "
+              f"{row['latency_p50_ms']:>9.1f} {row['latency_p95_ms']:>9.1f} {row['per_image_ms']:>9.1f} "
+              f"{row['throughput_ips']:>8.1f} {row['inference_ms']:>9.1f}")
+    print("=" * 92)
+
+    print("\n建議設定：")
+    for imgsz in sorted({row['imgsz'] for row in rows}):
+        candidates = [row for row in rows if row['imgsz'] == imgsz]
+        fastest = min(candidates, key=lambda r: r['latency_p50_ms'])
+        busiest = max(candidates, key=lambda r: r['throughput_ips'])
+        print(f"  imgsz={imgsz}: 最低延遲 {fastest['backend']} batch={fastest['batch']} "
+              f"threads={fastest['threads']} ({fastest['latency_p50_ms']:.1f} ms)；"
+              f"最高吞吐 {busiest['backend']} batch={busiest['batch']} "
+              f"threads={busiest['threads']} ({busiest['throughput_ips']:.1f} img/s)")
+
+
+def quantize_model(
+    weights: str,
+    data_yaml: str = 'config/data.yaml',
+    imgsz: int = 640,
+    calib_fraction: float = 0.25,
+    max_map_drop: float = 0.01,
+    warmup: int = 3,
+    repeat: int = 20
+):
+    """
+    訓練後 INT8 量化（OpenVINO + NNCF），附精度把關
+
+    1. 以 data.yaml 訓練集的部分圖片校正，匯出 <stem>_int8_openvino_model/
+    2. 以 validate_model 在 CPU 上分別驗證 FP32 (.pt) 與 INT8 模型
+    3. mAP50 或 mAP50-95 下降超過 max_map_drop（絕對值）時刪除 INT8 模型並視為失敗
+    4. 量測單張圖片的 CPU 延遲並回報加速倍數
+
+    報告寫到權重檔旁的 <stem>_int8_report.json。
+
+    Args:
+        weights: 訓練好的 .pt 權重檔
+        data_yaml: 資料配置檔路徑（校正用訓練集、驗證用驗證集）
+        imgsz: 輸入尺寸
+        calib_fraction: 用於校正的訓練集比例
+        max_map_drop: 容許的 mAP 下降（絕對值，0.01 = 1 個百分點）
+        warmup: 延遲量測的暖機次數
+        repeat: 延遲量測的重複次數
+
+    Returns:
+        INT8 模型通過精度把關時回傳 True
+    """
+    print("\n" + "=" * 60)
+    print("INT8 量化")
+    print("=" * 60)
+
+    weights_path = Path(weights)
+    if not weights_path.exists():
+        print(f"[✗] 找不到模型檔: {weights}")
+        return False
+    if not Path(data_yaml).exists():
+        print(f"[✗] 找不到資料配置檔: {data_yaml}")
+        return False
+
+    for module in ('openvino', 'nncf'):
+        if importlib.util.find_spec(module) is None:
+            print(f"[✗] INT8 量化需要安裝 {module} 套件: pip install openvino nncf")
+            return False
+
+    # 1. 校正並匯出
+    print(f"\n[量化] 以訓練集 {calib_fraction:.0%} 的圖片校正: {data_yaml}")
+    try:
+        artifact = Path(YOLO(weights).export(
+            format='openvino',
+            int8=True,
+            data=data_yaml,
+            split='train',
+            fraction=calib_fraction,
+            imgsz=imgsz,
+            dynamic=True,
+            verbose=False
+        ))
+    except Exception as e:
+        print(f"[✗] 量化失敗: {e}")
+        return False
+    print(f"[✓] INT8 模型: {artifact}")
+
+    # 2. 以相同的驗證流程比較精度（都在 CPU 上，排除裝置差異）
+    fp32 = validate_model(weights, data_yaml, device='cpu', imgsz=imgsz)
+    int8 = validate_model(str(artifact), data_yaml, device='cpu', imgsz=imgsz)
+    if not fp32 or not int8:
+        print("[✗] 驗證失敗，無法比較精度")
+        return False
+
+    drops = {key: fp32[key] - int8[key] for key in ('map50', 'map50_95')}
+    accepted = all(drop <= max_map_drop for drop in drops.values())
+
+    # 3. CPU 延遲
+    image = [np.random.default_rng(0).integers(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)]
+    fp32_latency, _ = time_inference(YOLO(weights), image, imgsz, warmup, repeat)
+    int8_latency, _ = time_inference(YOLO(str(artifact), task='detect'), image, imgsz, warmup, repeat)
+    fp32_ms = float(np.median(fp32_latency))
+    int8_ms = float(np.median(int8_latency))
+
+    print("\n" + "=" * 60)
+    print("量化結果")
+    print("=" * 60)
+    print(f"{'':<12} {'FP32':>10} {'INT8':>10} {'下降':>10}")
+    print(f"{'mAP50':<12} {fp32['map50']:>10.4f} {int8['map50']:>10.4f} {drops['map50']:>10.4f}")
+    print(f"{'mAP50-95':<12} {fp32['map50_95']:>10.4f} {int8['map50_95']:>10.4f} {drops['map50_95']:>10.4f}")
+    print(f"{'延遲 (ms)':<12} {fp32_ms:>10.1f} {int8_ms:>10.1f} {fp32_ms / int8_ms:>9.2f}x")
+
+    report = {
+        'weights': str(weights_path),
+        'artifact': str(artifact),
+        'data': data_yaml,
+        'imgsz': imgsz,
+        'calib_fraction': calib_fraction,
+        'max_map_drop': max_map_drop,
+        'fp32': {**fp32, 'latency_p50_ms': round(fp32_ms, 2)},
+        'int8': {**int8, 'latency_p50_ms': round(int8_ms, 2)},
+        'map_drop': drops,
+        'speedup': round(fp32_ms / int8_ms, 2),
+        'accepted': accepted,
+        'machine': machine_info()
+    }
+    report_path = weights_path.parent / f"{weights_path.stem}_int8_report.json"
+    report_path.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if not accepted:
+        shutil.rmtree(artifact, ignore_errors=True)
+        print(f"\n[✗] mAP 下降超過 {max_map_drop:.4f}，已刪除 INT8 模型（報告: {report_path}）")
+        return False
+
+    print(f"\n[✓] INT8 模型通過精度把關: {artifact}（報告: {report_path}）")
+    return True
+
+
 def main():
     """主程式"""
     parser = argparse.ArgumentParser(description='YOLO 訓練腳本')
     parser.add_argument('--mode', type=str, default='test',
-                       choices=['test', 'train', 'validate'],
-                       help='執行模式: test(測試環境) / train(訓練) / validate(驗證)')
+                       choices=['test', 'train', 'validate', 'bench', 'quantize'],
+                       help='執行模式: test(測試環境) / train(訓練) / validate(驗證) / '
+                            'bench(推論效能測試) / quantize(INT8 量化)')
     parser.add_argument('--data', type=str, default='config/data.yaml',
                        help='資料配置檔路徑')
     parser.add_argument('--model', type=str, default='n',
@@ -296,7 +610,25 @@ def main():
     parser.add_argument('--augment', action='store_true',
                        help='啟用強化資料增強（適合小資料集）')
     parser.add_argument('--weights', type=str, default=None,
-                       help='驗證用的模型權重檔路徑')
+                       help='驗證 / 效能測試 / 量化用的模型權重檔路徑')
+    parser.add_argument('--bench-batch', type=str, default='1,4,8',
+                       help='效能測試的批次大小列表（逗號分隔）')
+    parser.add_argument('--bench-imgsz', type=str, default=None,
+                       help='效能測試的輸入尺寸列表（逗號分隔，預設為 --imgsz）')
+    parser.add_argument('--bench-threads', type=str, default=None,
+                       help='效能測試的 PyTorch 執行緒數列表（預設 1、一半核心、全部核心）')
+    parser.add_argument('--bench-backends', type=str, default=None,
+                       help='效能測試的後端列表（預設為全部可用後端）')
+    parser.add_argument('--warmup', type=int, default=3,
+                       help='效能測試 / 量化延遲量測的暖機次數')
+    parser.add_argument('--repeat', type=int, default=10,
+                       help='效能測試 / 量化延遲量測的重複次數')
+    parser.add_argument('--calib-fraction', type=float, default=0.25,
+                       help='INT8 量化時用於校正的訓練集比例')
+    parser.add_argument('--max-map-drop', type=float, default=0.01,
+                       help='INT8 量化容許的 mAP50 / mAP50-95 下降（絕對值）')
+    parser.add_argument('--bench-output', type=str, default=None,
+                       help='效能測試結果 JSON 路徑（預設 runs/bench/<主機名稱>.json）')
 
     args = parser.parse_args()
 
@@ -346,6 +678,38 @@ def main():
         if not success:
             sys.exit(1)
 
+    elif args.mode == 'bench':
+        # 推論效能測試模式
+        success = benchmark_inference(
+            weights=args.weights or f'yolo11{args.model}.pt',
+            batch_sizes=parse_int_list(args.bench_batch),
+            imgsz_list=parse_int_list(args.bench_imgsz) if args.bench_imgsz else [args.imgsz],
+            thread_counts=parse_int_list(args.bench_threads) if args.bench_threads else default_thread_counts(),
+            backends=args.bench_backends.split(',') if args.bench_backends else None,
+            warmup=args.warmup,
+            repeat=args.repeat,
+            output=args.bench_output or f'runs/bench/{platform.node() or "local"}.json'
+        )
+        if not success:
+            sys.exit(1)
+
+    elif args.mode == 'quantize':
+        # INT8 量化模式
+        if args.weights is None:
+            print("[✗] 請使用 --weights 指定模型權重檔")
+            sys.exit(1)
+        success = quantize_model(
+            weights=args.weights,
+            data_yaml=args.data,
+            imgsz=args.imgsz,
+            calib_fraction=args.calib_fraction,
+            max_map_drop=args.max_map_drop,
+            warmup=args.warmup,
+            repeat=args.repeat
+        )
+        if not success:
+            sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
@@ -24,9 +24,14 @@ fi
 echo "✅ 環境檢查完成"
 echo ""
 
-# 啟動後端 API
-echo "🔧 啟動後端 API (Port 8000)..."
-~/miniforge3/envs/YOLO_env/bin/uvicorn src.api.main:app --host 0.0.0.0 --port 8000 > logs/api.log 2>&1 &
+# 啟動後端 API（API_WORKERS > 1 時由父行程預先載入模型並 fork 多個 worker 共用權重）
+API_WORKERS=${API_WORKERS:-1}
+echo "🔧 啟動後端 API (Port 8000, workers: $API_WORKERS)..."
+if [ "$API_WORKERS" -gt 1 ]; then
+    ~/miniforge3/envs/YOLO_env/bin/python src/api/serve.py --workers "$API_WORKERS" --host 0.0.0.0 --port 8000 > logs/api.log 2>&1 &
+else
+    ~/miniforge3/envs/YOLO_env/bin/uvicorn src.api.main:app --host 0.0.0.0 --port 8000 > logs/api.log 2>&1 &
+fi
 API_PID=$!
 sleep 3
 
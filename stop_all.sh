@@ -18,6 +18,7 @@ if [ -f .api.pid ]; then
 else
     echo "🔧 停止所有 uvicorn 進程..."
     pkill -f "uvicorn src.api.main:app"
+    pkill -f "src/api/serve.py"
 fi
 
 # 停止前端服務